@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.ACCRETION_PARITY
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+import numpy as np
+from voronoi.accretion import accretion
+from voronoi.bin_roundness import bin_roundness
+from accretion_scaling import field
+
+
+def original_accretion(x, y, signal, noise, targetsn, pixelsize):
+
+    """
+    The bin accretion as it was before the spatial index and running bin
+    statistics: every candidate and every new bin seed is found by a scan
+    over all the unbinned pixels, and centroids are means over the pixels.
+
+    INPUTS
+      x         : x coordinates of pixels to bin
+      y         : y coordinates of pixels to bin
+      signal    : signal associated with each pixel
+      noise     : noise (1-sigma error) associated with each pixel
+      targetsn  : desired signal-to-noise ration in final 2d-binned data
+      pixelsize : pixel scale of the input data
+    """
+
+    n = x.size
+    clas = np.zeros(n, dtype="<i8")
+    good = np.zeros(n, dtype="<i8")
+
+    sn = (signal/noise).max()
+    currentbin = (signal/noise).argmax()
+
+    for ind in range(1, n+1):
+
+        clas[currentbin] = ind
+        xbar = x[currentbin]
+        ybar = y[currentbin]
+
+        while True:
+
+            unbinned = np.where(clas == 0)[0]
+            if unbinned.size == 0: break
+
+            dist = (x[unbinned]-xbar)**2 + (y[unbinned]-ybar)**2
+            k = dist.argmin()
+            mindist = ((x[currentbin]-x[unbinned[k]])**2
+                + (y[currentbin]-y[unbinned[k]])**2).min()
+
+            nextbin = np.append(currentbin, unbinned[k])
+            roundness = bin_roundness(x[nextbin], y[nextbin], pixelsize)
+            snold = sn
+            sn = signal[nextbin].sum()/np.sqrt((noise[nextbin]**2).sum())
+
+            if np.sqrt(mindist) > 1.2*pixelsize or roundness > 0.3 \
+                or abs(sn-targetsn) > abs(snold-targetsn):
+                if snold > 0.8*targetsn:
+                    good[currentbin] = 1
+                break
+
+            clas[unbinned[k]] = ind
+            currentbin = nextbin
+            xbar = x[currentbin].mean()
+            ybar = y[currentbin].mean()
+
+        binned = np.where(clas != 0)[0]
+        unbinned = np.where(clas == 0)[0]
+        if unbinned.size == 0: break
+        xbar = x[binned].mean()
+        ybar = y[binned].mean()
+
+        k = ((x[unbinned]-xbar)**2 + (y[unbinned]-ybar)**2).argmin()
+        currentbin = unbinned[k]
+        sn = signal[currentbin]/noise[currentbin]
+
+    return clas*good
+
+
+def hexagonal(side, angle=0.):
+
+    """
+    Synthetic hexagonal lattice of side x side unit pixels, rotated by angle,
+    with a centrally peaked signal: the many equidistant pixels around the
+    centre make the accretion choose between near-ties.
+
+    INPUTS
+      side : number of pixels along each side of the field
+
+    OPTIONS
+      angle : rotation of the lattice in radians [default 0]
+    """
+
+    i, j = np.meshgrid(np.arange(side), np.arange(side))
+    x = (i + 0.5*(j % 2)).ravel().astype(float)
+    y = (j*np.sqrt(3)/2).ravel()
+    c = np.cos(angle)
+    s = np.sin(angle)
+    x, y = c*x - s*y, s*x + c*y
+    r = np.hypot(x-x.mean(), y-y.mean())
+    signal = 100*np.exp(-r/(side/6.)) + 1
+    noise = np.sqrt(signal) + 1
+    return x, y, signal, noise
+
+
+def accretion_parity(side=50, targetsn=10.):
+
+    """
+    Compares the bin numbers given by accretion with those of the original
+    routine on a square grid and on straight and rotated hexagonal lattices,
+    and prints the number of pixels binned differently.  Returns True if
+    there are none.
+
+    OPTIONS
+      side     : number of pixels along each side of the fields [default 50]
+      targetsn : target S/N [default 10]
+    """
+
+    fields = [("square", field(side)), ("hexagonal", hexagonal(side)),
+        ("rotated", hexagonal(side, 0.3))]
+
+    print("{:>10s} {:>7s} {:>7s} {:>9s} {:>9s}".format("lattice", "nbin",
+        "differ", "orig (s)", "new (s)"))
+    same = True
+    for name, (x, y, signal, noise) in fields:
+        t = time.time()
+        old = original_accretion(x, y, signal, noise, targetsn, 1.)
+        told = time.time() - t
+        t = time.time()
+        new = accretion(x, y, signal, noise, targetsn, pixelsize=1.,
+            quiet=True)
+        tnew = time.time() - t
+        differ = (new != old).sum()
+        same &= differ == 0
+        print("{:>10s} {:7d} {:7d} {:9.2f} {:9.2f}".format(name, new.max(),
+            differ, told, tnew))
+
+    return same
+
+
+if __name__ == "__main__":
+    sys.exit(0 if accretion_parity(*[int(a) for a in sys.argv[1:2]]) else 1)
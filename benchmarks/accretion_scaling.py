@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.ACCRETION_SCALING
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+import numpy as np
+from voronoi.accretion import accretion
+
+
+def field(side, seed=0):
+    
+    """
+    Synthetic square field of side x side unit pixels with a centrally
+    peaked signal and unit noise.
+    
+    INPUTS
+      side : number of pixels along each side of the field
+    
+    OPTIONS
+      seed : random seed for the signal noise [default 0]
+    """
+    
+    rng = np.random.RandomState(seed)
+    y, x = np.indices((side, side)).astype(float)
+    r = np.hypot(x-side/2., y-side/2.)
+    signal = 10*np.exp(-r**2/2/(side/6.)**2) + 0.3
+    signal += rng.normal(size=signal.shape)*0.1
+    noise = np.ones_like(signal)
+    return x.ravel(), y.ravel(), signal.ravel(), noise.ravel()
+
+
+def accretion_scaling(sides=(32, 64, 128, 256, 512), targetsn=20.):
+    
+    """
+    Times the bin-accretion stage on synthetic fields of increasing size.
+    The pixel size is passed in, so only the accretion itself is timed.
+    
+    OPTIONS
+      sides    : field sizes (pixels along each side) to time
+      targetsn : target S/N [default 20]
+    """
+    
+    print("{:>9s} {:>7s} {:>10s} {:>12s}".format("npix", "nbin", "time (s)",
+        "us / pixel"))
+    for side in sides:
+        x, y, signal, noise = field(side)
+        t = time.time()
+        clas = accretion(x, y, signal, noise, targetsn, pixelsize=1.,
+            quiet=True)
+        t = time.time() - t
+        print("{:9d} {:7d} {:10.3f} {:12.2f}".format(x.size, clas.max(), t,
+            t/x.size*1e6))
+
+
+if __name__ == "__main__":
+    sides = [int(s) for s in sys.argv[1:]] or (32, 64, 128, 256, 512)
+    accretion_scaling(sides)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.IMPORT_TIME
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import subprocess
+import numpy as np
+
+
+# run in a fresh interpreter: import the package, optionally with matplotlib
+# made unimportable, and report the wall time and whether pyplot was loaded
+PROBE = """
+import sys, time
+if {block}:
+    class Block(object):
+        def find_spec(self, name, path=None, target=None):
+            if name.split(".")[0] == "matplotlib":
+                raise ImportError("matplotlib blocked")
+    sys.meta_path.insert(0, Block())
+t = time.perf_counter()
+import voronoi
+t = time.perf_counter() - t
+print(t, "matplotlib.pyplot" in sys.modules, "matplotlib" in sys.modules)
+"""
+
+
+def import_time(repeat=10, block=False):
+
+    """
+    Times "import voronoi" in fresh interpreters, as paid by every short
+    lived worker process.  Returns the median and minimum import times in
+    seconds and whether matplotlib was loaded by the import.
+
+    OPTIONS
+      repeat : number of interpreters to time [default 10]
+      block  : make matplotlib unimportable, as on a node without it
+               [default False]
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep
+        + os.environ.get("PYTHONPATH", ""))
+    times = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(block=block)],
+            env=env, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[2] == "True"
+
+    return np.median(times), np.min(times), loaded
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print("{:>22s} {:>12s} {:>12s} {:>11s}".format("", "median (ms)",
+        "min (ms)", "matplotlib"))
+    for block in (False, True):
+        median, best, loaded = import_time(repeat, block=block)
+        print("{:>22s} {:12.1f} {:12.1f} {:>11s}".format(
+            "without matplotlib" if block else "import voronoi",
+            median*1e3, best*1e3, "loaded" if loaded else "not loaded"))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.PREBIN_QUALITY
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+import numpy as np
+from voronoi.bin2d import bin2d
+from voronoi.superpixels import Superpixels
+from stage_timings import synthetic_field
+
+
+def faint_field(npix, layout="regular", seed=0):
+
+    """
+    Synthetic field of about npix pixels with a bright centre and faint
+    outskirts, where single pixels have S/N of about 0.3 and bins need
+    thousands of them.  Returns x, y, signal, noise and the target S/N.
+
+    INPUTS
+      npix : approximate number of pixels
+
+    OPTIONS
+      layout : layout of the pixels (see synthetic_field) [default "regular"]
+      seed   : random seed [default 0]
+    """
+
+    x, y, signal, noise, targetsn = synthetic_field(npix, layout, seed=seed)
+    r = np.hypot(x-x.mean(), y-y.mean())
+    signal = 40*np.exp(-r/(0.1*r.max())) + 0.3 \
+        + np.random.RandomState(seed).normal(size=x.size)*0.1
+
+    return x, y, signal, noise, targetsn
+
+
+def prebin_quality(sizes=(10**4, 4*10**4), layouts=("regular", "irregular"),
+    fractions=(0.2, 0.3, 0.5), wvt=False, maxiter=None):
+
+    """
+    Bins faint fields at full resolution and with the prebin option of bin2d
+    at several superpixel S/N fractions, and prints, for each, the number
+    of points binned, the time, the number of bins, the number of
+    single-pixel bins and the fractional S/N scatter (%) of the other bins,
+    so that the speedup can be weighed against the quality of the bins.
+
+    OPTIONS
+      sizes     : approximate numbers of pixels of the fields
+      layouts   : layouts of the fields (see synthetic_field)
+      fractions : values of the prebin option
+      wvt       : use the WVT modification [default False]
+      maxiter   : maximum number of CVT iterations [default no limit]
+    """
+
+    print("{:>9s} {:>6s} {:>8s} {:>7s} {:>8s} {:>8s} {:>6s} {:>6s} "
+        "{:>8s}".format("layout", "npix", "prebin", "points", "time (s)",
+        "speedup", "nbin", "single", "scatter"))
+    for npix in sizes:
+        for layout in layouts:
+            x, y, signal, noise, targetsn = faint_field(npix, layout)
+            reference = None
+            for prebin in (False,) + tuple(fractions):
+                points = x.size if not prebin else len(Superpixels(x, y,
+                    signal, noise, targetsn, fraction=prebin))
+                t = time.time()
+                result = bin2d(x, y, signal, noise.copy(), targetsn, wvt=wvt,
+                    graphs=False, maxiter=maxiter, prebin=prebin)
+                t = time.time() - t
+                if reference is None: reference = t
+                binned = result.area > 1
+                print("{:>9s} {:6d} {:>8s} {:7d} {:8.2f} {:7.1f}x {:6d} "
+                    "{:6d} {:7.2f}%".format(layout, x.size, str(prebin),
+                    points, t, reference/t, result.nbin,
+                    int((~binned).sum()), ((result.sn[binned]-targetsn)
+                    /targetsn*100).std()))
+
+
+if __name__ == "__main__":
+    sizes = [int(float(s)) for s in sys.argv[1:]] or [10**4, 4*10**4]
+    for wvt in (False, True):
+        print("wvt={:}".format(wvt))
+        prebin_quality(sizes, wvt=wvt)
+        print("")
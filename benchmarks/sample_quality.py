@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.SAMPLE_QUALITY
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+from voronoi.bin2d import bin2d
+from voronoi.subsample import Subsample
+from stage_timings import synthetic_field
+from prebin_quality import faint_field
+
+
+def sample_quality(sizes=(10**4, 4*10**4), fields=("peaked", "flat", "faint"),
+    fractions=(0.5, 0.25, 0.1), wvt=False, maxiter=None):
+
+    """
+    Bins fields exactly and in the approximate mode of bin2d (the sample
+    option) at several sample fractions, and prints, for each, the number
+    of pixels the accretion and CVT ran on, the time, the speedup, the
+    number of bins and the fractional S/N scatter (%) of the bins, next to
+    that of the exact mode, so that the speed gained can be weighed against
+    the uniformity of the bins lost.
+
+    OPTIONS
+      sizes     : approximate numbers of pixels of the fields
+      fields    : "peaked" and "flat" fields of synthetic_field, and
+                  "faint" fields of faint_field, all on a regular grid
+      fractions : values of the sample option
+      wvt       : use the WVT modification [default False]
+      maxiter   : maximum number of CVT iterations [default no limit]
+    """
+
+    print("{:>7s} {:>6s} {:>7s} {:>7s} {:>8s} {:>8s} {:>6s} {:>8s} "
+        "{:>8s}".format("field", "npix", "sample", "points", "time (s)",
+        "speedup", "nbin", "scatter", "exact"))
+    for npix in sizes:
+        for name in fields:
+            if name == "faint":
+                x, y, signal, noise, targetsn = faint_field(npix)
+            else:
+                x, y, signal, noise, targetsn = synthetic_field(npix,
+                    profile=name)
+            reference = None
+            for sample in (None,) + tuple(fractions):
+                points = x.size if sample is None else len(Subsample(x, y,
+                    signal, noise, targetsn, fraction=sample))
+                t = time.time()
+                result = bin2d(x, y, signal, noise, targetsn, wvt=wvt,
+                    graphs=False, maxiter=maxiter, sample=sample)
+                t = time.time() - t
+                scatter = result.scatter
+                if reference is None: reference = t, scatter
+                print("{:>7s} {:6d} {:>7s} {:7d} {:8.2f} {:7.1f}x {:6d} "
+                    "{:7.2f}% {:7.2f}%".format(name, x.size, str(sample),
+                    points, t, reference[0]/t, result.nbin, scatter,
+                    reference[1]))
+
+
+if __name__ == "__main__":
+    sizes = [int(float(s)) for s in sys.argv[1:]] or [10**4, 4*10**4]
+    for wvt in (False, True):
+        print("wvt={:}".format(wvt))
+        sample_quality(sizes, wvt=wvt)
+        print("")
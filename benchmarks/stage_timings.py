@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.STAGE_TIMINGS
+# -----------------------------------------------------------------------------
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+import scipy
+from voronoi.accretion import accretion
+from voronoi.reassign_bad_bins import reassign_bad_bins
+from voronoi.cvt_equal_mass import cvt_equal_mass
+from voronoi.bin_quantities import bin_quantities
+
+
+def synthetic_field(npix, layout="regular", profile="peaked", seed=0):
+
+    """
+    Synthetic field of about npix pixels of unit size, with unit noise.
+    Returns x, y, signal, noise and a target S/N that gives bins of a few
+    tens of pixels.
+
+    INPUTS
+      npix : approximate number of pixels
+
+    OPTIONS
+      layout  : "regular" for a square grid, "irregular" for a hexagonal
+                lattice of slightly jittered lenslets, as from an integral
+                field unit [default "regular"]
+      profile : "peaked" for a centrally concentrated signal, with pixels
+                above the target in the middle, "flat" for the same signal
+                everywhere [default "peaked"]
+      seed    : random seed [default 0]
+    """
+
+    rng = np.random.RandomState(seed)
+    if layout == "regular":
+        side = int(round(np.sqrt(npix)))
+        y, x = np.indices((side, side)).astype(float)
+        x = x.ravel()
+        y = y.ravel()
+    elif layout == "irregular":
+        # rows of a hexagonal lattice are sqrt(3)/2 apart
+        ny = int(round(np.sqrt(npix*np.sqrt(3)/2)))
+        nx = int(round(npix/ny))
+        y, x = np.indices((ny, nx)).astype(float)
+        x = (x + 0.5*(y % 2)).ravel() + rng.uniform(-0.02, 0.02, nx*ny)
+        y = (y*np.sqrt(3)/2).ravel() + rng.uniform(-0.02, 0.02, nx*ny)
+    else:
+        raise ValueError("unknown layout: {:}".format(layout))
+
+    if profile == "peaked":
+        r = np.hypot(x-x.mean(), y-y.mean())
+        sn = 40*np.exp(-r/(0.1*r.max())) + 1
+        targetsn = 20.
+    elif profile == "flat":
+        sn = np.full(x.size, 2.)
+        targetsn = 10.
+    else:
+        raise ValueError("unknown profile: {:}".format(profile))
+    signal = sn + rng.normal(size=x.size)*0.1
+    noise = np.ones(x.size)
+
+    return x, y, signal, noise, targetsn
+
+
+def _measure(function, memory):
+
+    # wall time of function(), and its peak traced memory in MB from a
+    # second run if memory is set (tracing slows down the run)
+    t = time.perf_counter()
+    result = function()
+    t = time.perf_counter() - t
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+
+    return result, t, peak
+
+
+def _scatter(sn, area, targetsn):
+
+    # fractional S/N scatter (%) of the bins with more than one pixel, as
+    # printed by bin2d
+    binned = area > 1
+    return float(((sn[binned]-targetsn)/targetsn*100).std())
+
+
+def stage_timings(sizes=(10**3, 10**4, 10**5, 10**6),
+    layouts=("regular", "irregular"), profiles=("peaked", "flat"),
+    memory=True, maxiter=None, quiet=False):
+
+    """
+    Times every stage of the binning separately -- accretion,
+    reassign_bad_bins, cvt_equal_mass without and with the WVT, and
+    bin_quantities -- on synthetic fields of every size, layout and
+    profile.  Returns a list of records, one per stage and field, holding
+    the field, the stage, its wall time (s), its peak memory (MB, from the
+    allocations traced in a second run) and quality figures: the number of
+    bins, the number of CVT iterations, and the fractional S/N scatter (%)
+    of the binning at that point, so that a faster stage cannot silently
+    make worse bins.
+
+    OPTIONS
+      sizes    : approximate numbers of pixels of the fields
+      layouts  : layouts of the fields (see synthetic_field)
+      profiles : S/N profiles of the fields (see synthetic_field)
+      memory   : measure the peak memory of every stage [default True]
+      maxiter  : maximum number of CVT iterations [default no limit]
+      quiet    : suppress the table of results [default False]
+    """
+
+    if not quiet:
+        print("{:>9s} {:>9s} {:>6s} {:>10s} {:>9s} {:>8s} {:>6s} {:>5s} "
+            "{:>7s}".format("layout", "profile", "npix", "stage", "time (s)",
+            "peak MB", "nbin", "iter", "scatter"))
+
+    records = []
+    for npix in sizes:
+        for layout in layouts:
+            for profile in profiles:
+
+                x, y, signal, noise, targetsn = synthetic_field(npix, layout,
+                    profile)
+                field = dict(layout=layout, profile=profile, npix=x.size,
+                    targetsn=targetsn)
+
+                def record(stage, t, peak, nbin, iters=None, scatter=None):
+                    records.append(dict(field, stage=stage, time=t,
+                        peak_mb=peak, nbin=int(nbin), iterations=iters,
+                        scatter=scatter))
+                    if not quiet:
+                        print("{:>9s} {:>9s} {:6d} {:>10s} {:9.3f} {:>8s} "
+                            "{:6d} {:>5s} {:>7s}".format(layout, profile,
+                            x.size, stage, t, "-" if peak is None else
+                            "{:.1f}".format(peak), int(nbin), "-" if iters
+                            is None else str(iters), "-" if scatter is None
+                            else "{:.2f}".format(scatter)))
+
+                clas, t, peak = _measure(lambda: accretion(x, y, signal,
+                    noise, targetsn, quiet=True), memory)
+                record("accretion", t, peak, clas.max())
+
+                (xnode, ynode), t, peak = _measure(lambda: reassign_bad_bins(
+                    x, y, signal, noise, targetsn, clas.copy()), memory)
+                sn, area = bin_quantities(x, y, signal, noise, xnode, ynode,
+                    1.)[3:]
+                record("reassign", t, peak, xnode.size,
+                    scatter=_scatter(sn, area, targetsn))
+
+                def lloyd(wvt):
+                    xn = xnode.copy()
+                    yn = ynode.copy()
+                    scale, iters = cvt_equal_mass(x, y, signal, noise, xn, yn,
+                        wvt=wvt, maxiter=maxiter)
+                    return xn, yn, scale, iters
+
+                nodes = {}
+                for wvt in (False, True):
+                    stage = "wvt" if wvt else "cvt"
+                    (xn, yn, scale, iters), t, peak = _measure(
+                        lambda: lloyd(wvt), memory)
+                    sn, area = bin_quantities(x, y, signal, noise, xn, yn,
+                        scale)[3:]
+                    nodes[stage] = xn, yn, scale
+                    record(stage, t, peak, (area > 0).sum(), iters-1,
+                        _scatter(sn, area, targetsn))
+
+                xn, yn, scale = nodes["cvt"]
+                output, t, peak = _measure(lambda: bin_quantities(x, y,
+                    signal, noise, xn, yn, scale), memory)
+                record("quantities", t, peak, (output[4] > 0).sum(),
+                    scatter=_scatter(output[3], output[4], targetsn))
+
+    return records
+
+
+def environment():
+
+    """
+    Versions and machine of the benchmark run, stored with the results.
+    """
+
+    return dict(date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(), numpy=np.__version__,
+        scipy=scipy.__version__, machine=platform.machine(),
+        processor=platform.processor(), system=platform.system())
+
+
+def compare(old, new, slower=0.2, worse=1., mintime=0.01):
+
+    """
+    Compares two result files of stage_timings, stage by stage, printing
+    the ratio of the times and the change of the S/N scatter.  Returns the
+    records of new that are more than slower (as a fraction) slower, or
+    whose scatter is more than worse (in %) higher, than in old.
+
+    INPUTS
+      old : name of the reference results file
+      new : name of the results file to check
+
+    OPTIONS
+      slower  : tolerated fractional slowdown [default 0.2]
+      worse   : tolerated increase of the S/N scatter, in % [default 1]
+      mintime : stages faster than this in both files, in seconds, are
+               too short to time reliably and are not flagged as slower
+               [default 0.01]
+    """
+
+    def load(name):
+        with open(name) as f:
+            return {(r["layout"], r["profile"], r["npix"], r["stage"]): r
+                for r in json.load(f)["results"]}
+
+    old = load(old)
+    new = load(new)
+    print("{:>9s} {:>9s} {:>7s} {:>10s} {:>9s} {:>9s} {:>7s} {:>9s}".format(
+        "layout", "profile", "npix", "stage", "old (s)", "new (s)", "ratio",
+        "scatter"))
+    regressions = []
+    for key in sorted(set(old) & set(new)):
+        a = old[key]
+        b = new[key]
+        ratio = b["time"]/a["time"] if a["time"] > 0 else np.inf
+        change = None
+        if a["scatter"] is not None and b["scatter"] is not None:
+            change = b["scatter"] - a["scatter"]
+        bad = (ratio > 1+slower and max(a["time"], b["time"]) >= mintime) \
+            or (change is not None and change > worse)
+        if bad: regressions.append(b)
+        print("{:>9s} {:>9s} {:7d} {:>10s} {:9.3f} {:9.3f} {:7.2f} {:>9s}"
+            "{:}".format(key[0], key[1], key[2], key[3], a["time"], b["time"],
+            ratio, "-" if change is None else "{:+.2f}".format(change),
+            "  <--" if bad else ""))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time the binning stages "
+        "on synthetic fields and write the results as JSON.")
+    parser.add_argument("--sizes", type=float, nargs="+",
+        default=[1e3, 1e4, 1e5, 1e6], help="numbers of pixels")
+    parser.add_argument("--layouts", nargs="+",
+        default=["regular", "irregular"])
+    parser.add_argument("--profiles", nargs="+", default=["peaked", "flat"])
+    parser.add_argument("--maxiter", type=int, default=None,
+        help="maximum number of CVT iterations")
+    parser.add_argument("--no-memory", action="store_true",
+        help="do not measure the peak memory")
+    parser.add_argument("--output", default="stage_timings.json",
+        help="results file [default stage_timings.json]")
+    parser.add_argument("--compare", metavar="OLD",
+        help="compare the results with an earlier results file")
+    args = parser.parse_args()
+
+    records = stage_timings([int(s) for s in args.sizes], args.layouts,
+        args.profiles, memory=not args.no_memory, maxiter=args.maxiter)
+    with open(args.output, "w") as f:
+        json.dump(dict(environment=environment(), results=records), f,
+            indent=1)
+    print("results written to", args.output)
+
+    if args.compare:
+        regressions = compare(args.compare, args.output)
+        sys.exit(1 if regressions else 0)
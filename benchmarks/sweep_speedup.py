@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.SWEEP_SPEEDUP
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+from voronoi.bin2d import bin2d
+from voronoi.bin2d_sweep import bin2d_sweep
+from accretion_scaling import field
+
+
+def scatter(result, targetsn):
+
+    """
+    Fractional S/N scatter (%) of the bins with more than one pixel, as
+    printed by bin2d.
+
+    INPUTS
+      result   : output of bin2d
+      targetsn : target S/N
+    """
+
+    sn, area = result[3], result[4]
+    return ((sn[area!=1]-targetsn)/targetsn*100).std()
+
+
+def sweep_speedup(side=128, targetsns=(10., 20., 30., 40.), wvt=False,
+    processes=None):
+
+    """
+    Times bin2d_sweep against independent bin2d calls at the same targets on
+    a synthetic field, with and without warm starts, and prints the number
+    of bins and S/N scatter obtained at each target.
+
+    OPTIONS
+      side      : number of pixels along each side of the field [default 128]
+      targetsns : target S/N values
+      wvt       : use the WVT modification [default False]
+      processes : number of worker processes of the sweep [default None]
+    """
+
+    x, y, signal, noise = field(side)
+
+    t = time.time()
+    single = [bin2d(x, y, signal, noise, targetsn, wvt=wvt,
+        graphs=False) for targetsn in targetsns]
+    tsingle = time.time() - t
+
+    t = time.time()
+    cold = bin2d_sweep(x, y, signal, noise, targetsns, wvt=wvt,
+        warmstart=False, processes=processes)
+    tcold = time.time() - t
+
+    t = time.time()
+    warm = bin2d_sweep(x, y, signal, noise, targetsns, wvt=wvt,
+        warmstart=True, processes=processes)
+    twarm = time.time() - t
+
+    print("{:} pixels, wvt={:}, processes={:}".format(x.size, wvt,
+        processes))
+    print("{:>8s} {:>14s} {:>14s} {:>14s}".format("target", "bin2d",
+        "sweep (cold)", "sweep (warm)"))
+    for i, targetsn in enumerate(targetsns):
+        print("{:8.1f}".format(targetsn) + "".join(" {:5d} {:7.2f}%".format(
+            r[i][1].size, scatter(r[i], targetsn))
+            for r in (single, cold, warm)))
+    print("{:>8s} {:13.2f}s {:13.2f}s {:13.2f}s".format("time", tsingle,
+        tcold, twarm))
+    print("{:>8s} {:>14s} {:13.2f}x {:13.2f}x".format("speedup", "",
+        tsingle/tcold, tsingle/twarm))
+
+
+if __name__ == "__main__":
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    for wvt in (False, True):
+        sweep_speedup(side, wvt=wvt, processes=processes)
+        print("")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BENCHMARKS.TILED_SEAMS
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+import numpy as np
+from voronoi.bin2d import bin2d
+from voronoi.bin2d_tiled import bin2d_tiled
+from accretion_scaling import field
+
+
+def tiled_seams(side=256, tilesize=64, targetsn=20., wvt=False,
+    processes=1):
+
+    """
+    Bins a synthetic field whole with bin2d and in tiles with bin2d_tiled,
+    and prints the fractional S/N scatter (%) of the bins whose generators
+    lie within halo (tilesize/4) of a border between tiles and of the other
+    bins, to show how much seam is left along the tile borders.
+
+    OPTIONS
+      side      : number of pixels along each side of the field [default 256]
+      tilesize  : side of the tiles in pixels [default 64]
+      targetsn  : target S/N [default 20]
+      wvt       : use the WVT modification [default False]
+      processes : number of worker processes of bin2d_tiled [default 1]
+    """
+
+    x, y, signal, noise = field(side)
+    halo = tilesize/4.
+
+    def scatter(result, select=None):
+        binned = result.area > 1
+        if select is not None: binned &= select
+        return ((result.sn[binned]-targetsn)/targetsn*100).std(), \
+            binned.sum()
+
+    t = time.time()
+    whole = bin2d(x, y, signal, noise, targetsn, wvt=wvt)
+    twhole = time.time() - t
+    t = time.time()
+    tiled = bin2d_tiled(x, y, signal, noise, targetsn, tilesize,
+        processes=processes, wvt=wvt)
+    ttiled = time.time() - t
+
+    # distance of the generators to the nearest border between tiles
+    xr = (tiled.xnode-x.min()) % tilesize
+    yr = (tiled.ynode-y.min()) % tilesize
+    border = ((np.minimum(xr, tilesize-xr) < halo)
+        & (tiled.xnode-x.min() > halo) & (x.max()-tiled.xnode > halo)) \
+        | ((np.minimum(yr, tilesize-yr) < halo)
+        & (tiled.ynode-y.min() > halo) & (y.max()-tiled.ynode > halo))
+
+    print("{:>10s} {:>6s} {:>8s} {:>9s}".format("", "nbin", "scatter",
+        "time (s)"))
+    print("{:>10s} {:6d} {:7.2f}% {:9.2f}".format("bin2d", whole.nbin,
+        scatter(whole)[0], twhole))
+    print("{:>10s} {:6d} {:7.2f}% {:9.2f}".format("tiled", tiled.nbin,
+        scatter(tiled)[0], ttiled))
+    s, n = scatter(tiled, border)
+    print("{:>10s} {:6d} {:7.2f}%".format("  border", n, s))
+    s, n = scatter(tiled, ~border)
+    print("{:>10s} {:6d} {:7.2f}%".format("  interior", n, s))
+
+
+if __name__ == "__main__":
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    for wvt in (False, True):
+        print("wvt={:}".format(wvt))
+        tiled_seams(side, wvt=wvt)
+        print("")
@@ -18,4 +18,7 @@ setup(
         'voronoi': 'voronoi',
         },
     packages=["voronoi"],
+    entry_points = {
+        'console_scripts': ['voronoi-bin = voronoi.command_line:main'],
+        },
 )
\ No newline at end of file
@@ -1,3 +1,20 @@
 #!/usr/bin/env python
 
+__version__ = "0.0"
+
 from .bin2d import bin2d
+from .pixel_geometry import PixelGeometry
+from .bin2d_sweep import bin2d_sweep
+from .bin2d_many import bin2d_many
+from .binning_operator import BinningOperator
+from .bin2d_tiled import bin2d_tiled
+from .bin2d_image import bin2d_image
+from .plot_bins import plot_bins
+from .events import Profiler
+from .binning_result import BinningResult
+from .binning_cache import BinningCache
+from .superpixels import Superpixels
+from .subsample import Subsample
+from .pixel_data import PixelData
+from .binning_service import abin2d, BinningService
+from .pixel_io import read_pixels
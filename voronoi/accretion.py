@@ -5,11 +5,16 @@
 # - converted from IDL code by Michele Cappellari (bin2d_accretion)
 # -----------------------------------------------------------------------------
 
+import time
 from numpy import *
-from .bin_roundness import bin_roundness
+from .events import listener, AccretionProgress
+from .bin_accumulator import BinAccumulator
+from .pixel_geometry import PixelGeometry
+from .pixel_data import PixelData
 
 
-def accretion(x, y, signal, noise, targetsn, pixelsize=False, quiet=False):
+def accretion(x, y, signal, noise, targetsn, pixelsize=False, quiet=False,
+    geometry=None, callback=None, weights=None, data=None):
     
     """
     Initial binning -- steps i-v of eq 5.1 of Cappellari & Copin (2003)
@@ -24,103 +29,163 @@ def accretion(x, y, signal, noise, targetsn, pixelsize=False, quiet=False):
     OPTIONS:
       pixelsize : pixel scale of the input data
       quiet     : if set, suppress printed outputs
+      geometry  : PixelGeometry of the pixels, to re-use its pixel size,
+                  neighbour graph and spatial index; x and y may then be None
+      callback  : function called with an AccretionProgress event (see
+                  voronoi.events) as each bin is started
+      weights   : number of pixels that each pixel stands for, e.g. for
+                  superpixels [default 1 for all pixels]
+      data      : PixelData of the pixels, to re-use its S/N and squared
+                  noise; signal and noise are then taken from it
     """
     
     
+    if geometry is None: geometry = PixelGeometry(x, y, pixelsize)
+    x = geometry.x
+    y = geometry.y
+    pixelsize = geometry.pixelsize      # smallest distance between pixels
+    if data is None: data = PixelData(signal, noise)
+    signal = data.signal
+    noise = data.noise
+    pixsn = data.sn
+    
     n = x.size
     clas = zeros(x.size, dtype="<i8")   # bin number of each pixel
     good = zeros(x.size, dtype="<i8")   # =1 if bin accepted as good
     
-    # for each point, find distance to all other points and select minimum
-    # (robust but slow way of determining the pixel size of unbinned data)
-    if not pixelsize:
-        dx = 1.e30
-        for j in range(x.size-1):
-            d = (x[j] - x[j+1:])**2 + (y[j] - y[j+1:])**2
-            dx = min(d.min(), dx)
-        pixelsize = sqrt(dx)
-    
     # start from the pixel with highest S/N
-    sn = (signal/noise).max()
-    currentbin = (signal/noise).argmax()
+    sn = pixsn.max()
+    currentbin = pixsn.argmax()
     
     # rough estimate of the expected final bin number
     # This value is only used to have a feeling of the expected
     # remaining computation time when binning very big dataset.
-    wh = where(signal/noise<targetsn)
-    npass = size(where(signal/noise >= targetsn))
-    maxnum = int(round( (signal[wh]**2/noise[wh]**2).sum()/targetsn**2 ))+npass
+    wh = where(pixsn<targetsn)
+    npass = size(where(pixsn >= targetsn))
+    maxnum = int(round( (pixsn[wh]**2).sum()/targetsn**2 ))+npass
+    
+    # spatial index of the unbinned pixels, so that the nearest unbinned
+    # pixel to a point is found without scanning all of them, and the pixels
+    # within 1.2 pixels of each pixel
+    unbinned = geometry.index()
+    indptr, neighbours = geometry.neighbours
+    
+    # running sums of the current bin
+    current = BinAccumulator(x, y, signal, noise, pixelsize, weights=weights,
+        noise2=data.noise2)
+    
+    # running sums for the centroid of all the binned pixels
+    xsum = 0.
+    ysum = 0.
+    nbinned = 0
+    
+    # centroids kept as running sums differ by rounding from means over the
+    # pixels, by at most this distance per pixel summed: when the nearest
+    # pixel to a centroid is not clear by more than that, the mean over the
+    # pixels is used, so that ties resolve as in the original routine
+    # (unless all the sums of the coordinates are exact, e.g. integers)
+    wx = x if weights is None else weights*x
+    wy = y if weights is None else weights*y
+    if _exact_sums(wx) and _exact_sums(wy):
+        rounding = 0.
+    else:
+        rounding = 8*finfo(float).eps*maximum(abs(x).max(), abs(y).max())
+    
+    listen = listener(quiet, callback)
     
     # first bin assigned CLAS = 1 -- with N pixels, get at most N bins
     for ind in range(1, n+1):
         
-        if not quiet:
-            print("  bin: {:} / {:}".format(ind, maxnum))
+        if listen is not None:
+            listen(AccretionProgress(time.time(), ind, maxnum))
         
         # to start the current bin is only one pixel
         clas[currentbin] = ind
-        
-        # centroid of bin
-        xbar = x[currentbin]
-        ybar = y[currentbin]
+        unbinned.remove(currentbin)
+        current.start(currentbin)
         
         while True:
             
             # stop if all pixels are binned
-            unbinned = where(clas == 0)[0]
-            if unbinned.size == 0: break
+            if len(unbinned) == 0: break
             
             # find unbinned pixel closest to centroid of current bin
-            dist = (x[unbinned]-xbar)**2 + (y[unbinned]-ybar)**2
-            mindist = dist.min()
-            k = dist.argmin()
+            if not rounding:
+                k = unbinned.nearest(current.xbar, current.ybar)
+            else:
+                k, tied = unbinned.nearest_tie(current.xbar, current.ybar,
+                    rounding*(len(current.members)+1))
+                if tied: k = unbinned.nearest(*current.centroid())
             
-            # find the distance from the closest pixel to the current bin
-            mindist = ((x[currentbin]-x[unbinned[k]])**2 \
-                + (y[currentbin]-y[unbinned[k]])**2).min()
-            
-            # estimate roundness of bin with candidate pixel added
-            nextbin = append(currentbin, unbinned[k])
-            roundness = bin_roundness(x[nextbin], y[nextbin], pixelsize)
+            # the candidate is connected to the current bin if any pixel
+            # of the bin lies within 1.2 pixels of it
+            connected = (clas[neighbours[indptr[k]:indptr[k+1]]] == ind).any()
             
             # compute sn of bin with candidate pixel added
             snold = sn
-            sn = signal[nextbin].sum()/sqrt((noise[nextbin]**2).sum())
+            sn = current.sn_with(k)
             
             # Test whether the CANDIDATE pixel is connected to the
-            # current bin, whether the POSSIBLE new bin is round enough
-            # and whether the resulting S/N would get closer to targetsn
-            if sqrt(mindist) > 1.2*pixelsize or roundness > 0.3 \
-                or abs(sn-targetsn) > abs(snold-targetsn):
+            # current bin, whether the resulting S/N would get closer to
+            # targetsn and whether the POSSIBLE new bin is round enough
+            if not connected or abs(sn-targetsn) > abs(snold-targetsn) \
+                or current.roundness_exceeds(k, 0.3):
                 if (snold > 0.8*targetsn):
-                    good[currentbin] = 1
+                    good[current.members] = 1
                 break
             
             # if all the above tests are negative then accept the CANDIDATE
             # pixel, add it to the current bin, and continue accreting pixels
-            clas[unbinned[k]] = ind
-            currentbin = nextbin
-            
-            # update the centroid of the current bin
-            xbar = x[currentbin].mean()
-            ybar = y[currentbin].mean()
+            clas[k] = ind
+            unbinned.remove(k)
+            current.add(k)
         
         # get the centroid of all the binned pixels
-        binned = where(clas != 0)[0]
-        unbinned = where(clas == 0)[0]
+        xsum += current.sumx
+        ysum += current.sumy
+        nbinned += current.n
         
         # stop if all pixels are binned
-        if unbinned.size == 0: break
-        xbar = x[binned].mean()
-        ybar = y[binned].mean()
+        if len(unbinned) == 0: break
+        xbar = xsum/nbinned
+        ybar = ysum/nbinned
         
         # find the closest unbinned pixel to the centroid of all
         # the binned pixels, and start a new bin from that pixel
-        k = ((x[unbinned]-xbar)**2 + (y[unbinned]-ybar)**2).argmin()
-        currentbin = unbinned[k]    # the bin is initially made of one pixel
-        sn = signal[currentbin] / noise[currentbin]
+        if not rounding:
+            currentbin = unbinned.nearest(xbar, ybar)   # initially one pixel
+        else:
+            currentbin, tied = unbinned.nearest_tie(xbar, ybar,
+                rounding*(n-len(unbinned)+1))
+            if tied:
+                binned = clas != 0
+                currentbin = unbinned.nearest(wx[binned].sum()/nbinned,
+                    wy[binned].sum()/nbinned)
+        sn = pixsn[currentbin]
     
     # set to zero all bins that did not reach the target S/N
     clas = clas*good
     
     return clas
+
+
+def _exact_sums(v):
+    
+    """
+    Returns True if every sum of the values v is exact in floating point:
+    the values are all multiples of a power of two g (e.g. integers, g = 1)
+    and the sum of their absolute values is less than 2**52 g.
+    
+    INPUTS:
+      v : values
+    """
+    
+    m, e = frexp(v[v != 0])
+    if m.size == 0: return True
+    
+    # the lowest set bit of each mantissa gives the largest power of two
+    # of which the value is a multiple
+    mantissa = abs(m*2.**53).astype(int64)
+    g = (e - 54 + frexp((mantissa & -mantissa).astype(float))[1]).min()
+    
+    return bool(ldexp(abs(v).sum(), -int(g)) < 2.**52)
@@ -5,23 +5,37 @@
 # - converted from IDL code by Michele Cappellari (voronoi_2d_binning)
 # -----------------------------------------------------------------------------
 
+import time
 from numpy import *
-from matplotlib.pyplot import *
+from .events import listener, stage_start, stage_end, Summary
 from .weighted_centroid import *
 from .bin_roundness import *
 from .accretion import *
 from .reassign_bad_bins import *
 from .cvt_equal_mass import *
 from .bin_quantities import *
+from .binning_result import BinningResult
+from .superpixels import Superpixels
+from .subsample import Subsample
+from .pixel_data import PixelData
 
 
 def bin2d(x, y, signal, noise, targetsn, cvt=True, wvt=False, quiet=True,
-    graphs=True):
+    graphs=False, pixelsize=False, maxmem=2**26, tol=0., maxiter=None,
+    maxtime=None, relax=1., incremental=False, geometry=None, callback=None,
+    prebin=False, sample=None, checkpoint=None, interval=60., resume=False,
+    dtype=float, start=None, data=None):
     
     """
     This is the main program that has to be called from external programs.
     It simply calls in sequence the different steps of the algorithms
-    and optionally plots the results at the end of the calculation.
+    and optionally plots the results to files at the end of the
+    calculation.
+    
+    Returns a BinningResult, which unpacks as the tuple (clas, xnode, ynode,
+    sn, area, scale), and whose scatter is the fractional S/N scatter (%)
+    of the bins, e.g. to compare an approximate binning (sample) with an
+    exact one.
     
     INPUTS
       x        : x-coordinates of pixels
@@ -31,99 +45,243 @@ def bin2d(x, y, signal, noise, targetsn, cvt=True, wvt=False, quiet=True,
       targetsn : target S/N required
     
     OPTIONS
-      cvt      : use Modified-Lloyd algorithm [default True]
-      wvt      : use additional modification by Diehl & Statler [default False]
-      quiet    : supress output [default True]
-      graphs   : show results graphically [default True]
+      cvt       : use Modified-Lloyd algorithm [default True]
+      wvt       : use additional modification by Diehl & Statler [default False]
+      quiet     : supress output [default True]
+      graphs    : plot the results to the files GRAPHS_map.png and
+                  GRAPHS_sn.png (see plot_bins) if graphs is a string,
+                  or bin2d_map.png and bin2d_sn.png in the working
+                  directory if it is True, overwriting any existing files
+                  [default False, no graphs]
+      pixelsize : pixel scale of the input data, if known; otherwise it is
+                  estimated from the pixel coordinates
+      maxmem    : memory limit in bytes for the temporary arrays of the
+                  Voronoi tessellation [default 64 MB]
+      tol       : stop the CVT when the rms motion of the generators is below
+                  tol times their typical separation [default 0]
+      maxiter   : maximum number of CVT iterations [default no limit]
+      maxtime   : wall-time budget of all the CVT iterations together (not
+                  of each) in seconds [default no limit]
+      relax     : over-relaxation factor of the CVT iterations, between 1
+                  and 2; other than 1, the CVT converges to a different
+                  tessellation, not reliably faster (see cvt_equal_mass)
+                  [default 1]
+      incremental : only recompute the tessellation near the generators that
+                  changed in each CVT iteration [default False]
+      geometry  : PixelGeometry of the pixels, built once and re-used when
+                  binning the same pixels many times; x, y and pixelsize are
+                  then taken from it (x and y may be None)
+      callback  : function called with the events of the binning (see
+                  voronoi.events), e.g. a Profiler; the printed output
+                  (unless quiet) is made from the same events
+      prebin    : merge the faint pixels into superpixels (see Superpixels)
+                  with S/N up to prebin times targetsn, or 0.3 times if
+                  prebin is True, and bin those; the final bins are still
+                  made of pixels [default False]
+      sample    : approximate mode: run the accretion and the CVT on a
+                  subsample (see Subsample) of about this fraction of the
+                  faint pixels, then assign every pixel to the bins; faster
+                  for a larger S/N scatter (see the scatter of the result)
+                  [default None, all pixels]
+      checkpoint : name of a file to save the state of the binning to as it
+                  goes (see Checkpoint): at the end of every stage and,
+                  during the CVT, every interval seconds; it is removed
+                  once the binning is complete [default None]
+      interval  : least time in seconds between saves of the CVT state
+                  [default 60]
+      resume    : continue from the checkpoint file, if there is one, from
+                  the last stage completed or CVT iteration saved; the
+                  inputs and the options that change the binning (cvt,
+                  wvt, relax, incremental, pixelsize, prebin, sample,
+                  dtype and start) must be the same, or ValueError is
+                  raised; tol, maxiter and maxtime may change between
+                  runs [default False]
+      dtype     : floating type of the signal and noise, and of the arrays
+                  derived from them (see PixelData): float32 halves their
+                  memory, at the cost of a few pixels in different bins
+                  [default float]
+      start     : initial generators (xnode, ynode) of the CVT, e.g. from
+                  the binning of the same pixels at another target S/N,
+                  instead of those from the bin accretion and bad-bin
+                  reassignment, which are then skipped [default None]
+      data      : PixelData of the pixels, built once and re-used when
+                  binning the same pixels many times, e.g. at several target
+                  S/N; signal, noise and dtype are then taken from it
+                  (signal and noise may be None)
+    
+    The inputs can be any arrays, e.g. memory-mapped arrays or the columns
+    of a table, and are not copied if they are already arrays of floating
+    type dtype (x and y of type float); they are never changed.
     """
     
     
+    if geometry is not None:
+        x = geometry.x
+        y = geometry.y
+    else:
+        x = asarray(x, dtype=float)
+        y = asarray(y, dtype=float)
+    
+    if data is not None:
+        signal = data.signal
+        noise = data.noise
+    
     npix = x.size
-    if y.size != x.size or signal.size != x.size or noise.size != x.size:
-        print("ERROR: input vectors (x, y, signal, noise) must have same size")
-        return
-    if any(noise < 0):
-        print("ERROR: noise cannot be negative")
+    if not _check_inputs(x, y, signal, noise): return
+    if prebin and sample is not None:
+        print("ERROR: prebin and sample cannot be used together")
         return
     
-    # prevent division by zero for pixels with signal=0 and
-    # noise=sqrt(signal)=0 as can happen with X-ray data
-    noise[noise==0] = noise[noise>0].min() * 1e-9
+    # signal and noise, with the arrays derived from them computed once;
+    # zero noise is replaced in a copy to prevent division by zero for
+    # pixels with signal=0 and noise=sqrt(signal)=0 as can happen with
+    # X-ray data
+    if data is None: data = PixelData(signal, noise, dtype=dtype)
+    signal = data.signal
+    noise = data.noise
     
-    # Perform basic tests to catch common input errors
-    if signal.sum()/sqrt((noise**2).sum()) < targetsn:
-        print("Not enough S/N in the whole set of pixels. " \
-            + "Many pixels may have noise but virtually no signal. " \
-            + "They should not be included in the set to bin, " \
-            + "or the pixels should be optimally weighted." \
-            + "See Cappellari & Copin (2003, Sec.2.1) and README file.")
-        return
-    if (signal/noise).min() > targetsn:
-        print("EXCEPTION: all pixels have enough S/N -- binning not needed")
-        return
+    if not _check_target(data, targetsn): return
     
-    if not quiet: print("Bin-accretion...")
-    clas = accretion(x, y, signal, noise, targetsn, quiet=quiet)
-    if not quiet: print("{:} initial bins\n".format(clas.max()))
+    listen = listener(quiet, callback)
     
-    if not quiet: print("Reassign bad bins...")
-    xnode, ynode = reassign_bad_bins(x, y, signal, noise, targetsn, clas)
-    if not quiet: print("{:} good bins\n".format(xnode.size))
+    saved = None
+    stage = None
+    if checkpoint is not None:
+        from .checkpoint import Checkpoint
+        from .binning_cache import cache_key
+        key = cache_key((x, y, signal, noise) + (() if start is None
+            else tuple(start)), targetsn, dict(cvt=cvt, wvt=wvt,
+            relax=relax, incremental=incremental, prebin=prebin,
+            sample=sample,
+            pixelsize=geometry.pixelsize if geometry is not None
+            else pixelsize))
+        saved = Checkpoint(checkpoint, interval=interval, key=key)
+        if resume: stage = saved.load()
     
-    if cvt:
-        if not quiet: print("Modified Lloyd algorithm...")
-        scale, iters = cvt_equal_mass(x, y, signal, noise, xnode, ynode,
-            quiet=quiet, wvt=wvt)
-        if not quiet: print("  iterations: {:}".format(iters-1))
+    # the points that are binned: the pixels, superpixels of them, or a
+    # subsample of them
+    if prebin:
+        begin = stage_start(listen, "prebin")
+        superpixels = Superpixels(x, y, signal, noise, targetsn,
+            fraction=0.3 if prebin is True else prebin, geometry=geometry,
+            pixelsize=pixelsize)
+        stage_end(listen, "prebin", begin, npix=len(superpixels))
+        px, py = superpixels.x, superpixels.y
+        psignal, pnoise = superpixels.signal, superpixels.noise
+        pgeometry, weights = superpixels.geometry, superpixels.weight
+    elif sample is not None:
+        begin = stage_start(listen, "sample")
+        subsample = Subsample(x, y, signal, noise, targetsn, fraction=sample,
+            geometry=geometry, pixelsize=pixelsize)
+        stage_end(listen, "sample", begin, npix=len(subsample))
+        px, py = subsample.x, subsample.y
+        psignal, pnoise = subsample.signal, subsample.noise
+        pgeometry, weights = subsample.geometry, subsample.weight
+    else:
+        px, py, psignal, pnoise = x, y, signal, noise
+        pgeometry, weights = geometry, None
+    pdata = data if px is x else PixelData(psignal, pnoise,
+        dtype=data.dtype)
+    
+    if start is not None and stage != "cvt":
+        xnode = array(start[0], dtype=float)
+        ynode = array(start[1], dtype=float)
+        stage = "reassign"
+    
+    if stage is None:
+        begin = stage_start(listen, "accretion")
+        clas = accretion(px, py, psignal, pnoise, targetsn,
+            pixelsize=pixelsize, quiet=True, geometry=pgeometry,
+            callback=listen, weights=weights, data=pdata)
+        stage_end(listen, "accretion", begin, nbin=clas.max())
+        if saved is not None: saved.save("accretion", clas=clas.copy())
+    elif stage == "accretion":
+        clas = saved.arrays["clas"]
+    
+    if stage in (None, "accretion"):
+        begin = stage_start(listen, "reassign")
+        xnode, ynode = reassign_bad_bins(px, py, psignal, pnoise, targetsn,
+            clas, weights=weights)
+        stage_end(listen, "reassign", begin, nbin=xnode.size,
+            xnode=xnode.copy(), ynode=ynode.copy())
+        if saved is not None:
+            saved.save("reassign", xnode=xnode.copy(), ynode=ynode.copy())
+    elif start is None:
+        xnode = saved.arrays["xnode"].copy()
+        ynode = saved.arrays["ynode"].copy()
+    
+    if stage == "cvt":
+        scale = saved.arrays["scale"]
+        if scale.ndim == 0: scale = scale.item()
+    elif cvt:
+        begin = stage_start(listen, "cvt")
+        scale, iters, history = cvt_equal_mass(px, py, psignal, pnoise, xnode,
+            ynode, quiet=True, wvt=wvt, maxmem=maxmem, tol=tol,
+            maxiter=maxiter, maxtime=maxtime, relax=relax,
+            incremental=incremental, diagnostics=True, callback=listen,
+            weights=weights, checkpoint=saved, state=None if saved is None
+            else saved.cvt_state(), data=pdata)
+        stage_end(listen, "cvt", begin, nbin=history["nbin"][-1],
+            iterations=iters-1, stop=history["stop"])
+        if saved is not None:
+            saved.save("cvt", xnode=xnode, ynode=ynode, scale=scale)
     else:
         scale = 1.
     
-    if not quiet: print("Recompute bin properties...")
+    begin = stage_start(listen, "quantities")
     clas, xbar, ybar, sn, area = bin_quantities(x, y, signal, noise, xnode,
-        ynode, scale)
+        ynode, scale, maxmem=maxmem, data=data)
+    stage_end(listen, "quantities", begin, nbin=(area>0).sum())
     unb = area==1
     binned = area!=1
-    if not quiet: print("Unbinned pixels: {:} / {:}".format(sum(unb), npix))
     fracscat = ((sn[binned]-targetsn)/targetsn*100).std()
-    if not quiet: print("Fractional S/N scatter (%):", fracscat)
+    if listen is not None:
+        listen(Summary(time.time(), xnode.size, npix, int(sum(unb)),
+            fracscat))
+    
+    if saved is not None: saved.remove()
     
     if graphs:
-        
-        # set up plotting
-        rc("font", family="serif")
-        rc("text", usetex=True)
-        rc("xtick", labelsize="8")
-        rc("ytick", labelsize="8")
-        rc("axes", labelsize="10")
-        rc("legend", fontsize="9")
-        
-        # pixel map
-        fig = figure(figsize=(4,3))
-        fig.subplots_adjust(left=0.13, bottom=0.13, top=0.97, right=0.98)
-        rnd = random.rand(xnode.size).argsort()      # randomize bin colors
-        scatter(x, y, lw=0, c=rnd[clas])
-        plot(xnode, ynode, "k+", ms=2)
-        xlim(x.min()-x.ptp()*0.05, x.max()+x.ptp()*0.05)
-        ylim(y.min()-y.ptp()*0.05, y.max()+y.ptp()*0.05)
-        xlabel("coordinate 1")
-        ylabel("coordinate 2")
-        show()
-        
-        # signal-to-noise profile
-        fig = figure(figsize=(4,3))
-        fig.subplots_adjust(left=0.12, bottom=0.13, top=0.97, right=0.97)
-        rad = sqrt(xbar**2 + ybar**2)     # use centroids, NOT generators
-        rmin = max(0., rad.min()-rad.ptp()*0.05)
-        rmax = rad.max()+rad.ptp()*0.05
-        plot([rmin, rmax], ones(2)*targetsn, c="k", lw=2, alpha=0.8)
-        scatter(rad[binned], sn[binned], lw=0, c="b", alpha=0.8)
-        if unb.size > 0: scatter(rad[unb], sn[unb], lw=0, c="r", alpha=0.8)
-        xlim(rmin, rmax)
-        ylim(0., sn.max()*1.05)
-        xlabel(r"$R_{\rm bin}$")
-        ylabel(r"$SN_{\rm bin}$")
-        show()
-    
-    
-    return clas, xnode, ynode, sn, area, scale
- 
\ No newline at end of file
+        from .plot_bins import plot_bins
+        files = plot_bins(x, y, clas, xnode, ynode, sn, area, targetsn,
+            xbar=xbar, ybar=ybar, filename=graphs if isinstance(graphs, str)
+            else "bin2d", pixelsize=geometry.pixelsize if geometry is not None
+            else pixelsize or None)
+        if not quiet: print("Graphs written to", ", ".join(files))
+    
+    
+    return BinningResult(clas, xnode, ynode, sn, area, scale,
+        scatter=float(fracscat))
+ 
+
+def _check_inputs(x, y, signal, noise):
+    
+    # checks of the input arrays, shared by the other binning functions;
+    # prints the error and returns False if they are not valid
+    if y.size != x.size or size(signal) != x.size or size(noise) != x.size:
+        print("ERROR: input vectors (x, y, signal, noise) must have same size")
+        return False
+    if any(asarray(noise) < 0):
+        print("ERROR: noise cannot be negative")
+        return False
+    
+    return True
+
+
+def _check_target(data, targetsn):
+    
+    # basic tests to catch common input errors at a target S/N, from the
+    # PixelData of the pixels; prints the problem and returns False if the
+    # pixels cannot be binned
+    if data.signal.sum()/sqrt(data.noise2.sum()) < targetsn:
+        print("Not enough S/N in the whole set of pixels. " \
+            + "Many pixels may have noise but virtually no signal. " \
+            + "They should not be included in the set to bin, " \
+            + "or the pixels should be optimally weighted." \
+            + "See Cappellari & Copin (2003, Sec.2.1) and README file.")
+        return False
+    if data.sn.min() > targetsn:
+        print("EXCEPTION: all pixels have enough S/N -- binning not needed")
+        return False
+    
+    return True
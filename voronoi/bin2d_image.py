@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN2D_IMAGE
+# -----------------------------------------------------------------------------
+
+import time
+import numpy as np
+from .events import listener, stage_start, stage_end, Summary
+from .pixel_geometry import PixelGeometry
+from .accretion import accretion
+from .reassign_bad_bins import reassign_bad_bins
+from .cvt_equal_mass import cvt_equal_mass
+from .bin_quantities import bin_quantities
+from .binning_result import BinningResult
+from .pixel_data import PixelData
+from .bin2d import _check_target
+
+
+def bin2d_image(signal, noise, targetsn, mask=None, cvt=True, wvt=False,
+    quiet=True, flat=False, raster=True, maxmem=2**26, tol=0., maxiter=None,
+    maxtime=None, relax=1., incremental=False, callback=None, dtype=float):
+
+    """
+    Bins the pixels of a 2D image, as bin2d does for a list of pixels.
+    Returns a BinningResult as bin2d, except that clas is an image of the
+    bin number of each pixel, -1 for the pixels not binned, unless flat is
+    set.  Coordinates are in pixels of the image: pixel (i, j) is at x=j,
+    y=i.
+
+    The pixels binned are those with finite signal and noise (and inside
+    the mask, if given).  Since they lie on a regular grid, the bin
+    accretion works on the image through ImageIndex and the neighbour
+    offsets of the grid, which gives the same bins as bin2d, and with raster
+    set the Voronoi tessellations with equal scales are computed by
+    raster_tessellation, which is faster on large images but may assign a
+    few pixels on the bin borders differently, so that the CVT can end on
+    slightly different (but equally good) bins than bin2d; with raster=False
+    the result is the same as bin2d.
+
+    INPUTS
+      signal   : image of the signal
+      noise    : image of the noise
+      targetsn : target S/N required
+
+    OPTIONS
+      mask      : image that is True for the pixels to bin [default all
+                  pixels with finite signal and noise]
+      cvt       : use Modified-Lloyd algorithm [default True]
+      wvt       : use additional modification by Diehl & Statler [default False]
+      quiet     : supress output [default True]
+      flat      : return clas for the binned pixels only, in row-major
+                  order, as bin2d would [default False]
+      raster    : use raster_tessellation [default True]
+      maxmem, tol, maxiter, maxtime, relax, incremental
+                : options of the CVT, as in bin2d
+      callback  : function called with the events of the binning, as in
+                  bin2d
+      dtype     : floating type of the signal and noise, as in bin2d
+                  [default float]
+    """
+
+
+    signal = np.asarray(signal)
+    noise = np.asarray(noise)
+    if signal.ndim != 2 or noise.shape != signal.shape:
+        print("ERROR: signal and noise must be images of the same shape")
+        return
+    good = np.isfinite(signal) & np.isfinite(noise)
+    if mask is not None: good &= np.asarray(mask, dtype=bool)
+    row, col = np.nonzero(good)
+    if row.size == 0:
+        print("ERROR: no pixels to bin")
+        return
+    x = col.astype(float)
+    y = row.astype(float)
+    if (noise[row, col] < 0).any():
+        print("ERROR: noise cannot be negative")
+        return
+
+    # signal and noise of the pixels binned, with the arrays derived from
+    # them computed once, as in bin2d
+    data = PixelData(signal[row, col], noise[row, col], dtype=dtype)
+    signal = data.signal
+    noise = data.noise
+    if not _check_target(data, targetsn): return
+
+    geometry = PixelGeometry(x, y, pixelsize=1.)
+    image = (row, col) if raster else None
+
+    listen = listener(quiet, callback)
+
+    start = stage_start(listen, "accretion")
+    clas = accretion(x, y, signal, noise, targetsn, quiet=True,
+        geometry=geometry, callback=listen, data=data)
+    stage_end(listen, "accretion", start, nbin=clas.max())
+
+    start = stage_start(listen, "reassign")
+    xnode, ynode = reassign_bad_bins(x, y, signal, noise, targetsn, clas)
+    stage_end(listen, "reassign", start, nbin=xnode.size,
+        xnode=xnode.copy(), ynode=ynode.copy())
+
+    if cvt:
+        start = stage_start(listen, "cvt")
+        scale, iters, history = cvt_equal_mass(x, y, signal, noise, xnode,
+            ynode, quiet=True, wvt=wvt, maxmem=maxmem, tol=tol,
+            maxiter=maxiter, maxtime=maxtime, relax=relax,
+            incremental=incremental, diagnostics=True, image=image,
+            callback=listen, data=data)
+        stage_end(listen, "cvt", start, nbin=history["nbin"][-1],
+            iterations=iters-1, stop=history["stop"])
+    else:
+        scale = 1.
+
+    start = stage_start(listen, "quantities")
+    clas, xbar, ybar, sn, area = bin_quantities(x, y, signal, noise, xnode,
+        ynode, scale, maxmem=maxmem, image=image, data=data)
+    stage_end(listen, "quantities", start, nbin=(area>0).sum())
+    binned = area!=1
+    scatter = float(((sn[binned]-targetsn)/targetsn*100).std())
+    if listen is not None:
+        listen(Summary(time.time(), xnode.size, x.size, int((area==1).sum()),
+            scatter))
+
+    if not flat:
+        labels = np.full(good.shape, -1, dtype=clas.dtype)
+        labels[row, col] = clas
+        clas = labels
+
+    return BinningResult(clas, xnode, ynode, sn, area, scale,
+        scatter=scatter)
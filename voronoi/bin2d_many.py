@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN2D_MANY
+# -----------------------------------------------------------------------------
+
+import os
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from .bin2d import bin2d
+from .process_pool import run_in_pool
+
+
+def bin2d_many(jobs, processes=None, chunksize=1, cvt=True, wvt=False,
+    pixelsize=False, maxmem=2**26, tol=0., maxiter=None, maxtime=None,
+    relax=1., incremental=False):
+
+    """
+    Bins many independent fields on a pool of worker processes.  This is a
+    generator: it yields (index, result, error) for every job as soon as it
+    is done, i.e. in order of completion, where index is the position of the
+    job in jobs, result is the output of bin2d (None if the job failed, or if
+    bin2d rejected its inputs) and error is the exception raised by the job
+    (None if it succeeded).  A failing job does not stop the others.  If a
+    worker process dies, the jobs then in the pool fail with
+    BrokenProcessPool and a new pool is started for the remaining ones.
+
+    The pixel arrays of each job are copied once into a shared memory block
+    that the worker reads directly, instead of being pickled to it, and the
+    block is released as soon as the job is done.  Jobs are read from jobs
+    lazily, with at most two chunks per worker waiting or running at any
+    time, so jobs can be a generator over many fields on disk.  bin2d is run
+    quietly and without graphs.
+
+    INPUTS
+      jobs : iterable of (x, y, signal, noise, targetsn), one per field
+
+    OPTIONS
+      processes : number of worker processes [default number of CPUs]
+      chunksize : number of jobs sent to a worker at a time [default 1]
+      cvt, wvt, pixelsize, maxmem, tol, maxiter, maxtime, relax, incremental
+                : options of bin2d, the same for all the jobs
+    """
+
+
+    options = dict(cvt=cvt, wvt=wvt, pixelsize=pixelsize, maxmem=maxmem,
+        tol=tol, maxiter=maxiter, maxtime=maxtime, relax=relax,
+        incremental=incremental)
+    processes = processes or os.cpu_count() or 1
+    failed = []
+
+    def chunks():
+        # the jobs of every chunk, copied to shared memory as they are read;
+        # the jobs that cannot be copied fail at once
+        numbered = enumerate(jobs)
+        while True:
+            chunk = list(islice(numbered, chunksize))
+            if len(chunk) == 0: return
+            index = []
+            blocks = []
+            for i, job in chunk:
+                try:
+                    blocks.append(_share(job))
+                    index.append(i)
+                except Exception as error:
+                    failed.append((i, None, error))
+            if len(blocks) == 0: continue
+            yield ([b[1:] for b in blocks], options), (index, blocks)
+
+    for (index, blocks), output, error in run_in_pool(_run_chunk, chunks(),
+        processes, release=lambda context: _release(context[1])):
+        while failed: yield failed.pop(0)
+        if error is not None: output = [(None, error)]*len(index)
+        for i, (result, error) in zip(index, output):
+            yield i, result, error
+    while failed: yield failed.pop(0)
+
+
+def _share(job):
+
+    # copy the pixel arrays of a job into a new shared memory block; returns
+    # the block, its name, the size of each array and the target S/N
+    x, y, signal, noise, targetsn = job
+    arrays = [np.asarray(a, dtype=float).ravel() for a in (x, y, signal,
+        noise)]
+    sizes = [a.size for a in arrays]
+    block = SharedMemory(create=True, size=max(8*sum(sizes), 1))
+    data = np.ndarray(sum(sizes), dtype=float, buffer=block.buf)
+    np.concatenate(arrays, out=data)
+    del data
+
+    return block, block.name, sizes, float(targetsn)
+
+
+def _release(blocks):
+    for block in blocks:
+        block[0].close()
+        block[0].unlink()
+
+
+def _run_chunk(tasks, options):
+
+    # worker: bin the jobs of a chunk from their shared memory blocks,
+    # catching the errors of each job
+    output = []
+    for name, sizes, targetsn in tasks:
+        block = SharedMemory(name=name)
+        data = np.ndarray(sum(sizes), dtype=float, buffer=block.buf)
+        x, y, signal, noise = np.split(data, np.cumsum(sizes)[:-1])
+        try:
+            output.append((bin2d(x, y, signal, noise, targetsn, quiet=True,
+                graphs=False, **options), None))
+        except Exception as error:
+            output.append((None, error.with_traceback(None)))
+        del data, x, y, signal, noise
+        block.close()
+
+    return output
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN2D_SWEEP
+# -----------------------------------------------------------------------------
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .bin2d import bin2d, _check_inputs, _check_target
+from .pixel_geometry import PixelGeometry
+from .pixel_data import PixelData
+
+
+def bin2d_sweep(x, y, signal, noise, targetsns, cvt=True, wvt=False,
+    quiet=True, pixelsize=False, maxmem=2**26, tol=0., maxiter=None,
+    maxtime=None, relax=1., incremental=False, warmstart=False,
+    processes=None, geometry=None, dtype=float):
+
+    """
+    Bins the same pixels at several target S/N values, e.g. to choose a
+    binning.  Returns a list with one result per target, in the order of
+    targetsns, each as returned by bin2d: (clas, xnode, ynode, sn, area,
+    scale), or None if the target cannot be binned (see bin2d).
+
+    The input checks of bin2d, the PixelData of the pixels (their S/N,
+    squared noise and CVT density) and their PixelGeometry are computed once
+    and shared by all the targets, each of which is then binned by bin2d,
+    so the sweep gives the same bins as separate bin2d calls.  Most of the
+    time goes into the accretion and CVT of each target, though, so without
+    warmstart the sweep takes about as long as separate calls.
+
+    warmstart trades quality for speed: only the lowest target then goes
+    through the bin accretion, and the CVT of every other target starts
+    from the generators of the nearest target already done, thinned or
+    split to the number of bins expected at the new target (see the start
+    option of bin2d).  This skips the accretion and bad-bin reassignment
+    and usually needs few CVT iterations, but the S/N of the bins scatters
+    more about the target than with separate bin2d calls: about twice as
+    much on the fields of benchmarks/sweep_speedup.py (10.6% rather than
+    5.3% with the CVT, 14.7% rather than 6.8% with the WVT), and far more on
+    fields with many pixels close to the target S/N (64% rather than 7% for
+    the example at S/N 50, where some bins reach five times the target).
+
+    With processes set, the targets are binned by that many worker
+    processes; the warm starts then all come from the lowest target.
+
+    INPUTS
+      x         : x-coordinates of pixels
+      y         : y-coordinates of pixels
+      signal    : signal in pixels
+      noise     : noise in pixels
+      targetsns : target S/N values
+
+    OPTIONS
+      cvt       : use Modified-Lloyd algorithm [default True]
+      wvt       : use additional modification by Diehl & Statler [default False]
+      quiet     : supress output [default True]
+      pixelsize : pixel scale of the input data, if known; otherwise it is
+                  estimated from the pixel coordinates
+      maxmem    : memory limit in bytes for the temporary arrays of the
+                  Voronoi tessellation [default 64 MB]
+      tol       : CVT tolerance, as in bin2d [default 0]
+      maxiter   : maximum number of CVT iterations [default no limit]
+      maxtime   : wall-time budget of the CVT of each target in seconds
+                  [default no limit]
+      relax     : over-relaxation factor of the CVT iterations [default 1]
+      incremental : incremental tessellation in the CVT [default False]
+      warmstart : start the CVT of each target from the generators of the
+                  nearest target already binned: about 1.8 times faster on
+                  benchmarks/sweep_speedup.py, but the S/N scatter of the
+                  bins goes up, from 5.3% to 10.6% at S/N 20 there (see
+                  above) [default False]
+      processes : number of worker processes [default None, no workers]
+      geometry  : PixelGeometry of the pixels (x and y may then be None)
+      dtype     : floating type of the signal and noise, as in bin2d
+                  [default float]
+    """
+
+
+    if geometry is None:
+        geometry = PixelGeometry(x, y, pixelsize)
+    x = geometry.x
+    y = geometry.y
+    targetsns = np.atleast_1d(np.asarray(targetsns, dtype=float))
+    if not _check_inputs(x, y, signal, noise): return
+
+    # checks of bin2d for each target, from the S/N of the pixels computed
+    # once
+    data = PixelData(signal, noise, dtype=dtype)
+    sn = data.sn
+    ok = np.array([_check_target(data, targetsn) for targetsn in targetsns],
+        dtype=bool)
+
+    # make sure the data and geometry are computed before they are shared
+    data.noise2
+    if cvt and not wvt: data.density
+    geometry.pixelsize
+    geometry.neighbours
+
+    options = dict(cvt=cvt, wvt=wvt, quiet=quiet, maxmem=maxmem, tol=tol,
+        maxiter=maxiter, maxtime=maxtime, relax=relax,
+        incremental=incremental)
+    warmstart = warmstart and cvt
+    results = [None]*targetsns.size
+
+    # targets in increasing order: the lowest target has the most bins, from
+    # which the others are obtained by thinning rather than splitting
+    todo = [i for i in np.argsort(targetsns, kind="stable") if ok[i]]
+    if len(todo) == 0: return results
+
+    if processes is None:
+        for i in todo:
+            start = _nearest_start(x, y, targetsns, results, i, sn) \
+                if warmstart else None
+            if not quiet:
+                print("Target S/N {:}{:}".format(targetsns[i],
+                    " (warm start)" if start is not None else ""))
+            results[i] = _bin_target(geometry, data, targetsns[i], start,
+                options)
+        return results
+
+    # parallel: the first target is needed by all the warm starts
+    if warmstart:
+        first = todo.pop(0)
+        results[first] = _bin_target(geometry, data, targetsns[first],
+            None, options)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        jobs = {}
+        for i in todo:
+            start = _nearest_start(x, y, targetsns, results, i, sn) \
+                if warmstart else None
+            jobs[i] = pool.submit(_bin_target, geometry, data, targetsns[i],
+                start, options)
+        for i in jobs:
+            results[i] = jobs[i].result()
+
+    return results
+
+
+def _nearest_start(x, y, targetsns, results, i, sn):
+
+    # starting generators for target i from the result of the nearest target
+    # (in log S/N) already binned, or None if there is none
+    done = [j for j in range(len(results)) if results[j] is not None]
+    if len(done) == 0: return None
+    j = min(done, key=lambda j: abs(np.log(targetsns[j]/targetsns[i])))
+    clas, xnode, ynode, snbin, area = results[j][:5]
+
+    # pixels above the target are bins of their own; the number of the other
+    # bins is the one expected by the accretion, corrected by how much the
+    # bins of the nearest target exceed their target on average
+    t = targetsns[i]
+    excess = (snbin[area > 1]**2).mean()/targetsns[j]**2 \
+        if (area > 1).any() else 1.
+    nbin = (sn >= t).sum() + int(round((sn[sn < t]**2).sum()/t**2/excess))
+    nbin = max(nbin, 1)
+
+    return scale_nodes(x, y, clas, xnode, ynode, sn**2, nbin)
+
+
+def _bin_target(geometry, data, targetsn, start, options):
+
+    # one target of the sweep, binned by bin2d from the shared geometry and
+    # data of the pixels, and from the starting generators if given
+    return bin2d(None, None, None, None, targetsn, graphs=False,
+        geometry=geometry, data=data, start=start, **options)
+
+
+def scale_nodes(x, y, clas, xnode, ynode, density, nbin):
+
+    """
+    Changes the number of generators of a tessellation to nbin while keeping
+    their distribution, as a starting point for a CVT with a different number
+    of bins.  Fewer generators are a subset of the old ones spread evenly
+    along a Morton (Z-order) curve; more generators are made by splitting
+    the bins, the new generators of a bin sitting at equal-density quantiles
+    of its pixels in Morton order.  Generators without pixels are dropped,
+    and a bin is never split into more generators than it has pixels, so
+    slightly fewer than nbin generators may be returned.
+
+    Returns the new xnode, ynode.
+
+    INPUTS
+      x       : x-coordinates of pixels
+      y       : y-coordinates of pixels
+      clas    : bin number (index of the generator) of each pixel
+      xnode   : x-coordinates of generators
+      ynode   : y-coordinates of generators
+      density : pixel weights, e.g. (S/N)**2
+      nbin    : number of generators wanted
+    """
+
+
+    area = np.bincount(clas, minlength=xnode.size)
+    good = np.where(area > 0)[0]
+    n = good.size
+
+    if nbin <= n:
+        keep = np.sort(good[_morton(xnode[good], ynode[good])[
+            ((np.arange(nbin)+0.5)*n/nbin).astype(int)]])
+        return xnode[keep], ynode[keep]
+
+    # generators per bin, as even as possible and at most one per pixel
+    split = np.zeros(xnode.size, dtype=int)
+    split[good] = np.diff(np.arange(n+1)*nbin//n)
+    split = np.minimum(split, area)
+
+    # pixels sorted by bin and in Morton order within each bin, with a small
+    # floor on the density so that every pixel has some weight
+    order = _morton(x, y)
+    order = order[np.argsort(clas[order], kind="stable")]
+    weight = np.maximum(density[order], 1e-6*density.mean() + 1e-300)
+    cumulative = np.cumsum(weight)
+    last = np.cumsum(area)
+    first = last - area
+    before = np.concatenate([[0.], cumulative])[first]
+    mass = np.concatenate([[0.], cumulative])[last] - before
+
+    # equal-density quantiles of the bins that are split
+    bins = np.repeat(np.arange(xnode.size), split)
+    j = np.arange(bins.size) - np.repeat(np.cumsum(split)-split, split)
+    q = before[bins] + (j+0.5)/split[bins]*mass[bins]
+    pick = np.clip(np.searchsorted(cumulative, q), first[bins],
+        last[bins]-1)
+    pick = np.unique(order[pick])
+
+    # bins that are not split keep their generator
+    single = np.where(split == 1)[0]
+    pick = pick[split[clas[pick]] > 1]
+
+    return np.concatenate([xnode[single], x[pick]]), \
+        np.concatenate([ynode[single], y[pick]])
+
+
+def _morton(x, y, bits=16):
+
+    # order of the points along a Morton (Z-order) curve over their bounding
+    # box
+    scale = (1 << bits) - 1
+    code = np.zeros(x.size, dtype=np.int64)
+    for c, shift in ((x, 0), (y, 1)):
+        span = np.ptp(c)
+        i = np.zeros(c.size, dtype=np.int64) if span == 0 else \
+            np.round((c-c.min())/span*scale).astype(np.int64)
+        for b in range(bits):
+            code |= ((i >> b) & 1) << (2*b+shift)
+
+    return np.argsort(code, kind="stable")
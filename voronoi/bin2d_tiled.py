@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN2D_TILED
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.spatial import cKDTree
+from .bin2d_many import bin2d_many
+from .cvt_equal_mass import cvt_equal_mass
+from .voronoi_tessellation import voronoi_tessellation
+from .binning_result import BinningResult
+
+
+def bin2d_tiled(x, y, signal, noise, targetsn, tilesize, halo=None,
+    processes=None, cvt=True, wvt=False, quiet=True, pixelsize=False,
+    maxmem=2**26, tol=0., maxiter=None, relax=1., incremental=False):
+
+    """
+    Bins a field too large to bin in one go, e.g. a survey mosaic, tile by
+    tile.  Returns a BinningResult, as bin2d.
+
+    The field is cut into square tiles of side tilesize, and each tile is
+    binned with bin2d together with a halo of the pixels within halo of it,
+    by a pool of worker processes (see bin2d_many).  Each tile keeps the bins
+    whose generators lie inside it, so that every bin is made by the tile
+    that sees all of its surroundings, and the bins of all the tiles are
+    numbered in tile order.  Pixels of a tile taken by a bin of another tile
+    go to the nearest of the bins kept.  Finally the bins along the borders
+    between tiles are relaxed together with the CVT, one L-shaped strip of
+    width 2*halo along the lower and left borders of each tile at a time, so
+    that they match across the borders.
+
+    The seams are reduced but not removed: the S/N of the bins still
+    scatters somewhat more near the tile borders than in the tile interiors
+    or with bin2d, e.g. 5.7% against 5.2% (bin2d 5.0%) with the CVT, and
+    6.7% against 5.6% (bin2d 5.4%) with the WVT, for 64-pixel tiles of a
+    256x256 field (see benchmarks/tiled_seams.py).  Relaxing the borders
+    again does not change this.
+
+    Only one tile (plus halo) at a time is binned by each worker, and only
+    the pixels around one border at a time are relaxed, so the memory used
+    is set by the tile size, apart from a few integers per pixel for the
+    bin numbers and the pixel order.  The inputs can be arrays or names of
+    .npy files, which are memory-mapped and read a tile at a time.  The halo
+    should be larger than the bins.
+
+    INPUTS
+      x        : x-coordinates of pixels
+      y        : y-coordinates of pixels
+      signal   : signal in pixels
+      noise    : noise in pixels
+      targetsn : target S/N required
+      tilesize : side of the tiles, in the units of x and y
+
+    OPTIONS
+      halo      : width of the halo around each tile [default tilesize/4]
+      processes : number of worker processes [default number of CPUs]
+      cvt       : use Modified-Lloyd algorithm [default True]
+      wvt       : use additional modification by Diehl & Statler [default False]
+      quiet     : supress output [default True]
+      pixelsize : pixel scale of the input data, if known; otherwise it is
+                  estimated for each tile
+      maxmem    : memory limit in bytes for temporary arrays [default 64 MB]
+      tol, maxiter, relax, incremental : options of the CVT, as in bin2d
+    """
+
+
+    x, y, signal, noise = [np.load(a, mmap_mode="r") if isinstance(a, str)
+        else np.asarray(a) for a in (x, y, signal, noise)]
+    npix = x.size
+    if y.size != npix or signal.size != npix or noise.size != npix:
+        print("ERROR: input vectors (x, y, signal, noise) must have same size")
+        return
+    if halo is None: halo = tilesize/4.
+    options = dict(wvt=wvt, maxmem=maxmem, tol=tol, maxiter=maxiter,
+        relax=relax, incremental=incremental)
+    chunk = max(int(maxmem//8), 1)
+
+    # one pass over the pixels for the extent, the noise floor (as in bin2d)
+    # and the tile of every pixel
+    xmin = min(x[i:i+chunk].min() for i in range(0, npix, chunk))
+    ymin = min(y[i:i+chunk].min() for i in range(0, npix, chunk))
+    xmax = max(x[i:i+chunk].max() for i in range(0, npix, chunk))
+    ymax = max(y[i:i+chunk].max() for i in range(0, npix, chunk))
+    if min(noise[i:i+chunk].min() for i in range(0, npix, chunk)) < 0:
+        print("ERROR: noise cannot be negative")
+        return
+    floor = min(np.min(noise[i:i+chunk][noise[i:i+chunk] > 0], initial=np.inf)
+        for i in range(0, npix, chunk)) * 1e-9
+    ntx = int((xmax-xmin)//tilesize) + 1
+    nty = int((ymax-ymin)//tilesize) + 1
+    tile = np.empty(npix, dtype=np.int64)
+    for i in range(0, npix, chunk):
+        tile[i:i+chunk] = ((y[i:i+chunk]-ymin)//tilesize).astype(np.int64) \
+            *ntx + ((x[i:i+chunk]-xmin)//tilesize).astype(np.int64)
+    order = np.argsort(tile, kind="stable")
+    start = np.searchsorted(tile[order], np.arange(ntx*nty+1))
+    del tile
+    tiles = [t for t in range(ntx*nty) if start[t+1] > start[t]]
+    field = _Field(x, y, signal, noise, floor, xmin, ymin, tilesize, ntx,
+        nty, order, start)
+
+    # bin the tiles with their halos
+    def jobs():
+        for t in tiles:
+            p = field.pixels(t, halo)
+            yield x[p], y[p], signal[p], noise[p], targetsn
+
+    clas = np.full(npix, -1, dtype=np.int64)
+    xnode = []
+    ynode = []
+    scale = []
+    nbin = 0
+    for job, result, error in bin2d_many(jobs(), processes=processes,
+        cvt=cvt, pixelsize=pixelsize, **options):
+
+        t = tiles[job]
+        if error is not None:
+            # e.g. no bin of the tile reaches the target: treat the tile as
+            # too faint to bin on its own
+            print("WARNING: tile {:} could not be binned ({:})".format(t,
+                error))
+            continue
+        p = field.pixels(t, halo)
+        core = field.tile(t, x[p], y[p])
+
+        if result is None:
+            # bin2d refused the tile: if all its pixels are above the target
+            # they are bins of their own, otherwise the tile has too little
+            # signal and its pixels go to the bins of the other tiles (as
+            # for the tiles that fail above)
+            sn = signal[p]/np.maximum(noise[p], floor)
+            if not (sn > targetsn).all(): continue
+            local = np.arange(p.size)
+            tx, ty = x[p], y[p]
+            ts = np.ones(p.size)
+        else:
+            local, tx, ty, sn, area, ts = result
+            ts = _finite_scale(np.broadcast_to(np.asarray(ts, dtype=float),
+                tx.shape))
+            area = np.bincount(local, minlength=tx.size)
+
+        keep = field.tile(t, tx, ty)
+        if result is not None: keep &= area > 0
+        number = np.full(tx.size, -1, dtype=np.int64)
+        number[keep] = nbin + np.arange(keep.sum())
+        nbin += keep.sum()
+        clas[p[core]] = number[local[core]]
+        xnode.append(tx[keep])
+        ynode.append(ty[keep])
+        scale.append(ts[keep])
+        if not quiet:
+            print("tile {:} / {:}: {:} bins".format(job+1, len(tiles),
+                keep.sum()))
+
+    if nbin == 0:
+        print("Not enough S/N in any of the tiles.")
+        return
+    xnode = np.concatenate(xnode)
+    ynode = np.concatenate(ynode)
+    scale = np.concatenate(scale)
+
+    # pixels not in a bin of their own tile go to the nearest bin kept
+    tree = cKDTree(np.column_stack([xnode, ynode]))
+    k = min(8, nbin)
+    for i in range(0, npix, chunk):
+        left = np.where(clas[i:i+chunk] < 0)[0] + i
+        if left.size == 0: continue
+        xl = np.asarray(x[left], dtype=float)
+        yl = np.asarray(y[left], dtype=float)
+        near = tree.query(np.column_stack([xl, yl]), k=k)[1].reshape(-1, k)
+        d = ((xl[:,None]-xnode[near])/scale[near])**2 \
+            + ((yl[:,None]-ynode[near])/scale[near])**2
+        clas[left] = near[np.arange(left.size), d.argmin(axis=1)]
+
+    # relax the bins along the tile borders
+    if cvt and len(tiles) > 1:
+        for t in range(ntx*nty):
+            field.relax_border(t, halo, clas, xnode, ynode, scale, options)
+
+    # bin properties, a chunk of pixels at a time
+    s = np.zeros(nbin)
+    n2 = np.zeros(nbin)
+    area = np.zeros(nbin, dtype=np.int64)
+    for i in range(0, npix, chunk):
+        c = clas[i:i+chunk]
+        s += np.bincount(c, weights=signal[i:i+chunk], minlength=nbin)
+        n2 += np.bincount(c, weights=np.maximum(noise[i:i+chunk], floor)**2,
+            minlength=nbin)
+        area += np.bincount(c, minlength=nbin)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sn = s/np.sqrt(n2)
+    if not wvt: scale = 1.
+    binned = area > 1
+    scatter = float(((sn[binned]-targetsn)/targetsn*100).std())
+
+    if not quiet:
+        print("{:} bins in {:} tiles".format(nbin, len(tiles)))
+        print("Fractional S/N scatter (%):", scatter)
+
+    return BinningResult(clas, xnode, ynode, sn, area, scale,
+        scatter=scatter)
+
+
+class _Field(object):
+
+    # pixels of a tiled field: the pixels of tile t are
+    # order[start[t]:start[t+1]]
+
+    def __init__(self, x, y, signal, noise, floor, xmin, ymin, tilesize, ntx,
+        nty, order, start):
+        self.x = x
+        self.y = y
+        self.signal = signal
+        self.noise = noise
+        self.floor = floor
+        self.xmin = xmin
+        self.ymin = ymin
+        self.size = tilesize
+        self.ntx = ntx
+        self.nty = nty
+        self.order = order
+        self.start = start
+
+
+    def tile(self, t, x, y):
+
+        # True for the points that lie in tile t
+        return ((y-self.ymin)//self.size == t//self.ntx) \
+            & ((x-self.xmin)//self.size == t % self.ntx)
+
+
+    def box(self, x0, x1, y0, y1):
+
+        # indices (sorted) of the pixels in the box x0 <= x < x1, y0 <= y < y1
+        tx = np.arange(max(int((x0-self.xmin)//self.size), 0),
+            min(int((x1-self.xmin)//self.size), self.ntx-1)+1)
+        ty = np.arange(max(int((y0-self.ymin)//self.size), 0),
+            min(int((y1-self.ymin)//self.size), self.nty-1)+1)
+        p = np.sort(np.concatenate([np.zeros(0, dtype=np.int64)] + [
+            self.order[self.start[t]:self.start[t+1]]
+            for t in (ty[:,None]*self.ntx + tx).ravel()]))
+        x = self.x[p]
+        y = self.y[p]
+
+        return p[(x >= x0) & (x < x1) & (y >= y0) & (y < y1)]
+
+
+    def corner(self, t):
+        return self.xmin + (t % self.ntx)*self.size, \
+            self.ymin + (t//self.ntx)*self.size
+
+
+    def pixels(self, t, halo):
+
+        # indices (sorted) of the pixels of tile t and its halo
+        x0, y0 = self.corner(t)
+        return self.box(x0-halo, x0+self.size+halo, y0-halo,
+            y0+self.size+halo)
+
+
+    def relax_border(self, t, halo, clas, xnode, ynode, scale, options):
+
+        # CVT of the bins whose generators lie within halo of the lower and
+        # left borders of tile t, on the pixels of those bins
+        x0, y0 = self.corner(t)
+        tx = t % self.ntx
+        ty = t//self.ntx
+        s = self.size
+        strip = np.zeros(xnode.size, dtype=bool)
+        if tx > 0:
+            strip |= (np.abs(xnode-x0) < halo) & (ynode >= y0-halo) \
+                & (ynode < y0+s)
+        if ty > 0:
+            strip |= (np.abs(ynode-y0) < halo) & (xnode >= x0-halo) \
+                & (xnode < x0+s)
+        if strip.sum() < 2: return
+
+        p = self.box(x0-2*halo, x0+s+halo, y0-2*halo, y0+s+halo)
+        p = p[strip[clas[p]]]
+        bins, local = np.unique(clas[p], return_inverse=True)
+        if bins.size < 2: return
+        x = np.asarray(self.x[p], dtype=float)
+        y = np.asarray(self.y[p], dtype=float)
+        signal = np.asarray(self.signal[p], dtype=float)
+        noise = np.maximum(np.asarray(self.noise[p], dtype=float), self.floor)
+
+        xn = xnode[bins]
+        yn = ynode[bins]
+        sc = _finite_scale(cvt_equal_mass(x, y, signal, noise, xn, yn,
+            quiet=True, **options)[0])
+        local = voronoi_tessellation(x, y, xn, yn, sc,
+            maxmem=options["maxmem"])
+        clas[p] = bins[local]
+        xnode[bins] = xn
+        ynode[bins] = yn
+        scale[bins] = sc
+
+
+def _finite_scale(scale):
+
+    # WVT scales of bins with no pixels are NaN (sqrt(area/sn) = 0/0): give
+    # them the median scale, so that they neither win nor poison the
+    # nearest-bin searches; a single scale is left as is
+    if np.ndim(scale) == 0: return scale
+    scale = np.array(scale, dtype=float)
+    bad = ~np.isfinite(scale) | (scale <= 0)
+    if bad.any():
+        scale[bad] = np.median(scale[~bad]) if not bad.all() else 1.
+
+    return scale
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN_ACCUMULATOR
+# -----------------------------------------------------------------------------
+
+from math import pi, sqrt, hypot
+import numpy as np
+from .bin_roundness import bin_roundness
+
+
+class BinAccumulator(object):
+
+    """
+    Running statistics of the bin currently being accreted, so that testing
+    a candidate pixel costs O(1) rather than O(bin size).
+
+    The accumulator keeps the sums of signal, noise**2, x and y over the
+    member pixels, together with a bound on the largest distance of any
+    member from a reference point (the bin centroid when the bound was last
+    computed exactly).  The roundness of eq 5 of Cappellari & Copin (2003)
+    with a candidate pixel added is bracketed from that bound, and is only
+    recomputed exactly from the member pixels when the bracket straddles the
+    roundness limit.
+
+    INPUTS
+      x         : x-coordinates of pixels
+      y         : y-coordinates of pixels
+      signal    : signal in pixels
+      noise     : noise in pixels
+      pixelsize : size of pixels
+
+    OPTIONS
+      weights   : number of pixels that each pixel stands for, e.g. for
+                  superpixels, which weights their centroids and the area
+                  of the bin [default 1 for all pixels]
+      noise2    : squared noise of the pixels, if already computed
+    """
+
+
+    def __init__(self, x, y, signal, noise, pixelsize, weights=None,
+        noise2=None):
+
+        self.x = x
+        self.y = y
+        self.pixelsize = pixelsize
+        self.xs = x.tolist()
+        self.ys = y.tolist()
+        self.weights = weights
+        self.ws = [1.]*x.size if weights is None else weights.tolist()
+        self.signal = signal.tolist()
+        self.noise2 = (noise**2 if noise2 is None else noise2).tolist()
+
+
+    def start(self, k):
+
+        """
+        Resets the bin to the single pixel k.
+
+        INPUTS
+          k : index of the first pixel of the bin
+        """
+
+        self.members = [k]
+        self.n = self.ws[k]
+        self.sumsignal = self.signal[k]
+        self.sumnoise2 = self.noise2[k]
+        self.sumx = self.ws[k]*self.xs[k]
+        self.sumy = self.ws[k]*self.ys[k]
+
+        # all members lie within rmax of (xref, yref)
+        self.xref = self.xs[k]
+        self.yref = self.ys[k]
+        self.rmax = 0.
+
+
+    @property
+    def xbar(self):
+        return self.sumx/self.n
+
+
+    @property
+    def ybar(self):
+        return self.sumy/self.n
+
+
+    def centroid(self):
+
+        """
+        Returns the centroid of the bin computed as a mean over its member
+        pixels, in the order they were added, rather than from the running
+        sums, which differ from it by rounding.
+        """
+
+        # x.sum()/n is what x.mean() computes
+        x = self.x[self.members]
+        y = self.y[self.members]
+        if self.weights is not None:
+            w = self.weights[self.members]
+            x = w*x
+            y = w*y
+        return x.sum()/self.n, y.sum()/self.n
+
+
+    def sn_with(self, k):
+
+        """
+        Returns the S/N of the bin with pixel k added.
+
+        INPUTS
+          k : index of candidate pixel
+        """
+
+        return (self.sumsignal + self.signal[k]) \
+            / sqrt(self.sumnoise2 + self.noise2[k])
+
+
+    def roundness_exceeds(self, k, limit):
+
+        """
+        Returns True if the roundness of the bin with pixel k added is
+        greater than limit.
+
+        INPUTS
+          k     : index of candidate pixel
+          limit : maximum allowed roundness
+        """
+
+        xk = self.xs[k]
+        yk = self.ys[k]
+        wk = self.ws[k]
+        n = self.n + wk
+        xbar = (self.sumx + wk*xk)/n
+        ybar = (self.sumy + wk*yk)/n
+
+        # bracket the maximum distance of a pixel from the new centroid
+        shift = hypot(xbar-self.xref, ybar-self.yref)
+        dk = hypot(xk-xbar, yk-ybar)
+        upper = max(self.rmax + shift, dk)
+        lower = max(self.rmax - shift, dk)
+
+        maxdistance = (1. + limit)*sqrt(n/pi)*self.pixelsize
+        if upper < maxdistance*(1.-1e-9): return False
+        if lower > maxdistance*(1.+1e-9): return True
+
+        # too close to call: recompute exactly, and tighten the bound
+        # around the new centroid
+        pix = self.members + [k]
+        x = self.x[pix]
+        y = self.y[pix]
+        if self.weights is None:
+            self.xref = x.mean()
+            self.yref = y.mean()
+        else:
+            w = self.weights[pix]
+            self.xref = (w*x).sum()/n
+            self.yref = (w*y).sum()/n
+        self.rmax = np.sqrt((x[:-1]-self.xref)**2
+            + (y[:-1]-self.yref)**2).max()
+
+        if self.weights is None:
+            return bin_roundness(x, y, self.pixelsize) > limit
+        maxdistance = np.sqrt((x-self.xref)**2 + (y-self.yref)**2).max()
+        return maxdistance/(sqrt(n/pi)*self.pixelsize) - 1. > limit
+
+
+    def add(self, k):
+
+        """
+        Adds pixel k to the bin.
+
+        INPUTS
+          k : index of pixel to add
+        """
+
+        xk = self.xs[k]
+        yk = self.ys[k]
+        wk = self.ws[k]
+        self.members.append(k)
+        self.n += wk
+        self.sumsignal += self.signal[k]
+        self.sumnoise2 += self.noise2[k]
+        self.sumx += wk*xk
+        self.sumy += wk*yk
+        self.rmax = max(self.rmax, hypot(xk-self.xref, yk-self.yref))
@@ -6,10 +6,14 @@
 # -----------------------------------------------------------------------------
 
 import numpy as np
-from .weighted_centroid import weighted_centroid
+from .bin_statistics import bin_centroids, bin_sn
+from .voronoi_tessellation import voronoi_tessellation
+from .raster_tessellation import raster_tessellation
+from .pixel_data import PixelData
 
 
-def bin_quantities(x, y, signal, noise, xnode, ynode, scale):
+def bin_quantities(x, y, signal, noise, xnode, ynode, scale, maxmem=2**26,
+    image=None, data=None):
     
     """
     Recomputes (weighted) voronoi tessellation of the pixels grid to make
@@ -25,25 +29,29 @@ def bin_quantities(x, y, signal, noise, xnode, ynode, scale):
       xnode  : x-coordinates of bins
       ynode  : y-coordinates of bins
       scale  : bin scale
+    
+    OPTIONS
+      maxmem : memory limit in bytes for the temporary arrays of the
+               tessellation [default 64 MB]
+      image  : (row, col) of the pixels in an image, where x=col and y=row,
+               to use raster_tessellation when the scale is the same for all
+               bins [default None]
+      data   : PixelData of the pixels, to re-use its squared noise; signal
+               and noise are then taken from it
     """
     
-    clas = np.zeros(x.size, dtype="int")   # will contain bin num of given pixels
-    for j in range(x.size):
-        clas[j] = (((x[j]-xnode)/scale)**2 + ((y[j]-ynode)/scale)**2).argmin()
+    # bin number of each pixel
+    if image is not None and np.ndim(scale) == 0:
+        clas = raster_tessellation(image[0], image[1], xnode, ynode,
+            maxmem=maxmem)
+    else:
+        clas = voronoi_tessellation(x, y, xnode, ynode, scale, maxmem=maxmem)
     
     # At the end of the computation evaluate the bin luminosity-weighted
     # centroids (xbar,ybar) and the corresponding final S/N of each bin.
     
-    area, lim = np.histogram(clas, bins=int(clas.ptp())+1,
-        range=(clas.min()-0.5, clas.max()+0.5))
-    cent = (lim[:-1]+lim[1:])/2.
-    
-    xb = np.zeros(xnode.size)
-    yb = np.zeros(xnode.size)
-    sn = np.zeros(xnode.size)
-    for j in range(xnode.size):
-        pix = np.where(clas == cent[j])[0]
-        xb[j], yb[j] = weighted_centroid(x[pix], y[pix], signal[pix])
-        sn[j] = signal[pix].sum()/np.sqrt((noise[pix]**2).sum())
+    if data is None: data = PixelData(signal, noise)
+    area, xb, yb = bin_centroids(clas, x, y, data.signal, xnode.size)
+    sn = bin_sn(clas, data.signal, data.noise, xnode.size, data.noise2)
     
     return clas, xb, yb, sn, area
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BIN_STATISTICS
+# -----------------------------------------------------------------------------
+
+import numpy as np
+
+
+def bin_centroids(clas, x, y, density=None, nbin=None):
+
+    """
+    Computes the number of pixels and the (weighted) centroid of every bin in
+    a single pass over the pixels -- eq 4 of Cappellari & Copin (2003) for
+    all bins at once.  Empty bins have NaN centroids.
+
+    INPUTS
+      clas    : bin number of each pixel (0 to nbin-1)
+      x       : x-coordinates of pixels
+      y       : y-coordinates of pixels
+
+    OPTIONS
+      density : pixel weights; geometric centroids if not given
+      nbin    : number of bins [default clas.max()+1]
+    """
+
+
+    if nbin is None: nbin = clas.max() + 1
+    area = np.bincount(clas, minlength=nbin)
+    if density is None:
+        mass = area
+        xsum = np.bincount(clas, weights=x, minlength=nbin)
+        ysum = np.bincount(clas, weights=y, minlength=nbin)
+    else:
+        mass = np.bincount(clas, weights=density, minlength=nbin)
+        xsum = np.bincount(clas, weights=x*density, minlength=nbin)
+        ysum = np.bincount(clas, weights=y*density, minlength=nbin)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xbar = xsum/mass
+        ybar = ysum/mass
+
+    return area, xbar, ybar
+
+
+def bin_sn(clas, signal, noise, nbin=None, noise2=None):
+
+    """
+    Computes the signal-to-noise ratio of every bin in a single pass over the
+    pixels.  Empty bins have NaN S/N.
+
+    INPUTS
+      clas   : bin number of each pixel (0 to nbin-1)
+      signal : signal in pixels
+      noise  : noise in pixels
+
+    OPTIONS
+      nbin   : number of bins [default clas.max()+1]
+      noise2 : squared noise of the pixels, if already computed
+    """
+
+
+    if nbin is None: nbin = clas.max() + 1
+    if noise2 is None: noise2 = noise**2
+    s = np.bincount(clas, weights=signal, minlength=nbin)
+    n2 = np.bincount(clas, weights=noise2, minlength=nbin)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sn = s/np.sqrt(n2)
+
+    return sn
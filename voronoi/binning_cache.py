@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BINNING_CACHE
+# -----------------------------------------------------------------------------
+
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from . import __version__
+from .bin2d import bin2d
+from .binning_result import BinningResult
+
+try:
+    import fcntl
+except ImportError:                 # not on Windows: no lock for eviction
+    fcntl = None
+
+
+class BinningCache(object):
+
+    """
+    Cache of bin2d results, keyed by a hash of the contents of the input
+    arrays, the target S/N, the options of bin2d that change the result and
+    the version of the package, so that binning the same field again with
+    the same options costs only the hash of its arrays.
+
+    Results are kept in two tiers: the last maxitems results used in memory,
+    and, if a directory is given, every result as a .npz file there (see
+    BinningResult.save) up to maxbytes in total, the least recently used
+    files being removed first.  The directory can be shared by several
+    processes: files are written under a temporary name and renamed into
+    place, so a file is either complete or absent, and eviction is done
+    under a lock file.
+
+    The counters hits (memory_hits + disk_hits) and misses give the use of
+    the cache.  Results in memory are shared by all the calls that hit
+    them, so they should not be changed.
+
+    OPTIONS
+      directory : directory of the disk tier [default None, memory only]
+      maxitems  : number of results kept in memory [default 16]
+      maxbytes  : size limit of the disk tier in bytes [default 1 GB]
+    """
+
+
+    def __init__(self, directory=None, maxitems=16, maxbytes=2**30):
+
+        self.directory = directory
+        self.maxitems = maxitems
+        self.maxbytes = maxbytes
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None: os.makedirs(directory, exist_ok=True)
+
+
+    @property
+    def hits(self):
+        """number of results found in the cache"""
+        return self.memory_hits + self.disk_hits
+
+
+    def stats(self):
+
+        """
+        Returns the counters of the cache as a dictionary.
+        """
+
+        return dict(hits=self.hits, memory_hits=self.memory_hits,
+            disk_hits=self.disk_hits, misses=self.misses,
+            items=len(self.memory))
+
+
+    def bin2d(self, x, y, signal, noise, targetsn, cvt=True, wvt=False,
+        quiet=True, pixelsize=False, maxmem=2**26, tol=0., maxiter=None,
+        maxtime=None, relax=1., incremental=False, prebin=False,
+        sample=None, dtype=float):
+
+        """
+        bin2d through the cache: returns the cached result for these inputs
+        if there is one, otherwise runs bin2d (without graphs) and caches
+        its result.  Inputs that bin2d rejects (returning None) are not
+        cached.  With maxtime set, the result depends on the speed of the
+        machine, and the first result obtained is the one that is cached.
+
+        INPUTS and OPTIONS as for bin2d
+        """
+
+        options = dict(cvt=cvt, wvt=wvt, pixelsize=pixelsize, tol=tol,
+            maxiter=maxiter, maxtime=maxtime, relax=relax,
+            incremental=incremental, prebin=prebin, sample=sample,
+            dtype=np.dtype(dtype))
+        key = cache_key((x, y, signal, noise), targetsn, options)
+
+        result = self.get(key)
+        if result is not None: return result
+
+        self.misses += 1
+        result = bin2d(x, y, signal, noise, targetsn, quiet=quiet,
+            graphs=False, maxmem=maxmem, **options)
+        if result is not None: self.put(key, result)
+
+        return result
+
+
+    def get(self, key):
+
+        """
+        Returns the result cached under key, or None, and counts a hit if
+        it is found.
+
+        INPUTS
+          key : key of the result (see cache_key)
+        """
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+
+        if self.directory is None: return None
+        filename = self._filename(key)
+        try:
+            result = BinningResult.load(filename)
+            os.utime(filename)          # most recently used
+        except (OSError, ValueError, KeyError):
+            # absent, or removed by another process while being read
+            return None
+        self.disk_hits += 1
+        self._remember(key, result)
+
+        return result
+
+
+    def put(self, key, result):
+
+        """
+        Caches a result under key, in memory and on disk.
+
+        INPUTS
+          key    : key of the result (see cache_key)
+          result : BinningResult to cache
+        """
+
+        self._remember(key, result)
+        if self.directory is None: return
+
+        # write to a temporary file in the same directory, then rename it
+        # into place in one step
+        fd, temporary = tempfile.mkstemp(suffix=".npz.tmp",
+            dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                result.save(f)
+            os.replace(temporary, self._filename(key))
+        except BaseException:
+            if os.path.exists(temporary): os.remove(temporary)
+            raise
+        self._evict()
+
+
+    def clear(self):
+
+        """
+        Empties both tiers of the cache (the counters are kept).
+        """
+
+        self.memory.clear()
+        if self.directory is None: return
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxitems:
+            self.memory.popitem(last=False)
+
+
+    def _evict(self):
+
+        # remove the least recently used files until the disk tier fits in
+        # maxbytes, under a lock so that processes do not evict together
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            if fcntl is not None: fcntl.flock(lock, fcntl.LOCK_EX)
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".npz"): continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(f[1] for f in files)
+            for mtime, size, name in sorted(files):
+                if total <= self.maxbytes: break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+
+
+def cache_key(arrays, targetsn, options):
+
+    """
+    Key of a binning in the cache: a hex digest (BLAKE2b) of the dtype,
+    shape and contents of the input arrays, the target S/N, the options and
+    the version of the package.
+
+    INPUTS
+      arrays   : input arrays (x, y, signal, noise)
+      targetsn : target S/N
+      options  : dictionary of the options of bin2d that change the result
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        digest.update("{:}{:}".format(a.dtype.str, a.shape).encode())
+        digest.update(memoryview(a).cast("B"))
+    digest.update(repr((float(targetsn), sorted(options.items()),
+        __version__)).encode())
+
+    return digest.hexdigest()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BINNING_OPERATOR
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class BinningOperator(object):
+
+    """
+    Linear operator that bins pixel data with a given binning, e.g. the clas
+    returned by bin2d, as a sparse matrix of nbin x npix whose element
+    (i, k) is the weight of pixel k in bin i (1 without weights).  It bins
+    whole spectral datacubes (nwave x npix, or nwave x any image shape with
+    npix pixels) in one sparse matrix product per chunk of wavelengths, so a
+    cube memory-mapped from disk (e.g. np.load(file, mmap_mode="r")) is
+    streamed through in chunks of at most maxmem bytes, and the results can
+    be written to a memory-mapped output array.
+
+    INPUTS
+      clas    : bin number of each pixel (0 to nbin-1)
+
+    OPTIONS
+      nbin    : number of bins [default clas.max()+1]
+      weights : weight of each pixel [default 1 for all pixels]
+      maxmem  : memory limit in bytes for each chunk of the cube
+                [default 64 MB]
+    """
+
+
+    def __init__(self, clas, nbin=None, weights=None, maxmem=2**26):
+
+        clas = np.asarray(clas).ravel()
+        if nbin is None: nbin = int(clas.max()) + 1
+        self.npix = clas.size
+        self.nbin = nbin
+        self.maxmem = maxmem
+
+        if weights is None:
+            weights = np.ones(self.npix)
+        else:
+            weights = np.asarray(weights, dtype=float).ravel()
+            if weights.size != self.npix:
+                raise ValueError("weights must have one value per pixel")
+
+        pixels = np.arange(self.npix)
+        self.matrix = csr_matrix((weights, (clas, pixels)),
+            shape=(nbin, self.npix))
+        self.matrix2 = csr_matrix((weights**2, (clas, pixels)),
+            shape=(nbin, self.npix))
+
+        # total weight of every bin, for the means
+        self.norm = np.bincount(clas, weights=weights, minlength=nbin)
+
+
+    def __len__(self):
+        return self.nbin
+
+
+    def sum(self, cube, out=None):
+
+        """
+        Weighted sum of the pixels of every bin, for each wavelength.
+
+        Returns an array of nwave x nbin (nbin for a single image).
+
+        INPUTS
+          cube : pixel data, nwave x npix (or nwave x image shape, or a
+                 single image of npix pixels)
+
+        OPTIONS
+          out  : output array of nwave x nbin (or contiguous, of that
+                 size), e.g. memory-mapped
+        """
+
+        return self._apply(self.matrix, cube, out)
+
+
+    def mean(self, cube, out=None):
+
+        """
+        Weighted mean of the pixels of every bin, for each wavelength.
+        Empty bins (or bins of zero weight) are NaN.
+
+        Returns an array of nwave x nbin (nbin for a single image).
+
+        INPUTS
+          cube : pixel data, nwave x npix (or nwave x image shape, or a
+                 single image of npix pixels)
+
+        OPTIONS
+          out  : output array of nwave x nbin (or contiguous, of that
+                 size), e.g. memory-mapped
+        """
+
+        return self._apply(self.matrix, cube, out, mean=True)
+
+
+    def noise(self, noise, mean=False, out=None):
+
+        """
+        Noise of the weighted sum (or weighted mean) of every bin, adding the
+        pixel noise in quadrature: sqrt(sum(weight**2 * noise**2)).
+
+        Returns an array of nwave x nbin (nbin for a single image).
+
+        INPUTS
+          noise : pixel noise, nwave x npix (or nwave x image shape, or a
+                  single image of npix pixels)
+
+        OPTIONS
+          mean  : noise of the weighted mean rather than of the weighted sum
+                  [default False]
+          out   : output array of nwave x nbin (or contiguous, of that
+                  size), e.g. memory-mapped
+        """
+
+        return self._apply(self.matrix2, noise, out, square=True, mean=mean)
+
+
+    def _apply(self, matrix, cube, out, square=False, mean=False):
+
+        # one sparse product per chunk of wavelengths, each chunk holding at
+        # most maxmem bytes
+        single = np.ndim(cube) == 1
+        nwave = 1 if single else len(cube)
+        if out is None:
+            out = np.empty((nwave, self.nbin))
+        result = out.reshape(nwave, self.nbin)
+        if not np.shares_memory(result, out):
+            # the reshape made a copy, which would be filled instead of out
+            raise ValueError("out must be reshapable to nwave x nbin without "
+                "a copy, e.g. a contiguous array")
+        chunk = max(min(int(self.maxmem//(8*self.npix)), nwave), 1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(0, nwave, chunk):
+                n = min(chunk, nwave-i)
+                block = np.asarray(cube if single else cube[i:i+n],
+                    dtype=float).reshape(n, self.npix)
+                if square: block = block**2
+                binned = (matrix @ block.T).T
+                if square: np.sqrt(binned, out=binned)
+                if mean: binned /= self.norm
+                result[i:i+n] = binned
+
+        return out[0] if single and out.ndim == 2 else out
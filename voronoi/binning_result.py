@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BINNING_RESULT
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from .pixel_io import mmap_npz
+
+
+class BinningResult(object):
+
+    """
+    Result of a binning, as returned by bin2d.  It unpacks and indexes like
+    the tuple (clas, xnode, ynode, sn, area, scale) that bin2d used to
+    return, and in addition
+
+      - holds clas as platform integers (numpy.intp), so that arithmetic on
+        the bin numbers cannot overflow, but saves it in the smallest signed
+        integer type that holds them (-1 may mark pixels that are not
+        binned, as in bin2d_image);
+      - holds the pixels of every bin as CSR-style arrays, so that the
+        pixels of bin k, members(k), are found without a scan of clas: the
+        flat indices of the pixels of bin k are
+        index[offsets[k]:offsets[k+1]], in increasing order;
+      - saves to and loads from a .npz file (see save and load), whose
+        arrays can be memory-mapped on loading.
+
+    INPUTS
+      clas  : bin number of each pixel (any shape, e.g. an image)
+      xnode : x-coordinates of bins
+      ynode : y-coordinates of bins
+      sn    : S/N of bins
+      area  : number of pixels in bins
+      scale : bin scale (a number, or one per bin)
+
+    OPTIONS
+      index, offsets : pixels of the bins, as above, if already known
+      scatter        : fractional S/N scatter (%) of the bins of more than
+                       one pixel, as printed by bin2d, e.g. to compare an
+                       approximate binning (the sample option of bin2d) with
+                       an exact one [default None, not known]
+    """
+
+    fields = ("clas", "xnode", "ynode", "sn", "area", "scale")
+
+
+    def __init__(self, clas, xnode, ynode, sn, area, scale, index=None,
+        offsets=None, scatter=None):
+
+        nbin = len(xnode)
+        clas = np.asarray(clas)
+        if clas.dtype != np.intp: clas = clas.astype(np.intp)
+        self.clas = clas
+        self.xnode = xnode
+        self.ynode = ynode
+        self.sn = sn
+        self.area = area
+        self.scale = scale
+        self.scatter = scatter
+
+        if index is None or offsets is None:
+            # stable sort of the labels (a radix sort, in the smallest type
+            # that holds them, when that is small), with the unbinned pixels
+            # (-1) first and left out
+            flat = clas.ravel()
+            index = np.argsort(flat.astype(_label_type(nbin)), kind="stable")
+            counts = np.bincount(flat[flat >= 0], minlength=nbin)
+            index = index[flat.size-counts.sum():]
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            index = index.astype(_label_type(flat.size), copy=False)
+        self.index = index
+        self.offsets = offsets
+
+
+    def __iter__(self):
+        return iter((self.clas, self.xnode, self.ynode, self.sn, self.area,
+            self.scale))
+
+
+    def __len__(self):
+        return len(self.fields)
+
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+
+    def __repr__(self):
+        return "BinningResult({:} pixels in {:} bins)".format(self.clas.size,
+            self.nbin)
+
+
+    @property
+    def nbin(self):
+        """number of bins"""
+        return len(self.xnode)
+
+
+    def members(self, k):
+
+        """
+        Returns the flat indices of the pixels of bin k, in increasing order.
+
+        INPUTS
+          k : bin number
+        """
+
+        return self.index[self.offsets[k]:self.offsets[k+1]]
+
+
+    def save(self, filename):
+
+        """
+        Writes the result to an uncompressed .npz file, including the pixels
+        of the bins, so that it loads without recomputing anything; clas is
+        written in the smallest signed integer type that holds it.
+
+        INPUTS
+          filename : name of the file
+        """
+
+        extra = {} if self.scatter is None else dict(scatter=self.scatter)
+        np.savez(filename, clas=self.clas.astype(_label_type(self.nbin)),
+            xnode=self.xnode, ynode=self.ynode, sn=self.sn, area=self.area,
+            scale=np.asarray(self.scale), index=self.index,
+            offsets=self.offsets, **extra)
+
+
+    @classmethod
+    def load(cls, filename, mmap=False):
+
+        """
+        Reads a result written by save.  clas is converted back to platform
+        integers, so it is read in full even when memory-mapped.
+
+        INPUTS
+          filename : name of the file
+
+        OPTIONS
+          mmap : memory-map the arrays from the file rather than reading
+                 them, so that only the parts used are read [default False]
+        """
+
+        if mmap:
+            arrays = mmap_npz(filename)
+        else:
+            with np.load(filename) as data:
+                arrays = {key: data[key] for key in data.files}
+        scale = arrays["scale"]
+        if scale.ndim == 0: scale = float(scale)
+
+        scatter = float(arrays["scatter"]) if "scatter" in arrays else None
+
+        return cls(arrays["clas"], arrays["xnode"], arrays["ynode"],
+            arrays["sn"], arrays["area"], scale, index=arrays["index"],
+            offsets=arrays["offsets"], scatter=scatter)
+
+
+def _label_type(n):
+
+    # smallest signed integer type that holds 0 to n (and -1)
+    for dtype in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dtype).max: return np.dtype(dtype)
+    return np.dtype(np.int64)
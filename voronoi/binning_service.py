@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.BINNING_SERVICE
+# -----------------------------------------------------------------------------
+
+import asyncio
+import itertools
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .bin2d import bin2d
+from .events import CVTIteration
+
+
+class JobCancelled(Exception):
+
+    """
+    Raised inside bin2d, at its next event, to stop a job that is cancelled.
+    """
+
+
+class BinningJob(object):
+
+    """
+    A bin2d run for asyncio code (see abin2d and BinningService): bin2d runs
+    in a thread, and its events (see voronoi.events) can be streamed back
+    to the event loop as they happen.
+
+    Awaiting the job gives its BinningResult (or raises the error of
+    bin2d, or CancelledError if the job was cancelled); the events, which
+    include the generators of the bins as the CVT goes, are streamed by
+    "async for event in job.events()".  Events are only passed back to the
+    loop once events() has been called, so that a job whose events are not
+    read costs the loop nothing per event.  cancel() stops the job: at once if
+    it is still queued, otherwise at the next event of bin2d, i.e. at the
+    start of the next accretion bin or after the current CVT iteration.
+
+    INPUTS
+      args    : inputs of bin2d (x, y, signal, noise, targetsn)
+      options : options of bin2d, as a dictionary
+
+    OPTIONS
+      priority : priority of the job in a BinningService, lowest first
+                 [default 0]
+    """
+
+
+    def __init__(self, args, options, priority=0):
+
+        self.args = args
+        self.options = dict(options)
+        self.priority = priority
+        self.status = "queued"
+        self._stop = threading.Event()
+        self._events = asyncio.Queue()
+        self._streaming = False
+        self._result = asyncio.get_running_loop().create_future()
+
+
+    def __await__(self):
+        # a job is not cancelled when a task awaiting it is
+        return asyncio.shield(self._result).__await__()
+
+
+    def __repr__(self):
+        return "BinningJob({:}, priority {:})".format(self.status,
+            self.priority)
+
+
+    def done(self):
+        """True once the job has finished, failed or been cancelled"""
+        return self._result.done()
+
+
+    def cancel(self):
+
+        """
+        Cancels the job: it will not start if it is queued, and stops at the
+        next event of bin2d if it is running.
+        """
+
+        if self.status == "queued":
+            self._finish("cancelled")
+        else:
+            self._stop.set()
+
+
+    def events(self):
+
+        """
+        Returns an async iterator over the events of the job as they happen,
+        from the time events() is called (call it before the job starts to
+        get all of them) until the job ends; the generators of the CVT
+        iterations are copied for it (see CVTIteration.nodes).  The events
+        of a job can only be read once.
+        """
+
+        self._streaming = True
+
+        return self._stream()
+
+
+    async def _stream(self):
+
+        while True:
+            event = await self._events.get()
+            if event is None: return
+            yield event
+
+
+    async def run(self, executor=None):
+
+        """
+        Runs the job in a thread of executor and waits for it to end.  If the
+        task running this is cancelled, bin2d is stopped at its next event,
+        and CancelledError is raised once it has stopped.
+
+        OPTIONS
+          executor : executor to run bin2d in [default that of the loop]
+        """
+
+        if self.done(): return
+        loop = asyncio.get_running_loop()
+        self.status = "running"
+        callback = self.options.pop("callback", None)
+
+        def listen(event):
+            if self._stop.is_set(): raise JobCancelled()
+            if self._streaming:
+                if isinstance(event, CVTIteration): event.nodes()
+                loop.call_soon_threadsafe(self._events.put_nowait, event)
+            if callback is not None: callback(event)
+
+        future = loop.run_in_executor(executor, functools.partial(bin2d,
+            *self.args, callback=listen, **self.options))
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self._stop.set()
+            await asyncio.wait([future])
+            future.exception()              # JobCancelled, most likely
+            self._finish("cancelled")
+            raise
+        except JobCancelled:
+            self._finish("cancelled")
+        except Exception as error:
+            self._finish("failed", error=error)
+        else:
+            self._finish("done", result=result)
+
+
+    def _finish(self, status, result=None, error=None):
+
+        self.status = status
+        if status == "cancelled":
+            self._result.cancel()
+        elif status == "failed":
+            self._result.set_exception(error)
+        else:
+            self._result.set_result(result)
+        self._events.put_nowait(None)
+
+
+async def abin2d(x, y, signal, noise, targetsn, executor=None, **options):
+
+    """
+    bin2d for asyncio code: runs bin2d in a thread, so that the event loop
+    is not blocked, and returns its result.  Cancelling the task that awaits
+    it stops bin2d at its next event (the start of an accretion bin or the
+    end of a CVT iteration).  Use a BinningService to run many binnings, or
+    to stream their events.
+
+    INPUTS and OPTIONS as for bin2d, and
+      executor : executor to run bin2d in [default that of the loop]
+    """
+
+    job = BinningJob((x, y, signal, noise, targetsn), options)
+    await job.run(executor)
+
+    return await job
+
+
+class BinningService(object):
+
+    """
+    Local service that runs many bin2d jobs for asyncio code, without an
+    external broker: jobs are submitted to a queue and run, lowest priority
+    value first (in the order submitted for equal priorities), by a fixed
+    number of worker threads.  The queue holds at most maxqueue jobs, and
+    submit() waits while it is full, which holds back producers that are
+    faster than the workers.  Each job (see BinningJob) can be awaited for
+    its result, cancelled, and have its events streamed.
+
+    Use it as "async with BinningService() as service:", or call start()
+    and close().  As bin2d runs in threads, jobs share the interpreter, and
+    its parts in pure Python (mainly the accretion) run one at a time.
+
+    OPTIONS
+      workers  : number of jobs run at the same time [default 1]
+      maxqueue : number of jobs waiting to run beyond which submit() waits
+                 [default 64]
+    """
+
+
+    def __init__(self, workers=1, maxqueue=64):
+
+        self.workers = workers
+        self.maxqueue = maxqueue
+        self._queue = None
+        self._tasks = []
+        self._executor = None
+        self._order = itertools.count()
+
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await self.close(cancel=exc[0] is not None)
+
+
+    async def start(self):
+
+        """
+        Starts the workers.
+        """
+
+        self._queue = asyncio.PriorityQueue(self.maxqueue)
+        self._executor = ThreadPoolExecutor(self.workers,
+            thread_name_prefix="bin2d")
+        self._tasks = [asyncio.create_task(self._work())
+            for i in range(self.workers)]
+
+
+    async def close(self, cancel=False):
+
+        """
+        Waits for the jobs submitted to end, then stops the workers.
+
+        OPTIONS
+          cancel : cancel the jobs that are queued or running instead of
+                   waiting for them [default False]
+        """
+
+        if cancel:
+            for task in self._tasks: task.cancel()
+            while not self._queue.empty():
+                self._queue.get_nowait()[2].cancel()
+                self._queue.task_done()
+        else:
+            await self._queue.join()
+            for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown()
+        self._tasks = []
+
+
+    async def submit(self, x, y, signal, noise, targetsn, priority=0,
+        **options):
+
+        """
+        Submits a bin2d job and returns it (see BinningJob) once it is
+        queued, waiting while the queue is full.
+
+        INPUTS and OPTIONS as for bin2d, and
+          priority : priority of the job, lowest first [default 0]
+        """
+
+        if not self._tasks: raise RuntimeError("the service is not started")
+        job = BinningJob((x, y, signal, noise, targetsn), options, priority)
+        await self._queue.put((priority, next(self._order), job))
+
+        return job
+
+
+    async def _work(self):
+
+        # run the queued jobs one after the other
+        while True:
+            job = (await self._queue.get())[2]
+            try:
+                await job.run(self._executor)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.CHECKPOINT
+# -----------------------------------------------------------------------------
+
+import os
+import time
+import tempfile
+import numpy as np
+
+
+class Checkpoint(object):
+
+    """
+    State of a binning saved to a .npz file as it goes, so that a run that
+    is interrupted can be resumed (see the checkpoint and resume options of
+    bin2d).  The file holds the last stage completed -- "accretion",
+    "reassign" or "cvt" -- and the arrays saved so far: the accretion labels
+    (clas), the nodes from reassign_bad_bins or, once the CVT is complete,
+    from cvt_equal_mass (xnode, ynode, and scale), and the state of the CVT
+    iterations in progress (as given by cvt_equal_mass to its checkpoint
+    function, under names starting with "cvt_").  It is written under a
+    temporary name and renamed into place, so the file is always a complete
+    checkpoint.
+
+    A key identifying the inputs and options of the binning is saved with
+    the state, and a checkpoint made with another key is not loaded.
+
+    INPUTS
+      filename : name of the checkpoint file
+
+    OPTIONS
+      interval : least time in seconds between two saves of the CVT state;
+                 the end of every stage is always saved [default 60]
+      key      : key of the inputs and options of the binning
+    """
+
+
+    def __init__(self, filename, interval=60., key=""):
+
+        self.filename = filename
+        self.interval = interval
+        self.key = key
+        self.stage = None
+        self.arrays = {}
+        self.saved = time.time()
+
+
+    def __call__(self, state):
+
+        """
+        Saves the state of the CVT iterations, if interval seconds have
+        passed since the last save: the checkpoint function for
+        cvt_equal_mass.
+
+        INPUTS
+          state : dictionary of the state of the iterations
+        """
+
+        if time.time()-self.saved < self.interval: return
+        self.save(self.stage, **{"cvt_"+k: v for k, v in state.items()})
+
+
+    def save(self, stage, **arrays):
+
+        """
+        Records that stage has been completed, with its arrays, and writes
+        the checkpoint file.
+
+        INPUTS
+          stage  : name of the stage completed
+          arrays : arrays to save, as keywords
+        """
+
+        self.stage = stage
+        self.arrays.update(arrays)
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, temporary = tempfile.mkstemp(suffix=".npz.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, stage=stage, key=self.key, **self.arrays)
+            os.replace(temporary, self.filename)
+        except BaseException:
+            if os.path.exists(temporary): os.remove(temporary)
+            raise
+        self.saved = time.time()
+
+
+    def load(self):
+
+        """
+        Reads the checkpoint file, if there is one, and returns the last
+        stage completed (None if there is no file, or no stage was
+        completed); its arrays are then in arrays, and the CVT state, if
+        any, is returned by cvt_state().  Raises ValueError if the
+        checkpoint was made with another key.
+        """
+
+        if not os.path.exists(self.filename): return None
+        with np.load(self.filename) as data:
+            arrays = {k: data[k] for k in data.files}
+        if str(arrays.pop("key")) != self.key:
+            raise ValueError("checkpoint {:} was made for other inputs or "
+                "options".format(self.filename))
+        self.stage = arrays.pop("stage").item()
+        self.arrays = arrays
+
+        return self.stage
+
+
+    def cvt_state(self):
+
+        """
+        Returns the saved state of the CVT iterations as a dictionary for
+        the state option of cvt_equal_mass, or None if there is none.
+        """
+
+        state = {k[4:]: v for k, v in self.arrays.items()
+            if k.startswith("cvt_")}
+        if not state: return None
+        for k in ("iters", "diff", "omega", "elapsed"):
+            state[k] = state[k].item()
+        if state["scale"].ndim == 0: state["scale"] = state["scale"].item()
+
+        return state
+
+
+    def remove(self):
+
+        """
+        Removes the checkpoint file, e.g. once the binning is complete.
+        """
+
+        if os.path.exists(self.filename): os.remove(self.filename)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.COMMAND_LINE
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from .bin2d import bin2d
+from .pixel_io import read_pixels
+from .process_pool import run_in_pool
+
+
+# extensions of the files binned when a directory is given, and of the
+# results, which are left out
+extensions = (".npy", ".npz", ".dat", ".txt")
+suffix = ".bins.npz"
+
+
+def main(argv=None):
+
+    """
+    The voronoi-bin command: bins the fields given as files, directories of
+    files or manifests (lists of files, one per line), and writes the
+    result of each to a binary .npz file (see BinningResult.save).  The
+    fields are read as they are needed, and binned by a pool of worker
+    processes that read, bin and write them, so that any number of fields
+    can be binned with little memory.  A line with the times taken to read,
+    bin and write each field is printed as it is done, and a summary of the
+    throughput at the end.
+
+    Returns the exit status: 0 if all the fields were binned, 1 otherwise.
+
+    OPTIONS
+      argv : command-line arguments [default sys.argv[1:]]
+    """
+
+    parser = argparse.ArgumentParser(prog="voronoi-bin",
+        description="Voronoi binning of fields of pixels to a target S/N.",
+        epilog="Fields are .npy files (a structured array, or an array "
+        "with one column per quantity), .npz files (one array per "
+        "quantity), or text files of whitespace-separated columns like "
+        "example_input.dat; binary files are memory-mapped. The result of "
+        "FIELD.EXT is written to FIELD" + suffix + ".")
+    parser.add_argument("inputs", nargs="*", metavar="FIELD",
+        help="field file, or directory of field files")
+    parser.add_argument("-t", "--targetsn", type=float, required=True,
+        help="target S/N of the bins")
+    parser.add_argument("-m", "--manifest", action="append", default=[],
+        help="file listing fields, one per line ('-' for standard input)")
+    parser.add_argument("-o", "--output",
+        help="directory for the results, or name of the result file of a "
+        "single field [default next to each field]")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+        help="number of worker processes [default 1]")
+    parser.add_argument("--columns", default=",".join(("x", "y", "signal",
+        "noise")), help="names of the x, y, signal and noise columns "
+        "[default x,y,signal,noise]")
+    parser.add_argument("--skip-existing", action="store_true",
+        help="skip the fields whose result file exists")
+    parser.add_argument("-q", "--quiet", action="store_true",
+        help="print only errors and the summary")
+    group = parser.add_argument_group("binning options (see bin2d)")
+    group.add_argument("--no-cvt", dest="cvt", action="store_false",
+        help="do not run the CVT")
+    group.add_argument("--wvt", action="store_true",
+        help="weighted Voronoi tessellation")
+    group.add_argument("--pixelsize", type=float, default=False,
+        help="pixel scale [default estimated]")
+    group.add_argument("--tol", type=float, default=0.,
+        help="tolerance of the CVT [default 0]")
+    group.add_argument("--maxiter", type=int,
+        help="maximum number of CVT iterations")
+    group.add_argument("--maxtime", type=float,
+        help="wall-time budget of the CVT in seconds")
+    group.add_argument("--prebin", type=float, default=False,
+        help="bin superpixels of S/N up to this fraction of the target "
+        "(e.g. 0.3)")
+    group.add_argument("--sample", type=float,
+        help="approximate binning of a subsample of this fraction")
+    group.add_argument("--float32", dest="dtype", action="store_const",
+        const=np.float32, default=float,
+        help="single-precision signal and noise")
+    args = parser.parse_args(argv)
+
+    names = tuple(args.columns.split(","))
+    if len(names) != 4:
+        parser.error("--columns needs 4 names")
+    if not args.inputs and not args.manifest:
+        parser.error("no fields given")
+    single = args.output is not None and args.output.endswith(".npz")
+    if single and (len(args.inputs) != 1 or args.manifest
+        or os.path.isdir(args.inputs[0])):
+        parser.error("--output must be a directory for many fields")
+    if args.output is not None and not single:
+        os.makedirs(args.output, exist_ok=True)
+    options = dict(cvt=args.cvt, wvt=args.wvt, pixelsize=args.pixelsize,
+        tol=args.tol, maxiter=args.maxiter, maxtime=args.maxtime,
+        prebin=args.prebin, sample=args.sample, dtype=args.dtype)
+
+    nfield = nfailed = npix = 0
+    results = {}
+
+    def tasks():
+        # fields whose result would overwrite that of another field fail
+        nonlocal nfield, nfailed
+        for filename in fields(args.inputs, args.manifest):
+            if single:
+                output = args.output
+            else:
+                output = result_name(filename, args.output)
+            key = os.path.abspath(output)
+            if key in results:
+                nfield += 1
+                nfailed += 1
+                print("{:}: failed: its result {:} is that of {:}".format(
+                    filename, output, results[key]), file=sys.stderr,
+                    flush=True)
+                continue
+            results[key] = filename
+            if args.skip_existing and os.path.exists(output): continue
+            yield filename, output, args.targetsn, names, options
+
+    start = time.perf_counter()
+    for task, output, error in run(tasks(), args.processes):
+        nfield += 1
+        if error is not None:
+            nfailed += 1
+            print("{:}: failed: {:}".format(task[0], error), file=sys.stderr,
+                flush=True)
+            continue
+        npix += output[0]
+        if not args.quiet:
+            print("{:}: {:} pixels, {:} bins, read {:.3f} s, bin {:.3f} s, "
+                "write {:.3f} s".format(task[0], *output), flush=True)
+    elapsed = time.perf_counter() - start
+    print("{:} fields ({:} failed), {:} pixels in {:.3f} s: {:.2f} fields/s, "
+        "{:.0f} pixels/s".format(nfield, nfailed, npix, elapsed,
+        nfield/elapsed, npix/elapsed), flush=True)
+
+    return 1 if nfailed else 0
+
+
+def fields(inputs, manifests=()):
+
+    """
+    Yields the names of the field files given, lazily: the files in inputs,
+    the files in the directories in inputs (with the extensions of fields,
+    leaving out results, in order of name), then the files listed in the
+    manifests, one per line (blank lines and lines starting with # are
+    left out; "-" reads the list from standard input).
+
+    INPUTS
+      inputs : names of files or directories
+
+    OPTIONS
+      manifests : names of manifest files
+    """
+
+    for name in inputs:
+        if not os.path.isdir(name):
+            yield name
+            continue
+        for entry in sorted(os.listdir(name)):
+            if entry.endswith(extensions) and not entry.endswith(suffix):
+                yield os.path.join(name, entry)
+
+    for manifest in manifests:
+        f = sys.stdin if manifest == "-" else open(manifest)
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"): yield line
+        finally:
+            if f is not sys.stdin: f.close()
+
+
+def result_name(filename, directory=None):
+
+    """
+    Name of the result file of a field: that of the field with its extension
+    replaced by .bins.npz, in directory if given.
+
+    INPUTS
+      filename : name of the field file
+
+    OPTIONS
+      directory : directory of the result [default that of the field]
+    """
+
+    name = os.path.splitext(filename)[0] + suffix
+    if directory is not None: name = os.path.join(directory,
+        os.path.basename(name))
+
+    return name
+
+
+def bin_file(filename, output, targetsn, names, options):
+
+    """
+    Reads a field, bins it and writes the result.  Returns the number of
+    pixels and bins and the times taken to read, bin and write.
+
+    INPUTS
+      filename : name of the field file (see read_pixels)
+      output   : name of the result file
+      targetsn : target S/N
+      names    : names of the x, y, signal and noise columns
+      options  : options of bin2d
+    """
+
+    t0 = time.perf_counter()
+    x, y, signal, noise = read_pixels(filename, names)
+    t1 = time.perf_counter()
+    result = bin2d(x, y, signal, noise, targetsn, quiet=True, graphs=False,
+        **options)
+    if result is None:
+        raise ValueError("not binned (see the message above)")
+    t2 = time.perf_counter()
+    result.save(output)
+    t3 = time.perf_counter()
+
+    return len(x), result.nbin, t1-t0, t2-t1, t3-t2
+
+
+def run(tasks, processes=1):
+
+    """
+    Runs bin_file on tasks and yields (task, output, error) for each as soon
+    as it is done, where output is that of bin_file (None if it failed) and
+    error the exception raised (None if it did not).  With more than one
+    process, the tasks run on a pool of worker processes (see run_in_pool).
+
+    INPUTS
+      tasks : iterable of the arguments of bin_file
+
+    OPTIONS
+      processes : number of worker processes [default 1, no pool]
+    """
+
+    if processes <= 1:
+        for task in tasks:
+            try:
+                output = bin_file(*task)
+            except Exception as error:
+                yield task, None, error
+            else:
+                yield task, output, None
+        return
+
+    yield from run_in_pool(bin_file, ((task, task) for task in tasks),
+        processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,17 +4,58 @@
 # - converted from IDL code by Michele Cappellari (bin2d_cvt_equal_mass)
 # -----------------------------------------------------------------------------
 
+import time
 import numpy as np
-from .weighted_centroid import weighted_centroid
+from .events import listener, CVTIteration
+from .bin_statistics import bin_centroids, bin_sn
+from .voronoi_tessellation import voronoi_tessellation, update_tessellation
+from .raster_tessellation import raster_tessellation
+from .pixel_data import PixelData
 
 
-def cvt_equal_mass(x, y, signal, noise, xnode, ynode, quiet=True, wvt=False):
+def cvt_equal_mass(x, y, signal, noise, xnode, ynode, quiet=True, wvt=False,
+    maxmem=2**26, tol=0., maxiter=None, maxtime=None, relax=1.,
+    incremental=False, diagnostics=False, image=None, callback=None,
+    weights=None, checkpoint=None, state=None, data=None):
     
     """
     Modified Lloyd algorithm -- section 4.1 of Cappellari & Copin (2003).
     When the keyword wvt is set, the routine includes the modification
     proposed by Diehl & Statler (2006).
     
+    The generators xnode, ynode are updated in place.  By default the
+    iterations stop when the generators no longer move at all; tol, maxiter
+    and maxtime stop them earlier.  With relax > 1 the generators are moved
+    past the bin centroids (over-relaxed Lloyd) while the tessellation is
+    still changing; once it settles, or if the generators start moving more
+    rather than less, the iterations finish with plain Lloyd steps until
+    the generators stop moving.  The result is a converged tessellation,
+    but a different one from that of relax=1 (with relax=1.5, 93 pixels of
+    example_input.dat are binned differently by the CVT, 85 by the WVT),
+    and it is not reliably reached in fewer iterations (there, 13 CVT and
+    12 WVT iterations rather than 18 and 13, but 16 and 16 with
+    relax=1.8).  With
+    incremental set, each tessellation after the first only recomputes the
+    pixels near generators that moved or changed scale, which gives the same
+    result at a cost proportional to the region that changed.  With image
+    set, the pixels are those of an image and the tessellations with equal
+    scales are computed by raster_tessellation, which is faster on large
+    images but may assign a few pixels on the bin borders differently.
+    
+    Returns the bin scale and the iteration count (plus one), and when
+    diagnostics is set also a dictionary of per-iteration arrays:
+      diff : sum of the squared motions of the generators
+      nbin : number of nonzero bins
+      time : wall time of the iteration in seconds
+    and the reason the iterations stopped ("converged", "tol", "maxiter" or
+    "maxtime") under "stop".
+    
+    With checkpoint set, the state of the iterations is passed to it after
+    every iteration that is not the last, as a dictionary of the generators
+    and everything else the next iteration uses; passing that dictionary
+    back as state continues the iterations exactly where they were, with
+    xnode and ynode as first given.
+    
     INPUTS
       x      : x-coordinates of pixels
       y      : y-coordinates of pixels
@@ -24,53 +65,169 @@ def cvt_equal_mass(x, y, signal, noise, xnode, ynode, quiet=True, wvt=False):
       ynode  : y-coordinates of bins
     
     OPTIONS
-      quiet  : suppress output [default True]
-      wvt    : use modification of Diehl & Statler (2006) [default False]
+      quiet   : suppress output [default True]
+      wvt     : use modification of Diehl & Statler (2006) [default False]
+      maxmem  : memory limit in bytes for the temporary arrays of the
+                tessellation [default 64 MB]
+      tol     : stop when the rms motion of the generators is below tol times
+                their typical separation [default 0, i.e. no motion at all]
+      maxiter : maximum number of iterations [default no limit]
+      maxtime : wall-time budget in seconds of all the iterations
+                together, not of each one: stop after the iteration at
+                which the total time exceeds it, as the time of a run is
+                what needs a bound, while that of an iteration is set by
+                the size of the field [default no limit]
+      relax   : over-relaxation factor, between 1 and 2; other than 1, it
+                gives a different tessellation (see above) [default 1]
+      incremental : only recompute the tessellation near generators that
+                changed [default False]
+      diagnostics : also return per-iteration diagnostics [default False]
+      image   : (row, col) of the pixels in an image, where x=col and y=row,
+                to use raster_tessellation [default None]
+      callback : function called with a CVTIteration event (see
+                voronoi.events) after every iteration
+      weights : number of pixels that each pixel stands for, e.g. for
+                superpixels, with their summed signal and noise
+                [default 1 for all pixels]
+      checkpoint : function called with the state of the iterations after
+                every iteration but the last, e.g. a Checkpoint
+      state   : state of interrupted iterations, as given to checkpoint, to
+                continue from [default None]
+      data    : PixelData of the pixels, to re-use its density and squared
+                noise; signal and noise are then taken from it
     """
     
     
+    if data is None: data = PixelData(signal, noise)
+    signal = data.signal
+    noise2 = data.noise2
     clas = np.zeros(len(signal))   # see beginning of section 4.1 of CC03
     if wvt: dens = np.ones(len(signal))
-    else: dens = signal**2/noise**2
+    else: dens = data.density
+    if weights is not None:
+        # a pixel standing for several pixels has their mean density
+        if not wvt: dens = dens/weights
+    mass = np.square(dens, dtype=float)     # in double precision
+    if weights is not None: mass *= weights
     scale = 1                   # start with the same scale length for all bins
     sn = np.zeros(len(xnode))
     
+    # typical separation of the generators, for the relative tolerance
+    spacing = np.hypot(np.ptp(x), np.ptp(y))/np.sqrt(len(xnode))
+    
+    history = {"diff": [], "nbin": [], "time": [], "stop": "converged"}
+    start = time.time()
+    omega = relax
+    clasold = None
+    radius = None
+    listen = listener(quiet, callback)
+    
     iters = 1
     diff = 1
+    if state is not None:
+        # continue interrupted iterations
+        xnode[:] = state["xnode"]
+        ynode[:] = state["ynode"]
+        scale = state["scale"]
+        sn[:] = state["sn"]
+        iters = state["iters"]
+        diff = state["diff"]
+        omega = state["omega"]
+        clasold = state["clasold"]
+        radius = state.get("radius")
+        xtess = state["xtess"]
+        ytess = state["ytess"]
+        stess = state["stess"]
+        for key in ["diff", "nbin", "time"]:
+            history[key] = list(state["history_"+key])
+        start = time.time() - state["elapsed"]
+    
     while diff!=0:
         
+        tick = time.time()
         xold = xnode.copy()
         yold = ynode.copy()
         
         # computes (weighted) voronoi tessellation of the pixels grid
-        for j in range(len(signal)):
-            index = (((x[j]-xnode)/scale)**2+((y[j]-ynode)/scale)**2).argmin()
-            clas[j] = index
+        if incremental and clasold is not None:
+            changed = (xnode != xtess) | (ynode != ytess) \
+                | (np.broadcast_to(scale, xnode.shape) != stess)
+            clas, radius = update_tessellation(x, y, xnode, ynode, scale,
+                clasold, changed, maxmem=maxmem, radius=radius)
+        elif image is not None and np.ndim(scale) == 0:
+            clas = raster_tessellation(image[0], image[1], xnode, ynode,
+                maxmem=maxmem)
+        else:
+            clas = voronoi_tessellation(x, y, xnode, ynode, scale,
+                maxmem=maxmem)
+        xtess = xold
+        ytess = yold
+        stess = np.broadcast_to(scale, xnode.shape)
         
         # Computes centroids of the bins, weighted by dens^2.
         # Exponent 2 on the density produces equal-mass Voronoi bins.
         # The geometric centroids are computed if /wvt keyword is set.
         
-        area, lim = np.histogram(clas, bins=int(clas.ptp())+1,
-            range=(clas.min()-0.5, clas.max()+0.5))
-        cent = (lim[:-1]+lim[1:])/2
+        area, xbar, ybar = bin_centroids(clas, x, y, mass, xnode.size)
+        if weights is not None:
+            area = np.bincount(clas, weights=weights, minlength=xnode.size)
         
         nonzero = np.where(area>0)[0]       # check for zero-size voronoi bins
-        for j in range(len(nonzero)):
-            k = nonzero[j]                  # only loop over nonzero bins
-            pix = clas==cent[k]
-            xnode[k], ynode[k] = weighted_centroid(x[pix],y[pix],dens[pix]**2)
-            sn[k] = signal[pix].sum()/np.sqrt((noise[pix]**2).sum())
+        if omega != 1 and np.array_equal(clas, clasold):
+            omega = 1                       # finish with plain steps
+        if omega == 1:
+            xnode[nonzero] = xbar[nonzero]  # only update nonzero bins
+            ynode[nonzero] = ybar[nonzero]
+        else:
+            xnode[nonzero] += omega*(xbar[nonzero]-xnode[nonzero])
+            ynode[nonzero] += omega*(ybar[nonzero]-ynode[nonzero])
+        sn[nonzero] = bin_sn(clas, signal, None, xnode.size,
+            noise2)[nonzero]
+        clasold = clas
         
         if wvt: scale = np.sqrt(area/sn)    # eq 4 of Diehl & Statler (2006)
+        diffold = diff
         diff = ((xnode-xold)**2 + (ynode-yold)**2).sum()
         iters = iters + 1
         
-        if not quiet:
-            print("  iteration: {:}  difference: {:}".format(iters, diff))
+        # over-relaxation is only kept while it makes progress
+        if iters > 2 and diff > diffold: omega = 1
+        
+        history["diff"].append(diff)
+        history["nbin"].append(nonzero.size)
+        history["time"].append(time.time()-tick)
+        
+        if listen is not None:
+            listen(CVTIteration(time.time(), iters-1, diff, nonzero.size,
+                source=(xnode, ynode, nonzero)))
+        
+        if diff == 0: break
+        if np.sqrt(diff/len(xnode)) <= tol*spacing:
+            history["stop"] = "tol"
+            break
+        if maxiter is not None and iters-1 >= maxiter:
+            history["stop"] = "maxiter"
+            break
+        if maxtime is not None and time.time()-start >= maxtime:
+            history["stop"] = "maxtime"
+            break
+        
+        if checkpoint is not None:
+            saved = dict(xnode=xnode, ynode=ynode, scale=scale, sn=sn,
+                iters=iters, diff=diff, omega=omega, clasold=clasold,
+                xtess=xtess, ytess=ytess, stess=stess,
+                history_diff=history["diff"], history_nbin=history["nbin"],
+                history_time=history["time"], elapsed=time.time()-start)
+            if radius is not None: saved["radius"] = radius
+            checkpoint(saved)
     
     # only return the generators of the nonzero voronoi bins
     xnode = xnode[nonzero]
     ynode = ynode[nonzero]
     
+    if diagnostics:
+        for key in ["diff", "nbin", "time"]:
+            history[key] = np.array(history[key])
+        return scale, iters, history
+    
     return scale, iters
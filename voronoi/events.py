@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.EVENTS
+# -----------------------------------------------------------------------------
+
+import time
+import tracemalloc
+from collections import namedtuple
+
+
+# Events sent by bin2d and its stages to a callback, each with the time it
+# happened (time.time()) as its first field.  The stages are "prebin" or
+# "sample" (only with those options of bin2d), "accretion", "reassign",
+# "cvt" and "quantities"; info holds the results of a stage: npix, the
+# number of superpixels or pixels drawn, for "prebin" and "sample", nbin
+# for the others, the generators of the initial bins (xnode, ynode) for
+# "reassign", and iterations and stop (as in the cvt_equal_mass
+# diagnostics) for "cvt".  The generators after every CVT iteration are
+# given by the nodes() method of CVTIteration.
+StageStart = namedtuple("StageStart", "time stage")
+StageEnd = namedtuple("StageEnd", "time stage elapsed info")
+AccretionProgress = namedtuple("AccretionProgress", "time bin maxnum")
+Summary = namedtuple("Summary", "time nbin npix unbinned scatter")
+
+
+class CVTIteration(namedtuple("CVTIteration", "time iteration diff nbin")):
+
+    """
+    Event sent after every CVT iteration.  Its nodes() method returns the
+    generators (xnode, ynode) of the nonzero bins after the iteration, so
+    that the events also give the binning as it progresses; they are only
+    copied when nodes() is first called, which must be done by the
+    callback itself, before the CVT carries on and moves them.
+
+    INPUTS
+      time, iteration, diff, nbin : fields of the event
+
+    OPTIONS
+      source : the arrays (xnode, ynode, nonzero) of cvt_equal_mass, from
+               which nodes() takes the generators [default None, no nodes]
+    """
+
+    def __new__(cls, time, iteration, diff, nbin, source=None):
+        event = super(CVTIteration, cls).__new__(cls, time, iteration, diff,
+            nbin)
+        event._source = source
+        event._nodes = None
+        return event
+
+    def nodes(self):
+
+        """
+        Returns copies of the generators (xnode, ynode) of the nonzero bins
+        after the iteration, or None if the event has none.
+        """
+
+        if self._nodes is None and self._source is not None:
+            xnode, ynode, nonzero = self._source
+            self._nodes = xnode[nonzero], ynode[nonzero]
+            self._source = None
+        return self._nodes
+
+
+def listener(quiet, callback):
+
+    """
+    Returns the function to send the events to: callback, print_event if
+    quiet is not set, both, or None if there is nothing to send them to (the
+    events are then not even made).
+
+    INPUTS
+      quiet    : suppress printed output
+      callback : function called with every event, or None
+    """
+
+    if quiet: return callback
+    if callback is None: return print_event
+    return Broadcast([print_event, callback])
+
+
+def stage_start(listen, stage):
+
+    """
+    Sends a StageStart event to listen (unless it is None) and returns the
+    start time of the stage, for stage_end.
+
+    INPUTS
+      listen : function to send the event to, or None
+      stage  : name of the stage
+    """
+
+    start = time.time()
+    if listen is not None: listen(StageStart(start, stage))
+    return start
+
+
+def stage_end(listen, stage, start, **info):
+
+    """
+    Sends a StageEnd event to listen (unless it is None), with the time
+    elapsed since start and the results of the stage given as keywords.
+
+    INPUTS
+      listen : function to send the event to, or None
+      stage  : name of the stage
+      start  : start time of the stage, from stage_start
+    """
+
+    if listen is None: return
+    end = time.time()
+    listen(StageEnd(end, stage, end-start, info))
+
+
+def print_event(event):
+
+    """
+    Prints an event as the printed output of bin2d.
+
+    INPUTS
+      event : event to print
+    """
+
+    if isinstance(event, AccretionProgress):
+        print("  bin: {:} / {:}".format(event.bin, event.maxnum))
+    elif isinstance(event, CVTIteration):
+        # numbered from 2, as the iteration count returned by cvt_equal_mass
+        print("  iteration: {:}  difference: {:}".format(event.iteration+1,
+            event.diff))
+    elif isinstance(event, StageStart):
+        print({"prebin": "Superpixels...",
+            "sample": "Subsample...",
+            "accretion": "Bin-accretion...",
+            "reassign": "Reassign bad bins...",
+            "cvt": "Modified Lloyd algorithm...",
+            "quantities": "Recompute bin properties..."}[event.stage])
+    elif isinstance(event, StageEnd):
+        if event.stage == "prebin":
+            print("{:} superpixels\n".format(event.info["npix"]))
+        elif event.stage == "sample":
+            print("{:} pixels drawn\n".format(event.info["npix"]))
+        elif event.stage == "accretion":
+            print("{:} initial bins\n".format(event.info["nbin"]))
+        elif event.stage == "reassign":
+            print("{:} good bins\n".format(event.info["nbin"]))
+        elif event.stage == "cvt":
+            print("  iterations: {:} ({:})".format(event.info["iterations"],
+                event.info["stop"]))
+            print("  time: {:.2f} s".format(event.elapsed))
+    elif isinstance(event, Summary):
+        print("Unbinned pixels: {:} / {:}".format(event.unbinned, event.npix))
+        print("Fractional S/N scatter (%):", event.scatter)
+
+
+class Broadcast(object):
+
+    """
+    Sends every event to several callbacks in turn.
+
+    INPUTS
+      callbacks : list of functions called with every event
+    """
+
+    def __init__(self, callbacks):
+        self.callbacks = list(callbacks)
+
+    def __call__(self, event):
+        for callback in self.callbacks:
+            callback(event)
+
+
+class Profiler(object):
+
+    """
+    Callback that profiles bin2d: pass it as the callback of bin2d, then
+    report() gives, for every stage, the number of times it ran, its total
+    wall time and (with memory set) the peak memory allocated while it ran,
+    together with the number of bins accreted, the number of CVT iterations
+    and the final summary.  The same Profiler can be used for several runs,
+    whose figures add up.
+
+    OPTIONS
+      memory : trace the memory allocations of the stages with tracemalloc,
+               which slows them down [default False]
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        self.bins = 0
+        self.iterations = 0
+        self.summary = None
+        self._tracing = False
+
+    def __call__(self, event):
+
+        if isinstance(event, AccretionProgress):
+            self.bins += 1
+        elif isinstance(event, CVTIteration):
+            self.iterations += 1
+        elif isinstance(event, StageStart):
+            if self.memory:
+                self._tracing = not tracemalloc.is_tracing()
+                if self._tracing: tracemalloc.start()
+                tracemalloc.reset_peak()
+                self._before = tracemalloc.get_traced_memory()[0]
+        elif isinstance(event, StageEnd):
+            stage = self.stages.setdefault(event.stage, dict(calls=0,
+                time=0., peak_mb=None))
+            stage["calls"] += 1
+            stage["time"] += event.elapsed
+            if self.memory and tracemalloc.is_tracing():
+                peak = (tracemalloc.get_traced_memory()[1]-self._before)/2**20
+                stage["peak_mb"] = max(stage["peak_mb"] or 0., peak)
+                if self._tracing: tracemalloc.stop()
+        elif isinstance(event, Summary):
+            self.summary = event._asdict()
+
+    def report(self):
+
+        """
+        Returns the figures collected so far as a dictionary: "stages" maps
+        every stage to its calls, time (s) and peak_mb (None without
+        memory), and "bins", "iterations" and "summary" hold the number of
+        bins accreted, the number of CVT iterations and the last Summary
+        event (as a dictionary).
+        """
+
+        return dict(stages={k: dict(v) for k, v in self.stages.items()},
+            bins=self.bins, iterations=self.iterations, summary=self.summary)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.GRID_INDEX
+# -----------------------------------------------------------------------------
+
+import copy
+from heapq import heappush, heappop
+from math import sqrt
+import numpy as np
+
+
+class GridIndex(object):
+
+    """
+    Spatial index of a set of pixels that supports deletion, used to find
+    the nearest remaining (e.g. unbinned) pixel to an arbitrary point.
+
+    The pixels are hashed onto a uniform grid of square cells, and a pyramid
+    of cell occupancy counts (each level merging 2x2 cells of the level
+    below) is kept up to date as pixels are removed.  Nearest-neighbour
+    queries are best-first searches down the pyramid that skip empty
+    regions entirely, so their cost does not depend on how many pixels have
+    already been removed.
+
+    Distances are computed exactly as (x-x0)**2 + (y-y0)**2 and ties are
+    broken in favour of the lowest pixel index, so a query returns the same
+    pixel as an argmin over the remaining pixels in index order.
+
+    INPUTS
+      x        : x-coordinates of pixels
+      y        : y-coordinates of pixels
+      cellsize : size of the grid cells
+    """
+
+
+    def __init__(self, x, y, cellsize):
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.n = x.size
+        if self.n == 0:
+            raise ValueError("cannot build a GridIndex from zero pixels")
+
+        # do not let the grid grow much larger than the number of pixels
+        # (e.g. sparse pixels with a small cellsize)
+        self.xmin = x.min()
+        self.ymin = y.min()
+        xrange = np.ptp(x)
+        yrange = np.ptp(y)
+        cellsize = float(cellsize)
+        if not cellsize > 0:
+            cellsize = max(xrange, yrange, 1.)
+        while (xrange/cellsize+1)*(yrange/cellsize+1) > 16*self.n + 16:
+            cellsize *= 2.
+        self.cellsize = cellsize
+
+        # slack on the cell bounds to absorb rounding in the hashing
+        self.slack = 1e-9*cellsize + 1e-12*max(abs(x).max(), abs(y).max())
+
+        ix = np.floor((x-self.xmin)/cellsize).astype(int)
+        iy = np.floor((y-self.ymin)/cellsize).astype(int)
+        nx = int(ix.max()) + 1
+        ny = int(iy.max()) + 1
+
+        # number of levels needed to reach a single cell at the top
+        self.top = max(int(nx-1).bit_length(), int(ny-1).bit_length())
+        self.nx = [nx]
+        self.ny = [ny]
+        for l in range(self.top):
+            self.nx.append((self.nx[-1]+1)//2)
+            self.ny.append((self.ny[-1]+1)//2)
+
+        # pixels sorted by leaf cell (and by index within a cell), so that
+        # the pixels of a row of cells are contiguous
+        cell = iy*nx + ix
+        self.order = np.argsort(cell, kind="stable")
+        self.start = np.searchsorted(cell[self.order], np.arange(nx*ny+1))
+        self.position = np.empty(self.n, dtype=int)
+        self.position[self.order] = np.arange(self.n)
+        self.alive = np.ones(self.n, dtype=bool)
+        self.xo = x[self.order]
+        self.yo = y[self.order]
+
+        # pixels in each leaf cell, as lists for the pyramid search
+        order = self.order.tolist()
+        start = self.start.tolist()
+        self.leaves = [order[start[c]:start[c+1]] for c in range(nx*ny)]
+
+        # occupancy counts at every level of the pyramid
+        self.counts = []
+        for l in range(self.top+1):
+            cl = (iy >> l)*self.nx[l] + (ix >> l)
+            self.counts.append(np.bincount(cl,
+                minlength=self.nx[l]*self.ny[l]).tolist())
+
+        # largest block of leaf cells to scan before falling back to the
+        # pyramid search
+        self.maxblock = 4096
+
+        self.ix = ix.tolist()
+        self.iy = iy.tolist()
+        self.x = x.tolist()
+        self.y = y.tolist()
+
+
+    def __len__(self):
+        return self.n
+
+
+    def copy(self):
+
+        """
+        Returns an independent copy of the index, so that pixels can be
+        removed from it without changing this one.
+        """
+
+        new = copy.copy(self)
+        new.leaves = [leaf[:] for leaf in self.leaves]
+        new.counts = [counts[:] for counts in self.counts]
+        new.alive = self.alive.copy()
+
+        return new
+
+
+    def remove(self, k):
+
+        """
+        Removes pixel k from the index.
+
+        INPUTS
+          k : index of the pixel to remove
+        """
+
+        ix = self.ix[k]
+        iy = self.iy[k]
+        self.leaves[iy*self.nx[0]+ix].remove(k)
+        self.alive[self.position[k]] = False
+        for l in range(self.top+1):
+            self.counts[l][(iy >> l)*self.nx[l] + (ix >> l)] -= 1
+        self.n -= 1
+
+
+    def nearest(self, x0, y0):
+
+        """
+        Returns the index of the remaining pixel closest to (x0, y0), or -1
+        if no pixels remain.
+
+        INPUTS
+          x0 : x-coordinate of query point
+          y0 : y-coordinate of query point
+        """
+
+        return self.nearest_tie(x0, y0, 0.)[0]
+
+
+    def nearest_tie(self, x0, y0, tol):
+
+        """
+        Returns the index of the remaining pixel closest to (x0, y0) (-1 if
+        no pixels remain), and whether another remaining pixel is within tol
+        of being as close, i.e. whether an error of tol/2 in the query point
+        could change the answer.
+
+        INPUTS
+          x0  : x-coordinate of query point
+          y0  : y-coordinate of query point
+          tol : tolerance on the distance
+        """
+
+        if self.n == 0: return -1, False
+
+        x0 = float(x0)
+        y0 = float(y0)
+        h = self.cellsize
+        slack = self.slack
+        best = second = float("inf")
+        kbest = -1
+
+        # most queries have a remaining pixel close by: scan growing blocks
+        # of leaf cells around the one containing the query point, until no
+        # cell outside the block can hold a pixel within reach (the squared
+        # distance of the closest pixel, plus the tolerance)
+        ci = int((y0-self.ymin)//h)
+        cj = int((x0-self.xmin)//h)
+        if 0 <= ci < self.ny[0] and 0 <= cj < self.nx[0]:
+
+            # the 3x3 cells around the query point are cheaper to scan one by
+            # one than as a block
+            nx = self.nx[0]
+            for i in range(max(ci-1, 0), min(ci+1, self.ny[0]-1)+1):
+                for j in range(max(cj-1, 0), min(cj+1, nx-1)+1):
+                    leaf = self.leaves[i*nx+j]
+                    if leaf:
+                        best, second, kbest = self._scan(leaf, x0, y0, best,
+                            second, kbest)
+            reach = best if not tol else (sqrt(best)+tol)**2
+            if reach < (h-slack)**2: return kbest, second <= reach
+
+            r = 2 if kbest < 0 else int(sqrt(reach)/h) + 2
+            while (2*r+1)**2 <= self.maxblock:
+                kbest, best, second = self._block(ci, cj, r, x0, y0, tol)
+                reach = best if not tol else (sqrt(best)+tol)**2
+                if reach < (r*h-slack)**2: return kbest, second <= reach
+                if kbest < 0: r *= 2
+                else: r = int(sqrt(reach)/h) + 2
+
+        # otherwise do a best-first search down the pyramid, which skips
+        # large empty regions
+        nx = self.nx[0]
+        reach = best if not tol else (sqrt(best)+tol)**2
+        heap = [(0., self.top, 0, 0)]
+        while heap:
+
+            bound, l, i, j = heappop(heap)
+            if bound > reach: break
+
+            # leaf cell: test its pixels directly
+            if l == 0:
+                best, second, kbest = self._scan(self.leaves[i*nx+j], x0, y0,
+                    best, second, kbest)
+                reach = best if not tol else (sqrt(best)+tol)**2
+                continue
+
+            # otherwise queue the non-empty child cells
+            l -= 1
+            size = h*(1 << l)
+            nxl = self.nx[l]
+            counts = self.counts[l]
+            for ci in (2*i, 2*i+1):
+                if ci >= self.ny[l]: continue
+                ylo = self.ymin + ci*size - slack
+                yhi = ylo + size + 2*slack
+                if y0 < ylo: dy = ylo - y0
+                elif y0 > yhi: dy = y0 - yhi
+                else: dy = 0.
+                for cj in (2*j, 2*j+1):
+                    if cj >= nxl or counts[ci*nxl+cj] == 0: continue
+                    xlo = self.xmin + cj*size - slack
+                    xhi = xlo + size + 2*slack
+                    if x0 < xlo: dx = xlo - x0
+                    elif x0 > xhi: dx = x0 - xhi
+                    else: dx = 0.
+                    d = dx*dx + dy*dy
+                    if d <= reach: heappush(heap, (d, l, ci, cj))
+
+        return kbest, second <= reach
+
+
+    def _block(self, ci, cj, r, x0, y0, tie=False):
+
+        # closest remaining pixel in the block of leaf cells within r cells
+        # of cell (ci, cj), its squared distance and, if tie, that of the
+        # next closest pixel (ties go to the lower pixel index)
+        nx = self.nx[0]
+        jlo = max(cj-r, 0)
+        jhi = min(cj+r, nx-1)
+        rows = np.arange(max(ci-r, 0), min(ci+r, self.ny[0]-1)+1)*nx
+        start = self.start[rows+jlo]
+        length = self.start[rows+jhi+1] - start
+        pos = np.arange(length.sum()) \
+            + np.repeat(start - length.cumsum() + length, length)
+        pos = pos[self.alive[pos]]
+        if pos.size == 0: return -1, float("inf"), float("inf")
+
+        d = (self.xo[pos]-x0)**2 + (self.yo[pos]-y0)**2
+        best = d.min()
+        second = np.partition(d, 1)[1] if tie and d.size > 1 else float("inf")
+
+        return int(self.order[pos[d == best]].min()), float(best), \
+            float(second)
+
+
+    def _scan(self, leaf, x0, y0, best, second, kbest):
+
+        # closest pixel of a leaf cell, or the current best if it is closer
+        # (ties go to the lower pixel index), and the squared distance of the
+        # next closest pixel (the cell may have been scanned before)
+        xs = self.x
+        ys = self.y
+        for k in leaf:
+            dx = xs[k] - x0
+            dy = ys[k] - y0
+            d = dx*dx + dy*dy
+            if d < best or (d == best and k < kbest):
+                second = best
+                best = d
+                kbest = k
+            elif d < second and k != kbest:
+                second = d
+
+        return best, second, kbest
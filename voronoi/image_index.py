@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.IMAGE_INDEX
+# -----------------------------------------------------------------------------
+
+from math import sqrt, floor, ceil
+import numpy as np
+
+
+class ImageIndex(object):
+
+    """
+    Spatial index of pixels on a regular grid that supports deletion, used
+    like GridIndex to find the nearest remaining pixel to a point, but
+    working directly on 2D images of the grid: a map from grid position to
+    pixel and a mask of the remaining pixels.
+
+    A query scans the window of the mask around the query point that is
+    just large enough to hold the nearest pixel, starting from the distance
+    found by the previous query (the bin accretion asks for the nearest
+    remaining pixel to a slowly moving bin centroid).  When the window would
+    be large, the occupancy counts of square blocks of the grid are used
+    instead to visit only the blocks that can hold a closer pixel.
+
+    Distances are computed exactly as (x-x0)**2 + (y-y0)**2 from the pixel
+    coordinates, which may deviate slightly from the grid, and ties are
+    broken in favour of the lowest pixel index, so a query returns the same
+    pixel as GridIndex.nearest.
+
+    INPUTS
+      x    : x-coordinates of pixels
+      y    : y-coordinates of pixels
+      grid : output of regular_grid(x, y)
+    """
+
+
+    def __init__(self, x, y, grid):
+
+        col, row, dx, dy, ex, ey = grid
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.n = self.x.size
+        if self.n == 0:
+            raise ValueError("cannot build an ImageIndex from zero pixels")
+        self.xmin = self.x.min()
+        self.ymin = self.y.min()
+        self.dx = dx
+        self.dy = dy
+        self.ex = ex
+        self.ey = ey
+
+        # pixel at each grid position (-1 if none), and the mask of the
+        # remaining pixels
+        self.pixel = np.full((row.max()+1, col.max()+1), -1, dtype=np.intp)
+        self.pixel[row, col] = np.arange(self.n)
+        self.free = self.pixel >= 0
+        self.i = row.tolist()
+        self.j = col.tolist()
+
+        # pixels sorted by block of block x block grid positions, and the
+        # number of remaining pixels in each block
+        self.block = 16
+        nbj = col.max()//self.block + 1
+        b = (row//self.block)*nbj + col//self.block
+        self.order = np.argsort(b, kind="stable")
+        self.start = np.searchsorted(b[self.order],
+            np.arange(b.max()//nbj*nbj + nbj + 1))
+        self.counts = np.bincount(b, minlength=self.start.size-1).reshape(
+            -1, nbj)
+        self.row = row
+        self.col = col
+
+        # largest window to scan before using the blocks, and the search
+        # radius of the next query
+        self.maxwindow = 1024
+        self.radius = 2*max(dx, dy)
+
+
+    def __len__(self):
+        return self.n
+
+
+    def copy(self):
+
+        """
+        Returns an independent copy of the index, so that pixels can be
+        removed from it without changing this one.
+        """
+
+        new = ImageIndex.__new__(ImageIndex)
+        new.__dict__.update(self.__dict__)
+        new.free = self.free.copy()
+        new.counts = self.counts.copy()
+
+        return new
+
+
+    def remove(self, k):
+
+        """
+        Removes pixel k from the index.
+
+        INPUTS
+          k : index of the pixel to remove
+        """
+
+        i = self.i[k]
+        j = self.j[k]
+        self.free[i,j] = False
+        self.counts[i//self.block, j//self.block] -= 1
+        self.n -= 1
+
+
+    def nearest(self, x0, y0):
+
+        """
+        Returns the index of the remaining pixel closest to (x0, y0), or -1
+        if no pixels remain.
+
+        INPUTS
+          x0 : x-coordinate of query point
+          y0 : y-coordinate of query point
+        """
+
+        return self.nearest_tie(x0, y0, 0.)[0]
+
+
+    def nearest_tie(self, x0, y0, tol):
+
+        """
+        Returns the index of the remaining pixel closest to (x0, y0) (-1 if
+        no pixels remain), and whether another remaining pixel is within tol
+        of being as close, as GridIndex.nearest_tie.
+
+        INPUTS
+          x0  : x-coordinate of query point
+          y0  : y-coordinate of query point
+          tol : tolerance on the distance
+        """
+
+        if self.n == 0: return -1, False
+
+        x0 = float(x0)
+        y0 = float(y0)
+        rho = self.radius
+        small = 2*max(self.dx, self.dy)
+        while True:
+
+            # every pixel within rho of the query point is in the window (the
+            # window is one grid step wider to absorb deviations from the
+            # grid)
+            i0, i1 = self._range(y0, rho, self.ymin, self.dy, 0)
+            j0, j1 = self._range(x0, rho, self.xmin, self.dx, 1)
+            if (i1-i0)*(j1-j0) > self.maxwindow:
+                if rho > small and self.radius > small:
+                    # the radius of the previous query may be far too large
+                    rho = self.radius = small
+                    continue
+                return self._blocks(x0, y0, tol)
+
+            # the window must hold every pixel within reach: the squared
+            # distance of the closest pixel, plus the tolerance
+            k, best, tied = self._window(i0, i1, j0, j1, x0, y0, tol)
+            reach = best if not tol else (sqrt(best)+tol)**2
+            if k >= 0 and reach <= rho*rho:
+                self.radius = sqrt(best) + 2*max(self.dx, self.dy)
+                return k, tied
+            rho = 2*rho if k < 0 else sqrt(reach)*(1+1e-9)
+
+
+    def _range(self, c0, rho, cmin, step, axis):
+        lo = max(int(floor((c0-rho-cmin)/step)) - 1, 0)
+        hi = min(int(ceil((c0+rho-cmin)/step)) + 2, self.free.shape[axis])
+        return lo, max(hi, lo)
+
+
+    def _window(self, i0, i1, j0, j1, x0, y0, tol=0.):
+
+        # closest remaining pixel in rows i0:i1 and columns j0:j1 of the
+        # grid (ties go to the lower pixel index), its squared distance, and
+        # whether another pixel is within tol of being as close
+        k = self.pixel[i0:i1,j0:j1][self.free[i0:i1,j0:j1]]
+        if k.size == 0: return -1, float("inf"), False
+
+        d = (self.x[k]-x0)**2 + (self.y[k]-y0)**2
+        best = d.min()
+
+        return int(k[d == best].min()), float(best), \
+            self._tied(d, best, tol)
+
+
+    def _blocks(self, x0, y0, tol):
+
+        # the nearest block with remaining pixels gives an upper bound on the
+        # distance of the nearest pixel; all the blocks within that bound
+        # are then searched at once
+        bi, bj = np.nonzero(self.counts)
+        b = self.block
+        xlo = self.xmin + (bj*b - 0.5)*self.dx - self.ex
+        xhi = self.xmin + ((bj+1)*b - 0.5)*self.dx + self.ex
+        ylo = self.ymin + (bi*b - 0.5)*self.dy - self.ey
+        yhi = self.ymin + ((bi+1)*b - 0.5)*self.dy + self.ey
+        bound = np.maximum(np.maximum(xlo-x0, x0-xhi), 0)**2 \
+            + np.maximum(np.maximum(ylo-y0, y0-yhi), 0)**2
+        first = bound.argmin()
+        i = bi[first]*b
+        j = bj[first]*b
+        best = self._window(i, i+b, j, j+b, x0, y0)[1]
+
+        # remaining pixels of the blocks within reach of that bound
+        reach = best if not tol else (sqrt(best)+tol)**2
+        near = (bi*self.counts.shape[1] + bj)[bound <= reach*(1+1e-9)]
+        start = self.start[near]
+        length = self.start[near+1] - start
+        k = self.order[np.arange(length.sum())
+            + np.repeat(start - length.cumsum() + length, length)]
+        k = k[self.free[self.row[k], self.col[k]]]
+        d = (self.x[k]-x0)**2 + (self.y[k]-y0)**2
+        best = d.min()
+        self.radius = sqrt(best) + 2*max(self.dx, self.dy)
+
+        return int(k[d == best].min()), self._tied(d, best, tol)
+
+
+    def _tied(self, d, best, tol):
+
+        # whether more than one of the squared distances d is within reach
+        # of the smallest, best
+        if not tol: return False
+        return int(np.count_nonzero(d <= (sqrt(best)+tol)**2)) > 1
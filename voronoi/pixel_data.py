@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PIXEL_DATA
+# -----------------------------------------------------------------------------
+
+import numpy as np
+
+
+class PixelData(object):
+
+    """
+    Signal and noise of a set of pixels, with the per-pixel arrays that the
+    binning derives from them -- S/N, noise**2 and the CVT density
+    signal**2/noise**2 -- each computed on first use and then shared by all
+    the stages (see the data options of accretion, cvt_equal_mass and
+    bin_quantities).
+
+    The inputs are not copied when they are already arrays of the floating
+    type used, e.g. memory-mapped arrays or the columns of a table, and
+    they are never changed: zero noise (as with X-ray data, where
+    noise=sqrt(signal)) is replaced by 1e-9 times the smallest nonzero
+    noise in a copy, made only if there is zero noise.
+
+    With dtype float32, the signal and noise are held (converted if need
+    be) and the derived arrays computed in single precision, which halves
+    their memory; the sums over the pixels of a bin are still made in
+    double precision.  The binning then differs from that in double
+    precision only where a decision is within rounding (about 1e-7,
+    relative) of a tie: a bin whose S/N with a candidate pixel is that
+    close to being as near the target as without it, or bins whose
+    centroids are that close to moving a pixel to another bin.  Such a
+    difference is carried on by the later stages, so it can move other
+    pixels too, but it is rare: on the example and on synthetic fields of
+    up to 2e4 pixels, with or without the WVT, no pixel changed bin.
+
+    INPUTS
+      signal : signal in pixels
+      noise  : noise in pixels
+
+    OPTIONS
+      dtype : floating type of the arrays [default float64]
+    """
+
+
+    def __init__(self, signal, noise, dtype=np.float64):
+
+        self.dtype = np.dtype(dtype)
+        self.signal = np.asarray(signal, dtype=self.dtype)
+        noise = np.asarray(noise, dtype=self.dtype)
+        zero = noise == 0
+        if zero.any():
+            noise = np.where(zero, noise[noise > 0].min()*1e-9, noise)
+        self.noise = noise
+        self._sn = None
+        self._noise2 = None
+        self._density = None
+
+
+    def __len__(self):
+        return self.signal.size
+
+
+    @property
+    def sn(self):
+        """S/N of the pixels"""
+        if self._sn is None:
+            self._sn = self.signal/self.noise
+        return self._sn
+
+
+    @property
+    def noise2(self):
+        """squared noise of the pixels"""
+        if self._noise2 is None:
+            self._noise2 = self.noise**2
+        return self._noise2
+
+
+    @property
+    def density(self):
+        """density of the CVT, signal**2/noise**2"""
+        if self._density is None:
+            self._density = self.signal**2/self.noise2
+        return self._density
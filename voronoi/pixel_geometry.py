@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PIXEL_GEOMETRY
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.spatial import cKDTree
+from .grid_index import GridIndex
+from .image_index import ImageIndex
+from .pixel_size import pixel_size, regular_grid
+
+
+class PixelGeometry(object):
+
+    """
+    Geometry of a set of pixels that does not depend on their signal: the
+    pixel size, regular-grid detection, a KD-tree of the pixels, the graph of
+    neighbouring pixels and the spatial index used by the bin accretion.
+
+    Everything is computed on first use and then cached, so a PixelGeometry
+    built once for a detector footprint can be passed to bin2d (and to
+    accretion) for every binning of that footprint.  It can be pickled, e.g.
+    to send it to worker processes; the spatial index and KD-tree are then
+    rebuilt on first use at the other end, while the pixel size, grid and
+    neighbour graph travel with it.
+
+    INPUTS
+      x : x-coordinates of pixels
+      y : y-coordinates of pixels
+
+    OPTIONS
+      pixelsize  : pixel scale of the pixels, if known; otherwise it is
+                   estimated from the pixel coordinates
+      neighbours : graph of neighbouring pixels as CSR arrays (see the
+                   neighbours property), if the pixels are connected in
+                   some other way than by distance, e.g. superpixels of
+                   different sizes
+    """
+
+
+    def __init__(self, x, y, pixelsize=False, neighbours=None):
+
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        if self.y.shape != self.x.shape:
+            raise ValueError("x and y must have the same size")
+        self._pixelsize = pixelsize or None
+        self._grid = False
+        self._tree = None
+        self._neighbours = neighbours
+        self._index = None
+
+
+    def __len__(self):
+        return self.x.size
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tree"] = None
+        state["_index"] = None
+        return state
+
+
+    @property
+    def pixelsize(self):
+        """smallest distance between two pixels (unless given)"""
+        if self._pixelsize is None:
+            self._pixelsize = pixel_size(self.x, self.y, tree=self.tree)
+        return self._pixelsize
+
+
+    @property
+    def grid(self):
+        """output of regular_grid(): None unless the pixels are on a grid"""
+        if self._grid is False:
+            self._grid = regular_grid(self.x, self.y)
+        return self._grid
+
+
+    @property
+    def tree(self):
+        """KD-tree of the pixels"""
+        if self._tree is None:
+            self._tree = cKDTree(np.column_stack([self.x, self.y]))
+        return self._tree
+
+
+    @property
+    def neighbours(self):
+        """
+        pixels within 1.2 pixel sizes of each other, i.e. connected in the
+        sense of the bin accretion, as CSR arrays (indptr, indices): the
+        neighbours of pixel k are indices[indptr[k]:indptr[k+1]]
+        """
+        if self._neighbours is None:
+            self._neighbours = self._neighbour_graph(1.2*self.pixelsize)
+        return self._neighbours
+
+
+    def index(self):
+
+        """
+        Returns a fresh spatial index of all the pixels, from which pixels
+        can be removed (as the bin accretion does) without affecting later
+        calls: an ImageIndex for pixels on a regular grid, a GridIndex
+        otherwise.
+        """
+
+        if self._index is None:
+            if self.grid is not None:
+                self._index = ImageIndex(self.x, self.y, self.grid)
+            else:
+                self._index = GridIndex(self.x, self.y, 2*self.pixelsize)
+        return self._index.copy()
+
+
+    def _neighbour_graph(self, radius):
+
+        # candidate pairs from fixed offsets on a regular grid, otherwise
+        # from the KD-tree, then the exact test used by the bin accretion:
+        # sqrt((x1-x2)**2 + (y1-y2)**2) <= radius
+        x = self.x
+        y = self.y
+        if self.grid is not None:
+            i, j = self._grid_pairs(radius)
+        else:
+            pairs = self.tree.query_pairs(radius*(1+1e-9),
+                output_type="ndarray")
+            i, j = pairs[:,0], pairs[:,1]
+        keep = np.sqrt((x[i]-x[j])**2 + (y[i]-y[j])**2) <= radius
+        i, j = np.concatenate([i[keep], j[keep]]), np.concatenate([j[keep],
+            i[keep]])
+
+        order = np.lexsort((j, i))
+        indptr = np.searchsorted(i[order], np.arange(x.size+1))
+
+        return indptr, j[order]
+
+
+    def _grid_pairs(self, radius):
+
+        # pairs of pixels at grid offsets (di, dj) that can be within radius
+        # of each other, given the deviations of the pixels from the grid
+        col, row, dx, dy, ex, ey = self.grid
+        lookup = np.full((row.max()+1, col.max()+1), -1)
+        lookup[row, col] = np.arange(col.size)
+        mi = int(radius//(dy-2*ey)) + 1
+        mj = int(radius//(dx-2*ex)) + 1
+        i = []
+        j = []
+        for di in range(0, mi+1):
+            for dj in range(-mj, mj+1):
+                if di == 0 and dj <= 0: continue
+                if np.hypot(max(di*dy-2*ey, 0), max(abs(dj)*dx-2*ex, 0)) \
+                    > radius*(1+1e-9): continue
+                ok = (row+di < lookup.shape[0]) & (col+dj >= 0) \
+                    & (col+dj < lookup.shape[1])
+                p = np.where(ok)[0]
+                q = lookup[row[p]+di, col[p]+dj]
+                i.append(p[q >= 0])
+                j.append(q[q >= 0])
+        i = np.concatenate(i) if i else np.zeros(0, dtype=int)
+        j = np.concatenate(j) if j else np.zeros(0, dtype=int)
+
+        return i, j
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PIXEL_IO
+# -----------------------------------------------------------------------------
+
+import zipfile
+import numpy as np
+
+
+columns = ("x", "y", "signal", "noise")
+
+
+def read_pixels(filename, names=columns, mmap=True):
+
+    """
+    Reads the pixels of a field from a file and returns their x, y, signal
+    and noise arrays, as inputs of bin2d.  The format is chosen from the
+    extension of the file:
+
+      .npy : a structured array with fields named as in names, or a 2-d
+             array with one column per quantity, in the order of names (or
+             one row per quantity, if it has 4 rows and not 4 columns);
+      .npz : arrays named as in names, or a single 2-d array as for .npy;
+      other: whitespace-separated columns of text (see read_table), like
+             example_input.dat.
+
+    .npy and uncompressed .npz files are memory-mapped, so that the arrays
+    are read from the file as bin2d uses them, and not copied if they are
+    of floating type.
+
+    INPUTS
+      filename : name of the file
+
+    OPTIONS
+      names : names of the x, y, signal and noise columns or arrays
+              [default ("x", "y", "signal", "noise")]
+      mmap  : memory-map binary files rather than read them [default True]
+    """
+
+    if filename.endswith(".npy"):
+        arrays = np.load(filename, mmap_mode="r" if mmap else None)
+    elif filename.endswith(".npz"):
+        arrays = None
+        if mmap:
+            try:
+                arrays = mmap_npz(filename)
+            except ValueError:
+                pass
+        if arrays is None:
+            with np.load(filename) as data:
+                arrays = {key: data[key] for key in data.files}
+        if len(arrays) == 1 and not set(names) & set(arrays):
+            arrays = list(arrays.values())[0]
+    else:
+        arrays = read_table(filename, names)
+
+    if isinstance(arrays, dict):
+        missing = [name for name in names if name not in arrays]
+        if missing:
+            raise ValueError("{:} has no {:} array".format(filename,
+                ", ".join(missing)))
+        return tuple(arrays[name] for name in names)
+    if arrays.dtype.names is not None:
+        return tuple(arrays[name] for name in names)
+    if arrays.ndim != 2:
+        raise ValueError("{:} does not hold a 2-d array".format(filename))
+    if arrays.shape[0] == len(names) and arrays.shape[1] != len(names):
+        return tuple(arrays)
+    if arrays.shape[1] < len(names):
+        raise ValueError("{:} has {:} columns, not {:}".format(filename,
+            arrays.shape[1], len(names)))
+    return tuple(arrays[:,i] for i in range(len(names)))
+
+
+def read_table(filename, names=columns):
+
+    """
+    Reads columns of whitespace-separated numbers from a text file, with
+    the vectorised parser of numpy, and returns the columns in names as a
+    dictionary of arrays.  Lines starting with # are comments; the columns
+    are named by the first line if it is a comment (as in example_input.dat,
+    "#  x  y  signal  noise"), otherwise the first columns are taken, in the
+    order of names.
+
+    INPUTS
+      filename : name of the file
+
+    OPTIONS
+      names : names of the columns to read
+              [default ("x", "y", "signal", "noise")]
+    """
+
+    with open(filename) as f:
+        first = f.readline()
+    header = first.lstrip("#").split() if first.startswith("#") else []
+    if set(names) <= set(header):
+        usecols = [header.index(name) for name in names]
+    else:
+        usecols = list(range(len(names)))
+    data = np.loadtxt(filename, usecols=usecols, ndmin=2).T.copy()
+
+    return dict(zip(names, data))
+
+
+def mmap_npz(filename):
+
+    """
+    Memory-maps the arrays of an uncompressed .npz file, e.g. one written by
+    BinningResult.save: each member is a .npy file stored as is in the zip
+    archive, whose data are mapped in place.  Returns a dictionary of the
+    arrays.  Raises ValueError if the file is compressed.
+
+    INPUTS
+      filename : name of the file
+    """
+
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("cannot memory-map a compressed .npz file")
+            # the data follow the local header of the member: 30 bytes plus
+            # the name and extra field of the local header
+            f.seek(info.header_offset + 26)
+            n, m = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(n) + int(m))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran, dtype = header
+            name = info.filename[:-4] if info.filename.endswith(".npy") \
+                else info.filename
+            if len(shape) == 0 or 0 in shape:
+                # nothing worth mapping
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize*int(
+                    np.prod(shape))), dtype=dtype).reshape(shape)
+                continue
+            arrays[name] = np.memmap(filename, dtype=dtype, mode="r",
+                offset=f.tell(), shape=shape, order="F" if fortran else "C")
+
+    return arrays
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PIXEL_SIZE
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def regular_grid(x, y, tolerance=0.1):
+
+    """
+    Detects whether the pixels lie on a regular rectangular grid (not
+    necessarily filled), allowing each coordinate to deviate from its grid
+    position by up to tolerance times the grid step.
+
+    Returns None if the pixels are not on a regular grid, otherwise a tuple
+    (col, row, dx, dy, ex, ey) with the integer column and row of each
+    pixel, the grid steps along x and y, and the largest deviations of the
+    pixels from their grid positions along x and y.
+
+    INPUTS
+      x : x-coordinates of pixels
+      y : y-coordinates of pixels
+
+    OPTIONS
+      tolerance : allowed deviation from the grid, in grid steps [default 0.1]
+    """
+
+
+    grid = []
+    for c in (x, y):
+
+        # the step is the smallest of the large gaps between sorted
+        # coordinates (small gaps are pixels of the same row or column)
+        gap = np.diff(np.sort(c))
+        if gap.size == 0 or gap.max() <= 0: return None
+        step = gap[gap > 0.25*gap.max()].min()
+
+        # refine the step over the whole extent of the field
+        index = np.round((c-c.min())/step).astype(int)
+        step = (c.max()-c.min())/index.max()
+        index = np.round((c-c.min())/step).astype(int)
+        error = np.abs(c - c.min() - index*step).max()
+        if error > tolerance*step: return None
+        grid.extend([index, step, error])
+
+    col, dx, ex, row, dy, ey = grid
+
+    # every pixel must have a grid position of its own
+    if np.unique(row*(col.max()+1) + col).size != x.size: return None
+
+    return col, row, dx, dy, ex, ey
+
+
+def pixel_size(x, y, tree=None):
+
+    """
+    Estimates the pixel size as the smallest distance between any two pixels.
+
+    Regular grids are detected from the coordinates, and the neighbouring
+    pixels along rows and columns are compared directly.  Otherwise the
+    nearest neighbour of every pixel is found with a KD-tree.  In both cases
+    the distances are computed as sqrt((x1-x2)**2 + (y1-y2)**2), so the
+    result is the same as a brute-force search over all pairs of pixels.
+
+    INPUTS
+      x    : x-coordinates of pixels
+      y    : y-coordinates of pixels
+
+    OPTIONS
+      tree : KD-tree of the pixels, if already built
+    """
+
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size < 2:
+        raise ValueError("at least two pixels are needed for the pixel size")
+
+    grid = regular_grid(x, y)
+    if grid is not None:
+
+        col, row, dx, dy, ex, ey = grid
+        ncol = col.max() + 1
+
+        # map from grid position to pixel
+        lookup = np.full((row.max()+1)*ncol, -1)
+        lookup[row*ncol + col] = np.arange(x.size)
+
+        # distances between neighbours along rows and along columns
+        d2 = []
+        for di, dj in [(0, 1), (1, 0)]:
+            p = np.where((row+di <= row.max()) & (col+dj < ncol))[0]
+            q = lookup[(row[p]+di)*ncol + col[p]+dj]
+            p = p[q >= 0]
+            q = q[q >= 0]
+            d2.append((x[p]-x[q])**2 + (y[p]-y[q])**2)
+        d2 = np.concatenate(d2)
+
+        # any other pair is at least this far apart, so if a row or column
+        # neighbour is closer we have the global minimum
+        far = min(np.hypot(dx-2*ex, dy-2*ey), 2*(dx-ex), 2*(dy-ey))
+        if d2.size > 0 and np.sqrt(d2.min()) < far*(1-1e-9):
+            return np.sqrt(d2.min())
+
+    # irregular pixels: nearest neighbours from a KD-tree, with the distances
+    # recomputed so that they agree with the brute-force estimate
+    k = min(3, x.size)
+    if tree is None: tree = cKDTree(np.column_stack([x, y]))
+    index = tree.query(np.column_stack([x, y]), k=k)[1]
+    pix = np.repeat(np.arange(x.size), k)
+    index = index.ravel()
+    other = index != pix
+    pix, index = pix[other], index[other]
+    d2 = (x[pix]-x[index])**2 + (y[pix]-y[index])**2
+
+    return np.sqrt(d2.min())
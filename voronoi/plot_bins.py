@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PLOT_BINS
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.spatial import cKDTree
+from .pixel_size import pixel_size, regular_grid
+
+
+def label_image(x, y, clas, pixelsize=None):
+
+    """
+    Rasterizes the bin numbers of a set of pixels into an image, for
+    display.  Returns the image (-1 where there is no pixel) and its extent
+    (xmin, xmax, ymin, ymax) in the units of x and y, as used by imshow.
+
+    Pixels on a regular grid fill the image one to one.  Otherwise the
+    image has square cells of side pixelsize, and every cell takes the bin
+    of the nearest pixel within one pixel size of its centre.
+
+    INPUTS
+      x    : x-coordinates of pixels
+      y    : y-coordinates of pixels
+      clas : bin number of each pixel
+
+    OPTIONS
+      pixelsize : pixel scale of the pixels, if known; otherwise it is
+                  estimated from the pixel coordinates
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    clas = np.asarray(clas)
+
+    grid = regular_grid(x, y)
+    if grid is not None:
+        col, row, dx, dy = grid[:4]
+        image = np.full((row.max()+1, col.max()+1), -1, dtype=np.intp)
+        image[row, col] = clas
+    else:
+        dx = dy = pixelsize or pixel_size(x, y)
+        nx = int(round(np.ptp(x)/dx)) + 1
+        ny = int(round(np.ptp(y)/dy)) + 1
+        yc, xc = np.indices((ny, nx))
+        d, k = cKDTree(np.column_stack([x, y])).query(np.column_stack([
+            x.min() + xc.ravel()*dx, y.min() + yc.ravel()*dy]),
+            distance_upper_bound=dx)
+        image = np.where(np.isfinite(d), clas[np.minimum(k, x.size-1)],
+            -1).reshape(ny, nx)
+
+    extent = (x.min()-dx/2, x.min()+(image.shape[1]-0.5)*dx,
+        y.min()-dy/2, y.min()+(image.shape[0]-0.5)*dy)
+
+    return image, extent
+
+
+def plot_bins(x, y, clas, xnode, ynode, sn, area, targetsn, xbar=None,
+    ybar=None, filename="bin2d", format="png", dpi=150, pixelsize=None):
+
+    """
+    Plots the result of bin2d to files, without a display: a map of the bins
+    (filename_map) and the S/N of the bins against radius (filename_sn).
+    Returns the names of the files written.
+
+    The map is drawn as a rasterized image of the bin numbers (see
+    label_image), in random colours, with the generators on top, so its
+    cost hardly depends on the number of pixels.  matplotlib is imported
+    only when this is called, and only its Agg renderer is used, so neither
+    pyplot nor a GUI backend is loaded.
+
+    INPUTS
+      x        : x-coordinates of pixels
+      y        : y-coordinates of pixels
+      clas     : bin number of each pixel
+      xnode    : x-coordinates of bins
+      ynode    : y-coordinates of bins
+      sn       : S/N of bins
+      area     : number of pixels in bins
+      targetsn : target S/N
+
+    OPTIONS
+      xbar, ybar : centroids of the bins, for the radii of the S/N plot
+                   [default xnode, ynode]
+      filename   : start of the names of the files [default "bin2d"]
+      format     : file format, e.g. "png" or "pdf" [default "png"]
+      dpi        : resolution of the files [default 150]
+      pixelsize  : pixel scale of the pixels, if known
+    """
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    if xbar is None: xbar = xnode
+    if ybar is None: ybar = ynode
+    files = []
+
+    # pixel map, in randomized bin colours
+    image, extent = label_image(x, y, clas, pixelsize=pixelsize)
+    rnd = np.random.RandomState(0).rand(xnode.size).argsort()
+    colour = np.ma.masked_less(np.where(image >= 0, rnd[image], -1), 0)
+    fig = Figure(figsize=(4,3))
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(left=0.13, bottom=0.13, top=0.97, right=0.98)
+    ax = fig.add_subplot(111)
+    ax.imshow(colour, origin="lower", extent=extent, interpolation="nearest",
+        aspect="auto", cmap="viridis", rasterized=True)
+    ax.plot(xnode, ynode, "k+", ms=2)
+    ax.tick_params(labelsize=8)
+    ax.set_xlabel("coordinate 1", fontsize=10)
+    ax.set_ylabel("coordinate 2", fontsize=10)
+    files.append("{:}_map.{:}".format(filename, format))
+    fig.savefig(files[-1], dpi=dpi)
+
+    # signal-to-noise profile
+    unb = area==1
+    binned = ~unb
+    rad = np.sqrt(xbar**2 + ybar**2)     # use centroids, NOT generators
+    rmin = max(0., rad.min()-np.ptp(rad)*0.05)
+    rmax = rad.max()+np.ptp(rad)*0.05
+    fig = Figure(figsize=(4,3))
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(left=0.12, bottom=0.13, top=0.97, right=0.97)
+    ax = fig.add_subplot(111)
+    ax.plot([rmin, rmax], np.ones(2)*targetsn, c="k", lw=2, alpha=0.8)
+    ax.scatter(rad[binned], sn[binned], lw=0, c="b", alpha=0.8)
+    if unb.any(): ax.scatter(rad[unb], sn[unb], lw=0, c="r", alpha=0.8)
+    ax.set_xlim(rmin, rmax)
+    ax.set_ylim(0., np.nanmax(sn)*1.05)
+    ax.tick_params(labelsize=8)
+    ax.set_xlabel(r"$R_{\rm bin}$", fontsize=10)
+    ax.set_ylabel(r"$SN_{\rm bin}$", fontsize=10)
+    files.append("{:}_sn.{:}".format(filename, format))
+    fig.savefig(files[-1], dpi=dpi)
+
+    return files
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.PROCESS_POOL
+# -----------------------------------------------------------------------------
+
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+
+def run_in_pool(function, items, processes, release=None):
+
+    """
+    Runs function on a pool of worker processes for every item of items, and
+    yields (context, result, error) for each as soon as it is done, i.e. in
+    order of completion, where result is the return value of function (None
+    if it failed) and error the exception raised (None if it did not).  The
+    items are read from items lazily, with at most two per worker waiting or
+    running at any time, so items can be a generator over many fields on
+    disk.  A failing item does not stop the others.  If a worker process
+    dies, the items then in the pool fail with BrokenProcessPool and a new
+    pool is started for the remaining ones.
+
+    INPUTS
+      function  : function run by the workers, picklable
+      items     : iterable of (args, context): function(*args) is run, and
+                  context, which stays in this process, is yielded with its
+                  result
+      processes : number of worker processes
+
+    OPTIONS
+      release : function called with the context of every item once it is
+                done, or when the pool is closed before it is done, e.g. to
+                free the resources of the item [default None]
+    """
+
+    items = iter(items)
+    pending = {}
+    more = True
+    pool = ProcessPoolExecutor(max_workers=processes)
+
+    try:
+        while more or pending:
+
+            # keep every worker busy, but read the items lazily
+            for args, context in islice(items, 2*processes-len(pending)):
+                try:
+                    future = pool.submit(function, *args)
+                except BrokenProcessPool:
+                    # a worker died: start a new pool for the other items
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=processes)
+                    future = pool.submit(function, *args)
+                pending[future] = context
+            more = len(pending) == 2*processes
+
+            if not pending: break
+            done = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                context = pending.pop(future)
+                if release is not None: release(context)
+                error = future.exception()
+                yield context, None if error else future.result(), error
+
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if release is not None:
+            for context in pending.values(): release(context)
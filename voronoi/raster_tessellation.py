@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.RASTER_TESSELLATION
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+from .voronoi_tessellation import voronoi_tessellation
+
+
+def raster_tessellation(row, col, xnode, ynode, maxmem=2**26):
+
+    """
+    Voronoi tessellation of the pixels of an image, pixel (row, col) being
+    at x=col, y=row, with the same scale for all generators, computed with
+    raster passes over the image instead of distance searches.
+
+    Each generator marks the pixel it falls in, and a Euclidean distance
+    transform of the image gives the nearest marked pixel to every pixel.
+    The generators of the marked pixels found for a pixel and its eight
+    neighbours are then compared with exact distances (ties go to the
+    lowest index), and pixels next to a marked pixel shared by several
+    generators are done exactly.  The result is the Voronoi tessellation
+    except possibly for a few pixels on the borders between bins, where the
+    nearest marked pixel is not the one of the nearest generator.
+
+    INPUTS
+      row   : row of each pixel in the image
+      col   : column of each pixel in the image
+      xnode : x-coordinates of generators
+      ynode : y-coordinates of generators
+
+    OPTIONS
+      maxmem : memory limit in bytes for the exact tessellation of the
+               pixels near shared marks [default 64 MB]
+    """
+
+
+    shape = (row.max()+1, col.max()+1)
+    ri = np.clip(np.round(ynode).astype(int), 0, shape[0]-1)
+    ci = np.clip(np.round(xnode).astype(int), 0, shape[1]-1)
+
+    # mark the pixel of every generator (the lowest index wins a pixel shared
+    # by several generators)
+    label = np.full(shape, -1, dtype=np.intp)
+    label[ri[::-1], ci[::-1]] = np.arange(xnode.size)[::-1]
+    shared = np.zeros(shape, dtype=np.intp)
+    np.add.at(shared, (ri, ci), 1)
+    shared = shared > 1
+
+    # nearest marked pixel to every pixel of the image
+    index = distance_transform_edt(label < 0, return_distances=False,
+        return_indices=True)
+    nearest = label[index[0], index[1]]
+    shared = shared[index[0], index[1]]
+    del index
+
+    # pixels whose eight neighbours have the same nearest mark keep its
+    # generator; otherwise the best of the nine generators is taken
+    h, w = shape
+    padded = np.pad(nearest, 1, mode="edge")
+    shared = np.pad(shared, 1, mode="edge")
+    border = np.zeros(shape, dtype=bool)
+    exact = np.zeros(shape, dtype=bool)
+    for di in (0, 1, 2):
+        for dj in (0, 1, 2):
+            border |= padded[di:di+h,dj:dj+w] != nearest
+            exact |= shared[di:di+h,dj:dj+w]
+    clas = nearest[row, col]
+    exact = exact[row, col]
+    border = np.where(border[row, col])[0]
+    rb = row[border]
+    cb = col[border]
+    x = col.astype(float)
+    y = row.astype(float)
+    xb = x[border]
+    yb = y[border]
+    cl = clas[border]
+    best = (xb-xnode[cl])**2 + (yb-ynode[cl])**2
+    for di in (0, 1, 2):
+        for dj in (0, 1, 2):
+            g = padded[rb+di, cb+dj]
+            d = (xb-xnode[g])**2 + (yb-ynode[g])**2
+            better = (d < best) | ((d == best) & (g < cl))
+            cl = np.where(better, g, cl)
+            best = np.where(better, d, best)
+    clas[border] = cl
+
+    # pixels near a shared mark may belong to a generator not found above
+    exact = np.where(exact)[0]
+    if exact.size > 0:
+        clas[exact] = voronoi_tessellation(x[exact], y[exact], xnode, ynode,
+            1., maxmem=maxmem)
+
+    return clas
@@ -6,55 +6,60 @@
 # -----------------------------------------------------------------------------
 
 from numpy import *
+from .bin_statistics import bin_centroids
+from .voronoi_tessellation import voronoi_tessellation
 
 
-def reassign_bad_bins(x, y, signal, noise, targetsn, clas):
+def reassign_bad_bins(x, y, signal, noise, targetsn, clas, weights=None):
     
     """
     Reassign bad bins -- steps vi-vii of eq 5.1 of Cappellari & Copin (2003)
     
+    All the bad pixels are reassigned at once to the nearest centroid of a
+    good bin (see voronoi_tessellation, which breaks ties as a scan of the
+    centroids would), and the centroids of the bins are then recomputed.
+    If no bin is good, all the pixels are put in a single bin.
+    
+    clas is changed in place: the bad pixels are given the numbers of the
+    bins they are reassigned to.  Pass a copy to keep the labels of the
+    accretion.
+    
     INPUTS
       x        : x-coordinates of pixels
       y        : y-coordinates of pixels
       signal   : signal in pixels
       noise    : noise in pixels
       targetsn : target signal/noise required
-      clas     : bin number for each pixel
+      clas     : bin number for each pixel (0 for unassigned pixels)
+    
+    OPTIONS
+      weights  : number of pixels that each pixel stands for, e.g. for
+                 superpixels, to weight the centroids [default 1]
     """
     
     
-    # get number of pixels in each bin (clas=0 are unassigned pixels)
-    area, lim = histogram(clas, bins=int(clas.ptp()),
-        range=(0.5,clas.max()+0.5))
-    cent = (lim[:-1]+lim[1:])/2.
+    # number of pixels and centroid of each bin (clas=0 are unassigned
+    # pixels)
+    nbin = clas.max() + 1
+    area, xbar, ybar = bin_centroids(clas, x, y, weights, nbin)
     
     # indices of good bins
-    good = where(area > 0)[0]
-    
-    # centroids of good bins
-    xnode = zeros(good.size)
-    ynode = zeros(good.size)
-    for j in range(good.size):
-        p = where(clas == cent[good[j]])
-        xnode[j] = x[p].mean()
-        ynode[j] = y[p].mean()
+    good = where(area[1:] > 0)[0]
+    if good.size == 0:
+        # whole field in one bin, which bin2d has checked reaches the target
+        clas[:] = 1
+        nbin = 2
+        area, xbar, ybar = bin_centroids(clas, x, y, weights, nbin)
+        good = array([0])
     
     # reassign pixels of bins with S/N < targetSN to closest good bin
     bad = where(clas == 0)[0]
-    for j in range(bad.size):
-        index = ((x[bad[j]] - xnode)**2 + (y[bad[j]] - ynode)**2).argmin()
-        clas[bad[j]] = good[index] + 1
-    
-    # recompute all centroids of the reassigned bins
-    # these will be used as starting points for the CVT
-    area, lim = histogram(clas, bins=int(clas.ptp())+1,
-        range=(0.5,clas.max()+0.5))
-    cent = (lim[:-1]+lim[1:])/2.
-    
-    good = where(area > 0)[0]
-    for j in range(good.size):
-        p = where(clas == cent[good[j]])
-        xnode[j] = x[p].mean()
-        ynode[j] = y[p].mean()
-    
-    return xnode, ynode
+    if bad.size > 0:
+        clas[bad] = good[voronoi_tessellation(x[bad], y[bad],
+            xbar[good+1], ybar[good+1], 1.)] + 1
+        
+        # centroids of the reassigned bins, used as starting points for the
+        # CVT
+        area, xbar, ybar = bin_centroids(clas, x, y, weights, nbin)
+    
+    return xbar[good+1], ybar[good+1]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.SUBSAMPLE
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from .pixel_geometry import PixelGeometry
+from .superpixels import merged_neighbours
+
+
+class Subsample(object):
+
+    """
+    Stratified subsample of the pixels, for a quick approximate binning: the
+    accretion and the CVT run on the subsample, and a final bin_quantities
+    assigns every pixel (see the sample option of bin2d).  The field is cut
+    into square blocks of side pixel sizes, side = 1/sqrt(fraction) rounded
+    up, and the pixels of every block are dealt at random into groups, of
+    which one pixel each is kept: a fraction of the pixels of the block,
+    but enough groups that each has S/N below half the target S/N, so that
+    where bins are small, more pixels (or all) are kept.
+
+    A kept pixel stands for the m pixels of its group: its weight is m, and
+    its signal and noise are scaled by m and sqrt(m), so that a bin of kept
+    pixels has about the S/N, area and mass (for the CVT) of the bin of all
+    the pixels they stand for.  Two kept pixels are neighbours if any
+    pixels of their groups are.
+
+    The bins are those of a sparser, noisier field, so their S/N scatters
+    more about the target than with all the pixels; the fraction trades the
+    scatter against the speed.
+
+    INPUTS
+      x        : x-coordinates of pixels
+      y        : y-coordinates of pixels
+      signal   : signal in pixels
+      noise    : noise in pixels
+      targetsn : target S/N of the binning
+
+    OPTIONS
+      fraction  : least fraction of the pixels to keep [default 0.25]
+      seed      : random seed of the draws [default 0]
+      geometry  : PixelGeometry of the pixels, to re-use its pixel size and
+                  neighbour graph; x and y may then be None
+      pixelsize : pixel scale of the pixels, if known
+    """
+
+
+    def __init__(self, x, y, signal, noise, targetsn, fraction=0.25, seed=0,
+        geometry=None, pixelsize=False):
+
+        if geometry is None: geometry = PixelGeometry(x, y, pixelsize)
+        x = geometry.x
+        y = geometry.y
+        pixelsize = geometry.pixelsize
+        side = int(np.ceil(1/np.sqrt(fraction) - 1e-9))
+
+        # block of every pixel, on a grid of the pixel size
+        i = np.floor((x-x.min())/pixelsize + 0.5).astype(np.int64)
+        j = np.floor((y-y.min())/pixelsize + 0.5).astype(np.int64)
+        block = np.unique(((i//side) << 32) + j//side,
+            return_inverse=True)[1].ravel()
+        nblock = block.max() + 1
+        count = np.bincount(block, minlength=nblock)
+        sn = np.bincount(block, weights=signal, minlength=nblock) \
+            / np.sqrt(np.bincount(block, weights=noise**2, minlength=nblock))
+
+        # number of groups of every block
+        ngroup = np.maximum(np.ceil(fraction*count), np.ceil((sn/(0.5
+            *targetsn))**2))
+        ngroup = np.clip(np.nan_to_num(ngroup), 1, count).astype(np.int64)
+
+        # deal the pixels of every block into its groups in a random order;
+        # the first pixel dealt to each group is kept
+        order = np.lexsort((np.random.RandomState(seed).rand(x.size), block))
+        first = np.cumsum(count) - count
+        rank = np.empty(x.size, dtype=np.int64)
+        rank[order] = np.arange(x.size) - first[block[order]]
+        parent = (np.cumsum(ngroup)-ngroup)[block] + rank % ngroup[block]
+        n = ngroup.sum()
+        kept = rank < ngroup[block]
+        index = np.empty(n, dtype=np.int64)
+        index[parent[kept]] = np.where(kept)[0]
+        weight = np.bincount(parent, minlength=n).astype(float)
+        self.parent = parent
+        self.index = index
+        self.weight = weight
+        self.x = x[index]
+        self.y = y[index]
+        self.signal = signal[index]*weight
+        self.noise = noise[index]*np.sqrt(weight)
+        self.geometry = PixelGeometry(self.x, self.y, pixelsize=pixelsize,
+            neighbours=merged_neighbours(geometry.neighbours, parent, n))
+
+
+    def __len__(self):
+        return self.x.size
+
+
+    def expand(self, values):
+
+        """
+        Returns values given for every pixel of the subsample, e.g. their
+        bin numbers, for every pixel, from the kept pixel of its group.
+
+        INPUTS
+          values : array with one value per pixel of the subsample
+        """
+
+        return np.asarray(values)[self.parent]
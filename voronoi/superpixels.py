@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.SUPERPIXELS
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from .pixel_geometry import PixelGeometry
+
+
+class Superpixels(object):
+
+    """
+    Faint pixels merged into superpixels, so that the binning of a field
+    whose outskirts need bins of hundreds of pixels works on far fewer
+    points.  Pixels are merged as a quadtree: at level L the pixels fall in
+    square blocks of 2**L by 2**L pixel sizes, and the pixels of a block
+    become one superpixel if all of them were merged at level L-1 (at level
+    1, if each has S/N below fraction*targetsn) and their combined S/N is
+    below fraction*targetsn.  Blocks at the edge of the field or of a mask
+    may be incomplete.  Bright pixels are left as they are.
+
+    A superpixel has the summed signal of its pixels, their noise added in
+    quadrature, their mean position and a weight, the number of its pixels,
+    which weights the centroids and the areas of the bins that hold it (see
+    the weights options of accretion, reassign_bad_bins and
+    cvt_equal_mass).  Two superpixels are neighbours if any of their pixels
+    are.  Bins of superpixels are turned back into bins of pixels by
+    expand(), or by a final bin_quantities on the pixels (as bin2d does).
+
+    The S/N of the bins, being made of pixels at fraction of the target
+    S/N or less, is nearly as even as with the pixels themselves, but the
+    bin boundaries follow the blocks in the faint parts of the field.
+
+    INPUTS
+      x        : x-coordinates of pixels
+      y        : y-coordinates of pixels
+      signal   : signal in pixels
+      noise    : noise in pixels
+      targetsn : target S/N of the binning
+
+    OPTIONS
+      fraction  : largest S/N of a superpixel, as a fraction of targetsn
+                  [default 0.3]
+      maxlevel  : largest level of the quadtree, i.e. superpixels of at
+                  most 2**maxlevel by 2**maxlevel pixels [default 4]
+      geometry  : PixelGeometry of the pixels, to re-use its pixel size and
+                  neighbour graph; x and y may then be None
+      pixelsize : pixel scale of the pixels, if known
+    """
+
+
+    def __init__(self, x, y, signal, noise, targetsn, fraction=0.3,
+        maxlevel=4, geometry=None, pixelsize=False):
+
+        if geometry is None: geometry = PixelGeometry(x, y, pixelsize)
+        x = geometry.x
+        y = geometry.y
+        pixelsize = geometry.pixelsize
+        limit = fraction*targetsn
+
+        # position of every pixel on a grid of the pixel size
+        i = np.floor((x-x.min())/pixelsize + 0.5).astype(np.int64)
+        j = np.floor((y-y.min())/pixelsize + 0.5).astype(np.int64)
+        noise2 = noise**2
+
+        # level of the largest block each pixel is merged in
+        level = np.zeros(x.size, dtype=np.int64)
+        merged = signal/noise < limit
+        for L in range(1, maxlevel+1):
+            block = np.unique(((i >> L) << 32) + (j >> L),
+                return_inverse=True)[1].ravel()
+            nblock = block.max() + 1
+            complete = np.bincount(block, weights=merged, minlength=nblock) \
+                == np.bincount(block, minlength=nblock)
+            sn = np.bincount(block, weights=signal, minlength=nblock) \
+                / np.sqrt(np.bincount(block, weights=noise2, minlength=nblock))
+            merged = (complete & (sn < limit))[block]
+            if not merged.any(): break
+            level[merged] = L
+
+        # superpixel of every pixel: the block of its level, or the pixel
+        # itself if it was not merged
+        key = np.column_stack([level, np.where(level > 0, i >> level,
+            np.arange(x.size)), np.where(level > 0, j >> level, 0)])
+        parent = np.unique(key, axis=0, return_inverse=True)[1].ravel()
+        n = parent.max() + 1
+        weight = np.bincount(parent, minlength=n).astype(float)
+        self.parent = parent
+        self.weight = weight
+        self.x = np.bincount(parent, weights=x, minlength=n)/weight
+        self.y = np.bincount(parent, weights=y, minlength=n)/weight
+        self.signal = np.bincount(parent, weights=signal, minlength=n)
+        self.noise = np.sqrt(np.bincount(parent, weights=noise2,
+            minlength=n))
+
+        self.geometry = PixelGeometry(self.x, self.y, pixelsize=pixelsize,
+            neighbours=merged_neighbours(geometry.neighbours, parent, n))
+
+
+    def __len__(self):
+        return self.x.size
+
+
+    def expand(self, values):
+
+        """
+        Returns values given for every superpixel, e.g. their bin numbers,
+        for every pixel.
+
+        INPUTS
+          values : array with one value per superpixel
+        """
+
+        return np.asarray(values)[self.parent]
+
+
+def merged_neighbours(neighbours, parent, n):
+
+    """
+    Graph of neighbouring groups of pixels, as CSR arrays (indptr, indices)
+    like PixelGeometry.neighbours: two groups are neighbours if any of
+    their pixels are.
+
+    INPUTS
+      neighbours : graph of neighbouring pixels (indptr, indices)
+      parent     : group of every pixel (0 to n-1)
+      n          : number of groups
+    """
+
+    indptr, indices = neighbours
+    a = np.repeat(parent, np.diff(indptr))
+    b = parent[indices]
+    pairs = np.unique(a[a != b]*n + b[a != b])
+    indptr = np.searchsorted(pairs//n, np.arange(n+1))
+
+    return indptr, pairs % n
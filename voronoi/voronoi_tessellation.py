@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# VORONOI.VORONOI_TESSELLATION
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def voronoi_tessellation(x, y, xnode, ynode, scale, maxmem=2**26):
+
+    """
+    Computes the (weighted) Voronoi tessellation of the pixels, i.e. the
+    index of the generator that minimises
+      ((x-xnode)/scale)**2 + ((y-ynode)/scale)**2
+    for each pixel.  Ties go to the generator with the lowest index.
+
+    With a single scale for all generators the nearest generators are found
+    with a KD-tree.  With one scale per generator (WVT) all the distances are
+    computed, in chunks of pixels that keep the temporary arrays below maxmem
+    bytes.
+
+    INPUTS
+      x      : x-coordinates of pixels
+      y      : y-coordinates of pixels
+      xnode  : x-coordinates of generators
+      ynode  : y-coordinates of generators
+      scale  : scale length of generators (scalar or one per generator)
+
+    OPTIONS
+      maxmem : memory limit for temporary arrays in bytes [default 64 MB]
+    """
+
+
+    if np.ndim(scale) == 0:
+        return _tree_tessellation(x, y, xnode, ynode, scale, maxmem)
+
+    # two temporary float arrays of npix x nnode per chunk, evaluated in place
+    chunk = max(min(int(maxmem//(16*xnode.size)), x.size), 1)
+    dx = np.empty((chunk, xnode.size))
+    dy = np.empty((chunk, xnode.size))
+    clas = np.empty(x.size, dtype=int)
+    for i in range(0, x.size, chunk):
+        n = min(chunk, x.size-i)
+        np.subtract(x[i:i+n,None], xnode, out=dx[:n])
+        np.subtract(y[i:i+n,None], ynode, out=dy[:n])
+        dx[:n] /= scale
+        dy[:n] /= scale
+        dx[:n] *= dx[:n]
+        dy[:n] *= dy[:n]
+        dx[:n] += dy[:n]
+        clas[i:i+n] = dx[:n].argmin(axis=1)
+
+    return clas
+
+
+def _tree_tessellation(x, y, xnode, ynode, scale, maxmem):
+
+    # nearest two generators from a KD-tree; the distances are recomputed
+    # exactly so that ties are broken as in an argmin over all generators
+    k = min(2, xnode.size)
+    pix = np.column_stack([x, y])
+    index = cKDTree(np.column_stack([xnode, ynode])).query(pix, k=k)[1]
+    index = index.reshape(x.size, k)
+    d = ((x[:,None]-xnode[index])/scale)**2 \
+        + ((y[:,None]-ynode[index])/scale)**2
+    best = d.min(axis=1)
+    clas = np.where(d == best[:,None], index, xnode.size).min(axis=1)
+
+    # pixels (nearly) equidistant from the two generators found may have
+    # further generators at the same distance: check those against all
+    if k > 1:
+        tied = np.where(d.max(axis=1) <= best*(1+1e-9))[0]
+        if tied.size > 0:
+            clas[tied] = voronoi_tessellation(x[tied], y[tied], xnode, ynode,
+                np.full(xnode.size, scale, dtype=float), maxmem=maxmem)
+
+    return clas
+
+
+def update_tessellation(x, y, xnode, ynode, scale, clas, changed,
+    maxmem=2**26, radius=None):
+
+    """
+    Updates a (weighted) Voronoi tessellation after some of the generators
+    have moved or changed scale, recomputing only the pixels whose generator
+    may have changed.  The result is identical to voronoi_tessellation().
+
+    A pixel is recomputed if its own generator changed, or if a changed
+    generator is now close enough to steal pixels from its generator: for a
+    bin of radius R (largest distance of its pixels from the generator) and
+    scale s, a generator of scale s' at a distance beyond R*(1+s'/s) cannot
+    be closer to any of its pixels.
+
+    Returns the new tessellation and the radius of every bin in it, which
+    can be passed back as radius to the next update, so that radii are only
+    recomputed for the bins whose pixels were recomputed.  What remains in
+    proportion to all the pixels is a few vectorised passes: selecting the
+    pixels to recompute, copying clas and bounding the coordinates.
+
+    INPUTS
+      x       : x-coordinates of pixels
+      y       : y-coordinates of pixels
+      xnode   : x-coordinates of generators
+      ynode   : y-coordinates of generators
+      scale   : scale length of generators (scalar or one per generator)
+      clas    : tessellation before the change
+      changed : True for the generators that moved or changed scale
+
+    OPTIONS
+      maxmem  : memory limit for temporary arrays in bytes [default 64 MB]
+      radius  : radius of every bin of clas, as returned by the previous
+                update [default None, computed from all the pixels]
+    """
+
+
+    if radius is None:
+        radius = np.zeros(xnode.size)
+        np.maximum.at(radius, clas, np.hypot(x-xnode[clas], y-ynode[clas]))
+    if not changed.any(): return clas, radius
+
+    s = np.broadcast_to(np.asarray(scale, dtype=float), xnode.shape)
+
+    # unchanged bins within reach of a changed generator
+    moved = np.where(changed)[0]
+    reach = cKDTree(np.column_stack([xnode[moved], ynode[moved]])).query(
+        np.column_stack([xnode, ynode]))[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limit = radius*(1 + s[moved].max()/s)
+    slack = 1e-12*(np.abs(x).max() + np.abs(y).max())
+    affected = changed | ~(reach > limit*(1+1e-9) + slack)
+
+    redo = np.where(affected[clas])[0]
+    new = voronoi_tessellation(x[redo], y[redo], xnode, ynode, scale,
+        maxmem=maxmem)
+    clas = clas.copy()
+    clas[redo] = new
+
+    # the pixels of the affected bins are now all among those recomputed,
+    # while the other bins kept theirs and can only have gained some of those
+    radius = np.where(affected, 0., radius)
+    np.maximum.at(radius, new, np.hypot(x[redo]-xnode[new],
+        y[redo]-ynode[new]))
+
+    return clas, radius